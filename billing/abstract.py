@@ -1,17 +1,56 @@
+import time
 from typing import Dict, Any, TYPE_CHECKING
 from abc import ABC, abstractmethod
 
+from billing.constants import CHECKOUT_PENDING_TIMEOUT
+from billing.exceptions import CheckoutPendingError
+from billing.models import Checkout
+from common.constants import PaymentSystem
+
 if TYPE_CHECKING:
     from django.http import HttpRequest
 
 
+# интервал в секундах, с которым повторное нажатие проверяет, выписан ли чекаут первым нажатием
+CHECKOUT_POLL_INTERVAL = 0.2
+
+
 class PaymentSystemClient(ABC):
     """Абстрактный интерфейс, описывающий поведение платёжной системы."""
 
+    system: PaymentSystem
+
     @abstractmethod
     def check_out(self, order_id: int, product_id: int) -> str:
         pass
 
+    @abstractmethod
+    def approve_link(self, tracking_id: str) -> str:
+        """Возвращает ссылку на оплату выписанного чекаута."""
+
+    def resume_check_out(self, order_id: int, product_id: int) -> str:
+        """Возвращает ссылку на оплату заказа: по чекауту, ранее выписанному в этой платёжной системе,
+        без обращения к ней. Если чекаута нет (новый заказ или выписка не удалась), выписывает его.
+
+        Перед обращением к платёжной системе записывается незавершённый чекаут (CheckoutManager.claim_checkout):
+        одновременное нажатие кнопки не выписывает второй чекаут, а ждёт первого до CHECKOUT_PENDING_TIMEOUT
+        секунд. Если за это время выписка не завершилась, вызывает CheckoutPendingError."""
+
+        deadline = time.monotonic() + CHECKOUT_PENDING_TIMEOUT
+        while True:
+            tracking_id = Checkout.objects.get_tracking_id(order_id, self.system)
+            if tracking_id is not None:
+                return self.approve_link(tracking_id)
+            if Checkout.objects.claim_checkout(order_id, self.system):
+                try:
+                    return self.check_out(order_id, product_id)
+                except Exception:
+                    Checkout.objects.release_checkout(order_id, self.system)
+                    raise
+            if time.monotonic() >= deadline:
+                raise CheckoutPendingError(order_id, self.system.name)
+            time.sleep(CHECKOUT_POLL_INTERVAL)
+
     @abstractmethod
     def verify(self, request: 'HttpRequest') -> bool:
         pass
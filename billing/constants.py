@@ -8,10 +8,18 @@ SITE_HTTPS_URL = os.getenv("SITE_HTTPS_URL")
 PAYPAL_CLIENT_ID = os.getenv("PAYPAL_CLIENT_ID")
 PAYPAL_CLIENT_SECRET = os.getenv("PAYPAL_CLIENT_SECRET")
 PAYPAL_WEBHOOK_ID = os.getenv("PAYPAL_WEBHOOK_ID")
+# адрес API вместо песочницы PayPal, например локальная замена для нагрузочных тестов (util.loadtest)
+PAYPAL_API_URL = os.getenv("PAYPAL_API_URL")
 
 STRIPE_PUBLIC_KEY = os.getenv("STRIPE_PUBLIC_KEY")
 STRIPE_SECRET_KEY = os.getenv("STRIPE_SECRET_KEY")
 STRIPE_WHSEC_KEY = os.getenv("STRIPE_WHSEC_KEY")
+# адрес API вместо https://api.stripe.com, например локальная замена для нагрузочных тестов (util.loadtest)
+STRIPE_API_URL = os.getenv("STRIPE_API_URL")
+
+# время в секундах, в течение которого повторное нажатие кнопки оплаты ждёт выписки чекаута, начатой первым нажатием;
+# не завершённая за это время выписка считается прерванной, и чекаут выписывается заново
+CHECKOUT_PENDING_TIMEOUT = float(os.getenv("CHECKOUT_PENDING_TIMEOUT", "15"))
 
 
 class PaypalOrderStatus(Enum):
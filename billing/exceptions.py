@@ -9,3 +9,10 @@ class UpdateCompletedCheckoutError(Exception):
             f'Trying to update a completed checkout #{pk} from: {system}, id: {tracking_id}\n'
             f' with status "{new_status}"'
         )
+
+
+class CheckoutPendingError(Exception):
+    """Возникает, если чекаут заказа выписывается другим обработчиком дольше CHECKOUT_PENDING_TIMEOUT секунд."""
+
+    def __init__(self, order_id: int, system: str) -> None:
+        super().__init__(f'Checkout of order #{order_id} in {system} is still being issued')
@@ -1,14 +1,16 @@
 """Модуль содержит менеджеры моделей платёжных систем."""
 import logging
+from datetime import timedelta
 from typing import Optional, Union, TYPE_CHECKING
 
-from django.db import models
+from django.db import models, transaction
 from django.db.models.query import QuerySet
+from django.utils import timezone
 
 from billing.exceptions import UpdateCompletedCheckoutError
 from shop.models import Order
 from common.constants import OrderStatus, PaymentSystem
-from billing.constants import PaypalOrderStatus
+from billing.constants import CHECKOUT_PENDING_TIMEOUT, PaypalOrderStatus
 
 if TYPE_CHECKING:
     from billing.models import Checkout
@@ -16,6 +18,9 @@ if TYPE_CHECKING:
 
 logger = logging.getLogger('root')
 
+# tracking_id чекаута, выписка которого начата, но платёжная система ещё не ответила
+PENDING_TRACKING_ID = ''
+
 
 class CheckoutManager(models.Manager):
     """Менеджер управляет выписанными Checkout."""
@@ -25,17 +30,56 @@ class CheckoutManager(models.Manager):
                       tracking_id: Union[str, int],
                       order_id: int,
                       payment_status: Optional[str] = None) -> None:
-        """Создаёт чекаут, обновляет статус соответствующего заказа"""
+        """Создаёт чекаут, обновляет статус соответствующего заказа.
+
+        Незавершённый чекаут заказа в этой платёжной системе (см. claim_checkout) дополняется, а не дублируется."""
 
         order = Order.objects.get_order(order_id).first()
         Order.objects.update_order(order_id, OrderStatus.PENDING_PAYMENT.value)
-        checkout = self.create(order=order, system=payment_system.value, tracking_id=tracking_id, status=payment_status)
+        checkout = self.filter(order_id=order_id, system=payment_system.value, tracking_id=PENDING_TRACKING_ID).first()
+        if checkout is None:
+            return self.create(order=order, system=payment_system.value, tracking_id=tracking_id,
+                               status=payment_status)
+        checkout.tracking_id, checkout.status = tracking_id, payment_status
+        checkout.save()
         return checkout
 
+    def claim_checkout(self, order_id: int, payment_system: PaymentSystem) -> bool:
+        """Записывает незавершённый чекаут заказа перед обращением к платёжной системе.
+
+        Возвращает False, если у заказа в этой системе уже есть чекаут: выписанный или незавершённый моложе
+        CHECKOUT_PENDING_TIMEOUT секунд. Более старый незавершённый чекаут считается прерванным и заменяется.
+        Транзакция начинается с записи в строку заказа, поэтому одновременные вызовы для заказа выполняются
+        по очереди (в SQLite транзакция, начатая чтением, не может дождаться блокировки на запись)."""
+
+        now = timezone.now()
+        with transaction.atomic():
+            Order.objects.filter(pk=order_id).update(updated_at=now)
+            checkouts = self.filter(order_id=order_id, system=payment_system.value)
+            if checkouts.exclude(tracking_id=PENDING_TRACKING_ID,
+                                 created_at__lt=now - timedelta(seconds=CHECKOUT_PENDING_TIMEOUT)).exists():
+                return False
+            checkouts.delete()
+            self.create(order_id=order_id, system=payment_system.value, tracking_id=PENDING_TRACKING_ID)
+        return True
+
+    def release_checkout(self, order_id: int, payment_system: PaymentSystem) -> None:
+        """Удаляет незавершённый чекаут заказа после неудачного обращения к платёжной системе."""
+
+        self.filter(order_id=order_id, system=payment_system.value, tracking_id=PENDING_TRACKING_ID).delete()
+
     def get_checkout(self, checkout_id: Union[str, int]) -> QuerySet:
         # ToDo: change return value and everything related
         return self.filter(tracking_id=checkout_id)
 
+    def get_tracking_id(self, order_id: int, payment_system: PaymentSystem) -> Optional[str]:
+        """Возвращает идентификатор последнего выписанного чекаута заказа в платёжной системе,
+        None - если его нет."""
+
+        tracking_id: Optional[str] = self.filter(order_id=order_id, system=payment_system.value).exclude(
+            tracking_id=PENDING_TRACKING_ID).order_by('-created_at').values_list('tracking_id', flat=True).first()
+        return tracking_id
+
     def get_checkout_by_capture(self, capture_id: Union[str, int]) -> QuerySet:
         """Получает чекаут по идентификатору, предназначенному для захвата денежных средств
         на счёт магазина."""
@@ -69,7 +113,10 @@ class CheckoutManager(models.Manager):
 
         Возвращает инстанс чекаута."""
 
-        co_entity = self.get_checkout_by_capture(capture_id).first()
+        co_entity = self.get_checkout_by_capture(capture_id).select_related(
+            'order__chat__bot_user',
+            'order__product',
+        ).first()
 
         if co_entity and co_entity.order.status != OrderStatus.COMPLETE.value:
             # Todo: fix: request.resource.id is not same as the Checkout.tracking_id
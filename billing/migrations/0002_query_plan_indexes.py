@@ -0,0 +1,17 @@
+# Generated by Django 3.1.2 on 2026-10-17 03:15
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('billing', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='checkout',
+            index_together={('tracking_id', 'created_at'), ('capture_id', 'created_at')},
+        ),
+    ]
@@ -35,3 +35,8 @@ class Checkout(TrackableUpdateCreateModel):
         verbose_name_plural = 'Checkouts'
         app_label = 'billing'
         ordering = ['-created_at']
+        # поиск чекаута по идентификаторам платёжной системы с сортировкой по умолчанию
+        index_together = (
+            ('tracking_id', 'created_at'),
+            ('capture_id', 'created_at'),
+        )
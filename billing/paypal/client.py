@@ -3,7 +3,7 @@ from typing import Dict, Any
 
 from django.http import HttpRequest
 
-from paypalcheckoutsdk.core import PayPalHttpClient, SandboxEnvironment
+from paypalcheckoutsdk.core import PayPalEnvironment, PayPalHttpClient, SandboxEnvironment
 from paypalcheckoutsdk.orders import OrdersCreateRequest
 from paypalcheckoutsdk.orders import OrdersCaptureRequest
 from paypalhttp import HttpError
@@ -12,13 +12,14 @@ from paypalrestsdk.notifications import WebhookEvent
 from bot.notify import send_payment_completed
 from shop.models import Product
 from billing.constants import Currency, PaypalIntent, PaypalShippingPreference, PaypalUserAction, PaypalGoodsCategory, \
-    PaypalOrderStatus, PAYPAL_CLIENT_ID, PAYPAL_CLIENT_SECRET, PAYPAL_WEBHOOK_ID
+    PaypalOrderStatus, PAYPAL_API_URL, PAYPAL_CLIENT_ID, PAYPAL_CLIENT_SECRET, PAYPAL_WEBHOOK_ID
 from common.constants import PaymentSystem
 from .paypal_entities import PaypalCheckout
 from billing.abstract import PaymentSystemClient
 from billing.exceptions import UpdateCompletedCheckoutError
 from billing.models import Checkout
 from common.strings import PayPalStrings
+from common.schemas import get_schema, schema_of
 
 
 logger = logging.getLogger('root')
@@ -30,12 +31,17 @@ class PaypalClient(PaymentSystemClient):
     Содержит методы для инициализации сессии и обработки платежей в виде PayPal Checkout -
     выписки, захвата, верификации и завершения Checkout."""
     _link_pattern = PayPalStrings.LINK_PATTERN.value
+    system = PaymentSystem.PAYPAL
 
     def __init__(self) -> None:
         """Инициализирует сессию работы с системой PayPal."""
 
         # Creating an environment
-        environment = SandboxEnvironment(client_id=PAYPAL_CLIENT_ID, client_secret=PAYPAL_CLIENT_SECRET)
+        if PAYPAL_API_URL:
+            environment = PayPalEnvironment(PAYPAL_CLIENT_ID, PAYPAL_CLIENT_SECRET, PAYPAL_API_URL,
+                                            PayPalEnvironment.SANDBOX_WEB_URL)
+        else:
+            environment = SandboxEnvironment(client_id=PAYPAL_CLIENT_ID, client_secret=PAYPAL_CLIENT_SECRET)
         self.client = PayPalHttpClient(environment)
         self.process_notification = {  # todo should this be here?
             PayPalStrings.WEBHOOK_APPROVED.value: self.capture,
@@ -118,11 +124,11 @@ class PaypalClient(PaymentSystemClient):
     def _initiate_payment_system_checkout(self, checkout_data: Dict[str, Any]) -> str:
         """Создаёт чекаут в системе PayPal, возвращает его id."""
 
-        pp_capture = PaypalCheckout.Schema().load(checkout_data)
+        pp_capture = get_schema(PaypalCheckout).load(checkout_data)
 
         request = OrdersCreateRequest()
         request.prefer('return=representation')
-        request.request_body(pp_capture.Schema().dump(pp_capture))
+        request.request_body(schema_of(pp_capture).dump(pp_capture))
 
         tracking_id: str = ''
         try:
@@ -151,29 +157,29 @@ class PaypalClient(PaymentSystemClient):
         """Создаёт Checkout по параметрам заказа, возвращает соответствующий tracking_id."""
 
         # todo create a builder?
-        product = Product.objects.get_product_by_id(product_id)
+        product = Product.objects.get_product_by_id(product_id, ('name', 'description', 'price'))
         checkout_data = {
             'intent': PaypalIntent.CAPTURE,
             'purchase_units': [{
                 'reference_id': str(order_id),
-                'description': product['description'][:127],
+                'description': product.description[:127],
                 'amount': {
                     'currency_code': Currency.RUB,
-                    'value': str(product['price'].amount),
+                    'value': str(product.price.amount),
                     'breakdown': {
                         'item_total': {
                             'currency_code': Currency.RUB,
-                            'value': str(product['price'].amount),
+                            'value': str(product.price.amount),
                         }
                     },
                 },
                 'items': [
                     {
-                        'name': product['name'],
-                        'description': product['description'][:127],
+                        'name': product.name,
+                        'description': product.description[:127],
                         'unit_amount': {
                             'currency_code': Currency.RUB,
-                            'value': str(product['price'].amount),
+                            'value': str(product.price.amount),
                         },
                         'quantity': 1,
                         'category': PaypalGoodsCategory.PHYSICAL_GOODS,
@@ -189,6 +195,7 @@ class PaypalClient(PaymentSystemClient):
         checkout_id = self._initiate_payment_system_checkout(checkout_data)
         Checkout.objects.make_checkout(PaymentSystem.PAYPAL, checkout_id, order_id)
 
-        approve_link = self._link_pattern.format(checkout_id=checkout_id)
+        return self.approve_link(checkout_id)
 
-        return approve_link
+    def approve_link(self, tracking_id: str) -> str:
+        return self._link_pattern.format(checkout_id=tracking_id)
@@ -10,10 +10,11 @@ from billing.stripe.stripe_entities import StripeCheckout
 from bot.notify import send_payment_completed
 from shop.models import Product
 from billing.constants import StripePaymentMethod, StripeCurrency, StripeMode, STRIPE_SECRET_KEY, STRIPE_WHSEC_KEY, \
-    SITE_HTTPS_URL
+    SITE_HTTPS_URL, STRIPE_API_URL
 from common.constants import PaymentSystem
 from billing.abstract import PaymentSystemClient
 from common.strings import StripeStrings
+from common.schemas import get_schema, schema_of
 
 if TYPE_CHECKING:
     from django.http import HttpRequest
@@ -29,26 +30,29 @@ class StripeClient(PaymentSystemClient):
     выписки, захвата, верификации и завершения."""
 
     _link_pattern: str = StripeStrings.LINK_PATTERN.value
+    system = PaymentSystem.STRIPE
 
     def __init__(self) -> None:
         """Инициирует сессию с системой Stripe."""
         self.client = stripe
         self.client.api_key = STRIPE_SECRET_KEY
+        if STRIPE_API_URL:
+            self.client.api_base = STRIPE_API_URL
 
     def check_out(self, order_id: int, product_id: int) -> str:
         """Создаёт Payment по параметрам заказа, возвращает соответствующий checkout_session.id"""
 
-        product = Product.objects.get_product_by_id(product_id)
+        product = Product.objects.get_product_by_id(product_id, ('name', 'description', 'price'))
         checkout_data = {
             'payment_method_types': [StripePaymentMethod.CARD.value],
             'line_items': [
                 {
                     'price_data': {
                         'currency': StripeCurrency.RUB.value,
-                        'unit_amount': product['price'].amount * 100,  # подобрать лучший формат
+                        'unit_amount': product.price.amount * 100,  # подобрать лучший формат
                         'product_data': {
-                            'name': product['name'],
-                            'description': product['description'],
+                            'name': product.name,
+                            'description': product.description,
                         }
                     },
                     'quantity': 1,
@@ -58,13 +62,14 @@ class StripeClient(PaymentSystemClient):
             'success_url': StripeStrings.LINK_SUCCESS.value.format(site=SITE_HTTPS_URL, order_id=order_id),
             'cancel_url': StripeStrings.LINK_CANCEL.value.format(site=SITE_HTTPS_URL, order_id=order_id),
         }
-        stripe_checkout = StripeCheckout.Schema().load(checkout_data)
-        checkout_session = self.client.checkout.Session.create(**stripe_checkout.Schema().dump(stripe_checkout))
+        stripe_checkout = get_schema(StripeCheckout).load(checkout_data)
+        checkout_session = self.client.checkout.Session.create(**schema_of(stripe_checkout).dump(stripe_checkout))
         Checkout.objects.make_checkout(PaymentSystem.STRIPE, checkout_session.id, order_id)
 
-        approve_link = self._link_pattern.format(site=SITE_HTTPS_URL, session=checkout_session.id)
+        return self.approve_link(checkout_session.id)
 
-        return approve_link
+    def approve_link(self, tracking_id: str) -> str:
+        return self._link_pattern.format(site=SITE_HTTPS_URL, session=tracking_id)
 
     def verify(self, request: 'HttpRequest') -> bool:
         """Проверяет соответствие подписи вебхука на случай попытки имитации оповещения.
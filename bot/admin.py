@@ -1,6 +1,6 @@
 from django.contrib import admin
 
-from .models import (Bot, BotUser, Chat, Message)
+from .models import (Bot, BotUser, Chat, Message, OutboxMessage)
 
 
 @admin.register(Bot)
@@ -63,3 +63,12 @@ class MessageAdmin(admin.ModelAdmin):
         'chat_id__exact',
         'bot_user_id__exact',
     )
+
+
+@admin.register(OutboxMessage)
+class OutboxMessageAdmin(admin.ModelAdmin):
+    """Класс с настройками для работы с моделью OutboxMessage в админке Django."""
+
+    readonly_fields = ('created_at', 'updated_at')
+    list_display = ('id', 'bot', 'message', 'status', 'attempts', 'available_at', 'lease_expires_at', 'last_error')
+    list_filter = ('bot', 'status')
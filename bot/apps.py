@@ -1,28 +1,22 @@
 import logging
+import os
+import sys
 from django.apps import AppConfig
-from apscheduler.schedulers.background import BackgroundScheduler
 from pathlib import Path
 from dotenv import load_dotenv
 
-from patterns.singleton import Singleton
-
 
 logger = logging.getLogger('root')
 
 
-class SingletonAPS(metaclass=Singleton):
-    """Класс для хранения и передачи единственного инстанса планировщика.
-
-     Оборачивает инициализированный инстанс BackgroungScheduler в форму Singleton."""
-
-    _sched: BackgroundScheduler = None
-
-    def set_aps(self, aps: BackgroundScheduler) -> None:
-        self._sched = aps
+def _serves_requests() -> bool:
+    """Процесс обслуживает запросы приложения: WSGI-сервер или manage.py runserver (его перезапускаемый
+    дочерний процесс). Остальные команды manage.py - migrate, drain_outbox и т.д. - фоновых потоков не запускают."""
 
-    @property
-    def get_aps(self) -> BackgroundScheduler:
-        return self._sched
+    if os.path.basename(sys.argv[0]) != 'manage.py':
+        return True
+    command = sys.argv[1] if len(sys.argv) > 1 else None
+    return command == 'runserver' and (os.environ.get('RUN_MAIN') == 'true' or '--noreload' in sys.argv)
 
 
 class BotConfig(AppConfig):
@@ -33,8 +27,12 @@ class BotConfig(AppConfig):
         project_folder = Path(__file__).parent.parent.absolute()
         load_dotenv(project_folder.parent.joinpath('.env'))
         logger.info('Environment ready')
-        scheduler = BackgroundScheduler()
-        SingletonAPS().set_aps(scheduler)
-        if not scheduler.running:
-            scheduler.start()
-            logger.info('Scheduler started')
+        # обработчики сигналов импортируют модули с константами из переменных окружения
+        from . import signals  # noqa: F401
+        from .constants import OUTBOX_IN_PROCESS
+        if OUTBOX_IN_PROCESS and _serves_requests():
+            from .outbox import SingletonOutbox
+            # отправитель запускается со стартом процесса: записи, оставшиеся в outbox после перезапуска,
+            # отправляются, не дожидаясь первого исходящего сообщения
+            SingletonOutbox().get_relay
+            logger.info('Outbox relay started')
@@ -0,0 +1,166 @@
+"""Модуль архива сообщений.
+
+Сообщения старше срока хранения (MESSAGE_RETENTION_DAYS) переносятся из таблицы Message в сжатые архивы
+на диске (MESSAGE_ARCHIVE_DIR) командой manage.py archive_messages. Архив разбит по месяцам: файл ГГГГ-ММ.jsonl.gz
+состоит из gzip-фрагментов, каждый фрагмент - сообщения одного чата за один проход архивации в формате JSON Lines.
+Индекс (index.sqlite3) хранит для каждого фрагмента чат, диапазон id и положение в файле,
+поэтому сообщения чата читаются без распаковки всего месяца.
+
+Фрагмент записывается в файл и в индекс до удаления сообщений из базы. Если архивация прервётся между записью
+и удалением, при следующем запуске сообщения будут записаны повторно; при чтении дубликаты отбрасываются."""
+
+import gzip
+import json
+import os
+import sqlite3
+from collections import defaultdict
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from common.constants import OutboxStatus
+from .constants import MESSAGE_ARCHIVE_CHUNK, MESSAGE_ARCHIVE_DIR
+from .models import Message
+
+
+# поля сообщения, сохраняемые в архиве
+FIELDS = tuple(field.attname for field in Message._meta.concrete_fields)
+DATETIME_FIELDS = frozenset(
+    field.attname for field in Message._meta.concrete_fields if field.get_internal_type() == 'DateTimeField'
+)
+
+
+class MessageArchive:
+    """Архив сообщений в каталоге root: файлы месяцев и индекс фрагментов по чатам."""
+
+    def __init__(self, root: str = MESSAGE_ARCHIVE_DIR) -> None:
+        self.root = root
+        self.index_path = os.path.join(root, 'index.sqlite3')
+
+    def _connect(self) -> sqlite3.Connection:
+        os.makedirs(self.root, exist_ok=True)
+        conn = sqlite3.connect(self.index_path, timeout=30.0)
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS segments (chat_id INTEGER, month TEXT NOT NULL, offset INTEGER NOT NULL, '
+            'length INTEGER NOT NULL, first_id INTEGER NOT NULL, last_id INTEGER NOT NULL, count INTEGER NOT NULL)'
+        )
+        conn.execute('CREATE INDEX IF NOT EXISTS segments_chat ON segments (chat_id, last_id)')
+        return conn
+
+    def _month_path(self, month: str) -> str:
+        return os.path.join(self.root, f'{month}.jsonl.gz')
+
+    def archive(self, before: datetime, chunk: int = MESSAGE_ARCHIVE_CHUNK) -> int:
+        """Переносит в архив сообщения, записанные раньше before, пачками по chunk. Возвращает их количество.
+
+        Исходящие сообщения, которые ещё ожидают отправки из outbox, не переносятся."""
+
+        archived = 0
+        conn = self._connect()
+        try:
+            while True:
+                rows = list(
+                    Message.objects.filter(created_at__lt=before)
+                    .exclude(outbox__status__in=(OutboxStatus.PENDING.value, OutboxStatus.SENDING.value))
+                    .order_by('id')
+                    .values(*FIELDS)[:chunk]
+                )
+                if not rows:
+                    return archived
+                self._write(conn, rows)
+                with transaction.atomic():
+                    Message.objects.filter(id__in=[row['id'] for row in rows]).delete()
+                archived += len(rows)
+        finally:
+            conn.close()
+
+    def _write(self, conn: sqlite3.Connection, rows: List[Dict[str, Any]]) -> None:
+        groups: Dict[Tuple[str, Optional[int]], List[Dict[str, Any]]] = defaultdict(list)
+        for row in rows:
+            groups[(row['created_at'].strftime('%Y-%m'), row['chat_id'])].append(row)
+
+        segments = []
+        for (month, chat_id), messages in sorted(groups.items(), key=lambda item: item[0][0]):
+            data = gzip.compress(
+                ''.join(json.dumps(message, cls=DjangoJSONEncoder) + '\n' for message in messages).encode()
+            )
+            with open(self._month_path(month), 'ab') as f:
+                offset = f.seek(0, os.SEEK_END)
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            segments.append((chat_id, month, offset, len(data), messages[0]['id'], messages[-1]['id'], len(messages)))
+        with conn:
+            conn.executemany(
+                'INSERT INTO segments (chat_id, month, offset, length, first_id, last_id, count) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)', segments
+            )
+
+    def _read_segment(self, month: str, offset: int, length: int) -> Iterator[Dict[str, Any]]:
+        with open(self._month_path(month), 'rb') as f:
+            f.seek(offset)
+            data = gzip.decompress(f.read(length))
+        for line in data.decode().splitlines():
+            yield json.loads(line)
+
+    def read_chat(self, chat_id: int, before: Optional[Tuple[datetime, int]] = None,
+                  limit: Optional[int] = None) -> List[Message]:
+        """Возвращает архивные сообщения чата, записанные до сообщения с ключом before (created_at, id):
+        последние limit (все при None), от новых к старым. Сообщения - несохраняемые инстансы Message."""
+
+        if not os.path.exists(self.index_path):
+            return []
+        conn = self._connect()
+        try:
+            segments = conn.execute(
+                'SELECT month, offset, length FROM segments WHERE chat_id = ? AND month <= ? '
+                'ORDER BY month DESC, last_id DESC',
+                (chat_id, self._month(before[0]) if before is not None else '9999-12'),
+            ).fetchall()
+        finally:
+            conn.close()
+
+        records: Dict[int, Message] = {}
+        for month, offset, length in segments:
+            # месяцы идут по убыванию: более ранние месяцы содержат только более старые сообщения
+            if limit is not None and len(records) >= limit:
+                oldest, _ = self._newest(records, limit)[-1]
+                if month < self._month(oldest):
+                    break
+            for record in self._read_segment(month, offset, length):
+                message = self._message(record)
+                if before is None or (message.created_at, message.pk) < before:
+                    records[message.pk] = message
+        return [records[pk] for _, pk in self._newest(records, limit)]
+
+    @staticmethod
+    def _newest(records: Dict[int, Message], limit: Optional[int]) -> List[Tuple[datetime, int]]:
+        return sorted(((message.created_at, pk) for pk, message in records.items()), reverse=True)[:limit]
+
+    @staticmethod
+    def _month(moment: datetime) -> str:
+        return moment.astimezone(timezone.utc).strftime('%Y-%m')
+
+    @staticmethod
+    def _message(record: Dict[str, Any]) -> Message:
+        for name in DATETIME_FIELDS:
+            if record.get(name) is not None:
+                record[name] = parse_datetime(record[name])
+        return Message(**record)
+
+    def stats(self) -> Dict[str, Any]:
+        if not os.path.exists(self.index_path):
+            return {'segments': 0, 'messages': 0, 'months': 0, 'bytes': 0}
+        conn = self._connect()
+        try:
+            segments, messages, months, size = conn.execute(
+                'SELECT COUNT(*), COALESCE(SUM(count), 0), COUNT(DISTINCT month), COALESCE(SUM(length), 0) '
+                'FROM segments'
+            ).fetchone()
+        finally:
+            conn.close()
+        return {'segments': segments, 'messages': messages, 'months': months, 'bytes': size}
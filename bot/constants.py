@@ -0,0 +1,92 @@
+"""Модуль с настройками режимов работы бота, задаваемыми через переменные окружения."""
+
+import os
+
+
+def env_flag(name: str, default: bool = False) -> bool:
+    """Читает логический флаг из переменной окружения (1/true/yes/on)."""
+
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+# Режим "подтвердить, затем обработать": вебхук только разбирается и ставится в очередь
+WEBHOOK_ASYNC = env_flag('WEBHOOK_ASYNC')
+WEBHOOK_QUEUE_SIZE = int(os.getenv('WEBHOOK_QUEUE_SIZE', '1000'))
+WEBHOOK_WORKERS = int(os.getenv('WEBHOOK_WORKERS', '4'))
+# Сколько секунд вебхук ждёт места в очереди своего чата, прежде чем платформе ответят 503
+WEBHOOK_QUEUE_TIMEOUT = float(os.getenv('WEBHOOK_QUEUE_TIMEOUT', '2'))
+
+# Отложенная запись входящих сообщений и активности чатов пачками
+MESSAGE_WRITE_BEHIND = env_flag('MESSAGE_WRITE_BEHIND')
+MESSAGE_BATCH_SIZE = int(os.getenv('MESSAGE_BATCH_SIZE', '100'))
+MESSAGE_FLUSH_INTERVAL = float(os.getenv('MESSAGE_FLUSH_INTERVAL', '1.0'))
+
+# Кэш идентификаторов пользователей и чатов
+IDENTITY_CACHE_SIZE = int(os.getenv('IDENTITY_CACHE_SIZE', '10000'))
+IDENTITY_CACHE_TTL = float(os.getenv('IDENTITY_CACHE_TTL', '3600'))
+
+# Реестр ботов перечитывается не реже, чем раз в BOT_REGISTRY_TTL секунд (изменения из других процессов)
+BOT_REGISTRY_TTL = float(os.getenv('BOT_REGISTRY_TTL', '300'))
+
+# Кэш готовых экранов диалога (шаблонов ответов)
+SCREEN_CACHE_SIZE = int(os.getenv('SCREEN_CACHE_SIZE', '1000'))
+
+# Строгий режим кодеков: исходящие сообщения дополнительно проверяются схемами marshmallow
+CODEC_STRICT = env_flag('CODEC_STRICT')
+
+# Доставка исходящих сообщений на платформы
+DELIVERY_WORKERS = int(os.getenv('DELIVERY_WORKERS', '4'))
+DELIVERY_MAX_IN_FLIGHT = int(os.getenv('DELIVERY_MAX_IN_FLIGHT', '1000'))
+DELIVERY_CONNECT_TIMEOUT = float(os.getenv('DELIVERY_CONNECT_TIMEOUT', '3.05'))
+DELIVERY_READ_TIMEOUT = float(os.getenv('DELIVERY_READ_TIMEOUT', '10'))
+DELIVERY_BACKOFF_BASE = float(os.getenv('DELIVERY_BACKOFF_BASE', '0.5'))
+DELIVERY_BACKOFF_CAP = float(os.getenv('DELIVERY_BACKOFF_CAP', '30'))
+DELIVERY_DEADLINE = float(os.getenv('DELIVERY_DEADLINE', '300'))
+
+# Транзакционный outbox исходящих сообщений
+OUTBOX_IN_PROCESS = env_flag('OUTBOX_IN_PROCESS', True)
+OUTBOX_BATCH_SIZE = int(os.getenv('OUTBOX_BATCH_SIZE', '50'))
+OUTBOX_POLL_INTERVAL = float(os.getenv('OUTBOX_POLL_INTERVAL', '1.0'))
+OUTBOX_LEASE = float(os.getenv('OUTBOX_LEASE', '600'))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv('OUTBOX_MAX_ATTEMPTS', '5'))
+
+# Каталог файлов данных приложения (хранилища SQLite, архив сообщений), в репозиторий не входит
+DATA_DIR = os.getenv('DATA_DIR', os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data'))
+
+# Хранилище команд кнопок (Jivo): local - в памяти процесса, sqlite - общий для процессов файл SQLite
+COMMAND_STORE = os.getenv('COMMAND_STORE', 'local')
+COMMAND_STORE_PATH = os.getenv('COMMAND_STORE_PATH', os.path.join(DATA_DIR, 'commands.sqlite3'))
+COMMAND_STORE_SIZE = int(os.getenv('COMMAND_STORE_SIZE', '10000'))
+COMMAND_STORE_TTL = float(os.getenv('COMMAND_STORE_TTL', '86400'))
+
+# Ограничение частоты запросов каждого бота к платформе (корзина токенов)
+RATE_LIMIT_ENABLED = env_flag('RATE_LIMIT_ENABLED', True)
+RATE_LIMIT_RATE = float(os.getenv('RATE_LIMIT_RATE', '20'))
+RATE_LIMIT_BURST = float(os.getenv('RATE_LIMIT_BURST', '40'))
+RATE_LIMIT_BACKEND = os.getenv('RATE_LIMIT_BACKEND', 'local')
+RATE_LIMIT_PATH = os.getenv('RATE_LIMIT_PATH', os.path.join(DATA_DIR, 'ratelimit.sqlite3'))
+
+# Размер страницы списка чатов в интерфейсе оператора
+CHAT_PAGE_SIZE = int(os.getenv('CHAT_PAGE_SIZE', '50'))
+CHAT_PAGE_SIZE_MAX = int(os.getenv('CHAT_PAGE_SIZE_MAX', '200'))
+
+# Инкрементальная выдача сообщений чата, long-polling и поток SSE интерфейса оператора
+MESSAGE_PAGE_SIZE = int(os.getenv('MESSAGE_PAGE_SIZE', '100'))
+MESSAGE_PAGE_SIZE_MAX = int(os.getenv('MESSAGE_PAGE_SIZE_MAX', '500'))
+MESSAGE_LONG_POLL_MAX = float(os.getenv('MESSAGE_LONG_POLL_MAX', '25'))
+MESSAGE_LONG_POLL_WAIT = float(os.getenv('MESSAGE_LONG_POLL_WAIT', '10'))
+MESSAGE_FEED_RECHECK = float(os.getenv('MESSAGE_FEED_RECHECK', '5'))
+MESSAGE_STREAM_DURATION = float(os.getenv('MESSAGE_STREAM_DURATION', '300'))
+
+# Архив сообщений старше срока хранения (manage.py archive_messages)
+MESSAGE_RETENTION_DAYS = int(os.getenv('MESSAGE_RETENTION_DAYS', '180'))
+MESSAGE_ARCHIVE_DIR = os.getenv('MESSAGE_ARCHIVE_DIR', os.path.join(DATA_DIR, 'archive'))
+MESSAGE_ARCHIVE_CHUNK = int(os.getenv('MESSAGE_ARCHIVE_CHUNK', '1000'))
+
+# Учёт запросов к базе по запросам к приложению и этапам обработки (bot.querylog)
+QUERY_PROFILE = env_flag('QUERY_PROFILE', True)
+QUERY_BUDGET = int(os.getenv('QUERY_BUDGET', '30'))
+QUERY_LOG_SIZE = int(os.getenv('QUERY_LOG_SIZE', '500'))
@@ -1,23 +1,32 @@
 from typing import Dict, Any, List, Callable, Optional
-from json.decoder import JSONDecodeError
 import logging
 
+from django.core.exceptions import ObjectDoesNotExist
+
 from billing.common import PaymentClientFactory
+from billing.exceptions import CheckoutPendingError
+from common import callbacks
 from common.builders import MessageDirector
 from common.constants import CallbackType
 from common.entities import EventCommandReceived, Callback, EventCommandToSend
 from common.strings import DialogButtons, DialogPhrases
 
-from shop.models import Category, Product, Order
+from shop.catalog import Catalog, CatalogStore
+from shop.constants import CATALOG_PAGE_SIZE, SEARCH_MIN_LENGTH
+from .screens import DEFAULT_LANGUAGE, Screen, ScreenCache, build_screen
+from shop.models import Order, Product
 
 
 class Dialog:
     """Содержит логику взаимодействия бота с пользователем.
 
     Осуществляет диалог из нескольких этапов, предлагая выбрать категорию, товар, систему оплаты.
-    По итогу инициирует выставление счёта в соответствующей системе."""
+    По итогу инициирует выставление счёта в соответствующей системе.
+    Данные каталога берутся из снимка в памяти (shop.catalog), без обращений к базе,
+    а готовые экраны - из кэша шаблонов (bot.screens)."""
 
     callback: Callback
+    language: str = DEFAULT_LANGUAGE
     logger = logging.getLogger('root')
 
     def reply(self, event: EventCommandReceived) -> Optional[EventCommandToSend]:
@@ -36,161 +45,220 @@ class Dialog:
         if event.payload.command is not None:
             command: str = event.payload.command
             try:
-                self.callback = Callback.Schema().loads(command)
+                self.callback = callbacks.decode(command)
                 result = variants[self.callback.type](event)
-            except JSONDecodeError as err:
+            except ValueError as err:
                 self.logger.error(f'Dialog GREETING formed: {err.args}')
                 result = self._form_greeting(event)
+            except ObjectDoesNotExist as err:
+                # кнопка старого сообщения ведёт к удалённой категории или снятому с продажи товару
+                self.logger.info(f'Dialog GREETING formed: {err.args}')
+                result = self._form_greeting(event)
             except KeyError as err:
                 self.logger.debug(f'Dialog.ready(): {err.args}')
                 # result = self.form_category_list(event)
         else:
-            self.logger.debug('Dialog GREETING formed.')
-            result = self._form_greeting(event)
+            result = self.form_search_results(event)
+            if result is None:
+                self.logger.debug('Dialog GREETING formed.')
+                result = self._form_greeting(event)
 
         return result
 
+    def _screen(self, callback_type: Optional[CallbackType], obj_id: int, catalog: Catalog,
+                build: Callable[[], Screen], cursor: int = 0) -> Screen:
+        """Возвращает шаблон экрана из кэша по ключу (CallbackType, id, курсор страницы, язык)."""
+
+        return ScreenCache().get((callback_type, obj_id, cursor, self.language), catalog.version, build)
+
     def _form_greeting(self, event: EventCommandReceived) -> EventCommandToSend:
         """Формирует приветствие пользователя при написании произвольного сообщения."""
 
-        button_data: List[Dict[str, Any]] = [
-            {
-                'title': DialogButtons.START_SESSION.value,
-                'id': 0,
-                'type': CallbackType.GREETING,
-            }]
-
-        greeting = DialogPhrases.SESSION_GREETING.value
-        if event.user_name_in_messenger:
-            greeting = greeting.format(alias=f', {event.user_name_in_messenger}')
-        else:
-            greeting = greeting.format(alias='')
+        def build() -> Screen:
+            button_data: List[Dict[str, Any]] = [
+                {
+                    'title': DialogButtons.START_SESSION.value,
+                    'id': 0,
+                    'type': CallbackType.GREETING,
+                }]
+            return build_screen(DialogPhrases.SESSION_GREETING.value, button_data)
 
-        msg = MessageDirector().create_ects(
-            bot_id=event.bot_id,
-            chat_id_in_messenger=event.chat_id_in_messenger,
-            text=greeting,
-            button_data=button_data,
-        )
+        screen = self._screen(None, 0, CatalogStore().current(), build)
+        alias = f', {event.user_name_in_messenger}' if event.user_name_in_messenger else ''
 
-        return msg
+        return screen.stamp(event.bot_id, event.chat_id_in_messenger, alias=alias)
 
     def form_category_list(self, event: EventCommandReceived) -> EventCommandToSend:
         """Собирает список категорий в виде данных для сообщения с соответствующими кнопками."""
 
-        button_data: List[Dict[str, Any]] = [
-            {
-                'title': category['name'],
-                'id': category['id'],
-                'type': CallbackType.CATEGORY,
-            } for category in Category.objects.get_categories()][:10]
+        catalog = CatalogStore().current()
 
-        msg = MessageDirector().create_ects(
-            bot_id=event.bot_id,
-            chat_id_in_messenger=event.chat_id_in_messenger,
-            text=DialogPhrases.CHOOSE_CATEGORY.value,
-            button_data=button_data,
-        )
+        def build() -> Screen:
+            button_data: List[Dict[str, Any]] = [
+                {
+                    'title': category['name'],
+                    'id': category['id'],
+                    'type': CallbackType.CATEGORY,
+                } for category in catalog.get_categories()][:10]
+            self.logger.debug(f'"BUTTONS: {button_data}"')
+            return build_screen(DialogPhrases.CHOOSE_CATEGORY.value, button_data)
 
-        self.logger.debug(f'"BUTTONS: {button_data}"')
+        screen = self._screen(CallbackType.GREETING, 0, catalog, build)
 
-        return msg
+        return screen.stamp(event.bot_id, event.chat_id_in_messenger)
 
     def form_product_list(self, event: EventCommandReceived) -> EventCommandToSend:
-        """Собирает список продуктов категории в виде данных для сообщения с соответствующими кнопками."""
-
-        category = Category.objects.get_category_by_id(self.callback.id)
+        """Собирает страницу списка категории: подкатегории, затем товары категории вместе с товарами подкатегорий,
+        и кнопки перехода по страницам. В заголовке - путь категории от корня.
+
+        Курсор команды - смещение страницы в списке; из каталога выбирается только эта страница."""
+
+        catalog = CatalogStore().current()
+        offset = self.callback.cursor or 0
+
+        def build() -> Screen:
+            breadcrumb = ' -> '.join(category['name'] for category in catalog.get_breadcrumb(self.callback.id))
+            categories = catalog.get_categories(self.callback.id)
+            page_categories = categories[offset:offset + CATALOG_PAGE_SIZE]
+            # на один товар больше страницы: признак следующей страницы
+            products = catalog.get_subtree_product_page(
+                self.callback.id,
+                max(0, offset - len(categories)),
+                CATALOG_PAGE_SIZE - len(page_categories) + 1,
+            )
+            button_data: List[Dict[str, Any]] = [
+                {
+                    'title': category['name'],
+                    'id': category['id'],
+                    'type': CallbackType.CATEGORY,
+                } for category in page_categories
+            ] + [
+                {
+                    'title': product['name'],
+                    'id': product['id'],
+                    'type': CallbackType.PRODUCT,
+                } for product in products[:CATALOG_PAGE_SIZE - len(page_categories)]
+            ]
+            if offset > 0:
+                button_data.append({
+                    'title': DialogButtons.PREVIOUS_PAGE.value,
+                    'id': self.callback.id,
+                    'type': CallbackType.CATEGORY,
+                    'cursor': max(0, offset - CATALOG_PAGE_SIZE) or None,
+                })
+            # следующая страница есть, если за этой остались подкатегории или товары
+            if offset + CATALOG_PAGE_SIZE < len(categories) or len(page_categories) + len(products) > CATALOG_PAGE_SIZE:
+                button_data.append({
+                    'title': DialogButtons.NEXT_PAGE.value,
+                    'id': self.callback.id,
+                    'type': CallbackType.CATEGORY,
+                    'cursor': offset + CATALOG_PAGE_SIZE,
+                })
+            self.logger.debug(f'"BUTTONS: {button_data}"')
+            return build_screen(DialogPhrases.CHOOSE_PRODUCT.value.format(category=breadcrumb), button_data)
+
+        screen = self._screen(CallbackType.CATEGORY, self.callback.id, catalog, build, offset)
+
+        return screen.stamp(event.bot_id, event.chat_id_in_messenger)
+
+    def form_search_results(self, event: EventCommandReceived) -> Optional[EventCommandToSend]:
+        """Ищет товары по произвольному тексту пользователя (shop.search) и собирает кнопки найденных товаров.
+
+        Возвращает None, если текст слишком короткий или ничего не найдено. Экран зависит от запроса,
+        поэтому в кэш шаблонов не попадает."""
+
+        text = (event.payload.text or '').strip()
+        if len(text) < SEARCH_MIN_LENGTH:
+            return None
+        products = Product.objects.get_products_by_query(text, 0, CATALOG_PAGE_SIZE)
+        if not products:
+            return None
         button_data: List[Dict[str, Any]] = [
-             {
-                 'title': product['name'],
-                 'id': product['id'],
-                 'type': CallbackType.PRODUCT,
-             } for product in Product.objects.get_products(self.callback.id)][:10]
-
-        msg = MessageDirector().create_ects(
-            bot_id=event.bot_id,
-            chat_id_in_messenger=event.chat_id_in_messenger,
-            text=DialogPhrases.CHOOSE_PRODUCT.value.format(
-                category=category['name']
-            ),
-            button_data=button_data,
-        )
-
+            {
+                'title': product['name'],
+                'id': product['id'],
+                'type': CallbackType.PRODUCT,
+            } for product in products]
         self.logger.debug(f'"BUTTONS: {button_data}"')
+        screen = build_screen(DialogPhrases.SEARCH_RESULTS.value.format(query=text[:100]), button_data)
 
-        return msg
+        return screen.stamp(event.bot_id, event.chat_id_in_messenger)
 
     def form_product_desc(self, event: EventCommandReceived) -> EventCommandToSend:
         """Формирует данные для описания выбранного товара с кнопкой 'Заказать'."""
 
-        product = Product.objects.get_product_by_id(self.callback.id)
-        text = DialogPhrases.ORDER_PRODUCT.value.format(
-            name=product['name'],
-            desc=product['description'][:400],
-            price=product['price'],
-        )
-        button_data: List[Dict[str, Any]] = [
-            {
-                'title': DialogButtons.ORDER_PRODUCT.value,
-                'id': self.callback.id,
-                'type': CallbackType.ORDER,
-            }]
+        catalog = CatalogStore().current()
 
-        msg = MessageDirector().create_ects(
-            bot_id=event.bot_id,
-            chat_id_in_messenger=event.chat_id_in_messenger,
-            text=text,
-            button_data=button_data,
-        )
+        def build() -> Screen:
+            product = catalog.get_product_by_id(self.callback.id, ('name', 'description', 'price'))
+            text = DialogPhrases.ORDER_PRODUCT.value.format(
+                name=product.name,
+                desc=product.description[:400],
+                price=product.price,
+            )
+            button_data: List[Dict[str, Any]] = [
+                {
+                    'title': DialogButtons.ORDER_PRODUCT.value,
+                    'id': self.callback.id,
+                    'type': CallbackType.ORDER,
+                }]
+            self.logger.debug(f'"BUTTONS: {button_data}"')
+            return build_screen(text, button_data)
 
-        self.logger.debug(f'"BUTTONS: {button_data}"')
+        screen = self._screen(CallbackType.PRODUCT, self.callback.id, catalog, build)
 
-        return msg
+        return screen.stamp(event.bot_id, event.chat_id_in_messenger)
 
     def form_order_confirmation(self, event: EventCommandReceived) -> EventCommandToSend:
         """Формирует данные для сообщения с предложением выбрать платёжную систему для оплаты."""
 
-        product = Product.objects.get_product_by_id(self.callback.id)
-        text = DialogPhrases.ORDER_CONFIRM.value.format(
-                name=product["name"], price=product["price"]
-                )
-        # todo где-то нужна метаинформация по списку систем
-        button_data: List[Dict[str, Any]] = [
-            {
-                'title': DialogButtons.PAYPAL_OPTION.value,
-                'id': self.callback.id,
-                'type': CallbackType.PAYPAL,
-            },
-            {
-                'title': DialogButtons.STRIPE_OPTION.value,
-                'id': self.callback.id,
-                'type': CallbackType.STRIPE,
-            },
-        ]
-
-        msg = MessageDirector().create_ects(
-            bot_id=event.bot_id,
-            chat_id_in_messenger=event.chat_id_in_messenger,
-            text=text,
-            button_data=button_data,
-        )
-
-        self.logger.debug(f'"BUTTONS: {button_data}"')
-
-        return msg
+        catalog = CatalogStore().current()
+
+        def build() -> Screen:
+            product = catalog.get_product_by_id(self.callback.id, ('name', 'price'))
+            text = DialogPhrases.ORDER_CONFIRM.value.format(
+                    name=product.name, price=product.price
+                    )
+            # todo где-то нужна метаинформация по списку систем
+            button_data: List[Dict[str, Any]] = [
+                {
+                    'title': DialogButtons.PAYPAL_OPTION.value,
+                    'id': self.callback.id,
+                    'type': CallbackType.PAYPAL,
+                },
+                {
+                    'title': DialogButtons.STRIPE_OPTION.value,
+                    'id': self.callback.id,
+                    'type': CallbackType.STRIPE,
+                },
+            ]
+            self.logger.debug(f'"BUTTONS: {button_data}"')
+            return build_screen(text, button_data)
+
+        screen = self._screen(CallbackType.ORDER, self.callback.id, catalog, build)
+
+        return screen.stamp(event.bot_id, event.chat_id_in_messenger)
 
     def make_order(self, event: EventCommandReceived) -> EventCommandToSend:
-        """Формирует заказ и готовит данные для сообщения со ссылкой для произведения оплаты пользователем."""
+        """Формирует заказ и готовит данные для сообщения со ссылкой для произведения оплаты пользователем.
+
+        Повторное нажатие кнопки в том же сообщении возвращает уже выписанную ссылку на оплату того же заказа;
+        если чекаут ещё выписывается первым нажатием и не выписан за CHECKOUT_PENDING_TIMEOUT секунд,
+        пользователь получает просьбу повторить нажатие."""
 
-        order = Order.objects.make_order(
+        order, _ = Order.objects.make_order(
             event.chat_id_in_messenger,
             event.bot_id,
             self.callback.id,
+            request_key=event.message_id_in_messenger,
         )
         payment_client = PaymentClientFactory.create(self.callback.type.value)
-        approve_link = payment_client.check_out(order.pk, self.callback.id)
-
-        text = DialogPhrases.PAYMENT_LINK.value.format(link=approve_link)
+        try:
+            text = DialogPhrases.PAYMENT_LINK.value.format(
+                link=payment_client.resume_check_out(order.pk, self.callback.id))
+        except CheckoutPendingError as err:
+            self.logger.warning(f'Dialog payment link pending: {err.args}')
+            text = DialogPhrases.PAYMENT_PENDING.value
 
         msg = MessageDirector().create_ects(
             bot_id=event.bot_id,
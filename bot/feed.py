@@ -0,0 +1,77 @@
+"""Модуль оповещения о новых сообщениях чатов.
+
+Интерфейс оператора ждёт новых сообщений чата (long-polling и поток SSE, см. bot.views) не опрашивая базу в цикле:
+запрос подписывается на чат и засыпает, а запись сообщений (MessageManager.save_message, буфер write-behind)
+будит подписчиков после фиксации транзакции. Оповещения действуют в пределах процесса, поэтому сообщения,
+записанные другими процессами, ожидающий запрос проверяет в базе раз в MESSAGE_FEED_RECHECK секунд."""
+
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, Iterator, Set
+
+from patterns.singleton import Singleton
+
+
+class Watch:
+    """Подписка одного запроса на новые сообщения чата."""
+
+    def __init__(self, chat_id: int) -> None:
+        self.chat_id = chat_id
+        self._event = threading.Event()
+
+    def notify(self) -> None:
+        self._event.set()
+
+    def wait(self, timeout: float) -> bool:
+        """Ждёт оповещения не дольше timeout секунд. Возвращает True, если в чате появились сообщения."""
+
+        notified = self._event.wait(timeout)
+        self._event.clear()
+        return notified
+
+
+class MessageFeed(metaclass=Singleton):
+    """Подписки процесса на новые сообщения чатов. Хранятся только чаты, которые сейчас кто-то ждёт."""
+
+    def __init__(self) -> None:
+        self._watches: Dict[int, Set[Watch]] = {}
+        self._lock = threading.Lock()
+        self.published = 0
+        self.wakeups = 0
+
+    @contextmanager
+    def watch(self, chat_id: int) -> Iterator[Watch]:
+        """Подписывает на чат на время блока. Подписку нужно оформить до чтения сообщений из базы,
+        иначе сообщение, записанное между чтением и ожиданием, будет замечено только при проверке базы."""
+
+        watch = Watch(chat_id)
+        with self._lock:
+            self._watches.setdefault(chat_id, set()).add(watch)
+        try:
+            yield watch
+        finally:
+            with self._lock:
+                watches = self._watches.get(chat_id)
+                if watches is not None:
+                    watches.discard(watch)
+                    if not watches:
+                        del self._watches[chat_id]
+
+    def publish(self, chat_ids: Iterable[int]) -> None:
+        """Будит подписчиков чатов, в которых записаны новые сообщения."""
+
+        with self._lock:
+            self.published += 1
+            for chat_id in chat_ids:
+                for watch in self._watches.get(chat_id, ()):
+                    watch.notify()
+                    self.wakeups += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'watched_chats': len(self._watches),
+                'watches': sum(len(watches) for watches in self._watches.values()),
+                'published': self.published,
+                'wakeups': self.wakeups,
+            }
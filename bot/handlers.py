@@ -1,46 +1,67 @@
 import logging
 from typing import Optional
 
+from django.db import transaction
 from marshmallow import ValidationError
 
+from common.codecs import validate
 from common.entities import EventCommandReceived, EventCommandToSend
+from . import outbox
+from .constants import CODEC_STRICT
 from .dialog import Dialog
 from .models import Message
+from .querylog import stage
 
 
 logger = logging.getLogger('root')
 
 
+@stage('handler')
 def message_handler(event: EventCommandReceived) -> Optional[EventCommandToSend]:
     """Возвращает команду для отправки (ECTS) в ответ на принятую команду (ECR).
 
     Передаёт полученные данные обработчику логики диалога и сохраняет входящие/исходящие сообщения."""
 
-    Message.objects.save_message(
-        event.bot_id,
-        event.chat_id_in_messenger,
-        event.chat_type,
-        event.payload.direction,
-        event.content_type,
-        event.user_id_in_messenger,
-        event.user_name_in_messenger,
-        str(event.payload.command) if event.payload.command else event.payload.text,
-        event.message_id_in_messenger)
-    result: Optional[EventCommandToSend] = Dialog().reply(event)
-    if result:
-        message = Message.objects.save_message(
-            result.bot_id,
-            result.chat_id_in_messenger,
+    with stage('persist'):
+        Message.objects.save_message(
+            event.bot_id,
+            event.chat_id_in_messenger,
             event.chat_type,
-            result.payload.direction,
-            result.content_type,
+            event.payload.direction,
+            event.content_type,
             event.user_id_in_messenger,
             event.user_name_in_messenger,
-            result.payload.text,
-        )
-        result.message_id = message.pk
-        try:
-            result.Schema().validate(result.Schema().dump(result))
-        except ValidationError as err:
-            logger.error(f'Malformed ECTS in handler: {err.args}')
+            str(event.payload.command) if event.payload.command else event.payload.text,
+            event.message_id_in_messenger)
+    with stage('dialog'):
+        result: Optional[EventCommandToSend] = Dialog().reply(event)
+    if result:
+        # исходящее сообщение и запись outbox фиксируются вместе: ответ не теряется при падении процесса
+        with stage('persist'), transaction.atomic():
+            message = Message.objects.save_message(
+                result.bot_id,
+                result.chat_id_in_messenger,
+                event.chat_type,
+                result.payload.direction,
+                result.content_type,
+                event.user_id_in_messenger,
+                event.user_name_in_messenger,
+                result.payload.text,
+            )
+            result.message_id = message.pk
+            if CODEC_STRICT:
+                try:
+                    validate(result)
+                except ValidationError as err:
+                    logger.error(f'Malformed ECTS in handler: {err.args}')
+            outbox.enqueue(result)
     return result
+
+
+def process_event(bot_type: int, event: EventCommandReceived) -> None:
+    """Полностью обрабатывает принятую команду (ECR): ответ хендлера записывается в outbox и отправляется из него.
+
+    Используется как синхронно из вью, так и воркерами очереди вебхуков.
+    Клиент платформы для отправки определяется отправителем outbox по bot_id ответа."""
+
+    message_handler(event)
@@ -0,0 +1,29 @@
+"""Модуль кэша идентификаторов пользователей бота и чатов.
+
+Идентичность чата и пользователя после создания не меняется, поэтому соответствие
+(bot_id, messenger_user_id) -> BotUser.id и (bot_id, id_in_messenger) -> Chat.id кэшируется в памяти процесса.
+Записи удаляются из кэша при удалении моделей (см. bot.signals)."""
+
+from typing import Any, Dict, Optional, Tuple
+
+from common.cache import LRUCache
+from patterns.singleton import Singleton
+from .constants import IDENTITY_CACHE_SIZE, IDENTITY_CACHE_TTL
+
+
+class IdentityCache(metaclass=Singleton):
+    """Хранит кэши идентификаторов пользователей и чатов процесса."""
+
+    def __init__(self) -> None:
+        self.users: LRUCache[Tuple[int, Optional[str]], int] = LRUCache(IDENTITY_CACHE_SIZE, IDENTITY_CACHE_TTL)
+        self.chats: LRUCache[Tuple[int, str], int] = LRUCache(IDENTITY_CACHE_SIZE, IDENTITY_CACHE_TTL)
+
+    def clear(self) -> None:
+        self.users.clear()
+        self.chats.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'users': self.users.stats(),
+            'chats': self.chats.stats(),
+        }
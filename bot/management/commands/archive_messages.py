@@ -0,0 +1,27 @@
+"""Команда переноса старых сообщений в архив.
+
+usage: python manage.py archive_messages [--days N] [--chunk N]"""
+
+from datetime import timedelta
+from typing import Any
+
+from django.core.management.base import BaseCommand, CommandParser
+from django.utils import timezone
+
+from bot.archive import MessageArchive
+from bot.constants import MESSAGE_ARCHIVE_CHUNK, MESSAGE_RETENTION_DAYS
+
+
+class Command(BaseCommand):
+    help = 'Moves messages older than the retention window to compressed monthly archives.'
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument('--days', type=int, default=MESSAGE_RETENTION_DAYS,
+                            help='archive messages older than this number of days')
+        parser.add_argument('--chunk', type=int, default=MESSAGE_ARCHIVE_CHUNK,
+                            help='number of messages archived and deleted at a time')
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        archive = MessageArchive()
+        archived = archive.archive(timezone.now() - timedelta(days=options['days']), max(1, options['chunk']))
+        self.stdout.write(f'Archived {archived} messages to {archive.root}')
@@ -0,0 +1,38 @@
+"""Команда отправки исходящих сообщений из outbox отдельным процессом.
+
+usage: python manage.py drain_outbox [--once] [--batch-size N]"""
+
+from typing import Any
+
+from django.core.management.base import BaseCommand, CommandParser
+
+from bot.constants import DELIVERY_DEADLINE, OUTBOX_BATCH_SIZE
+from bot.outbox import OutboxRelay
+
+
+class Command(BaseCommand):
+    help = 'Sends pending outgoing messages from the outbox. Several instances may run at the same time.'
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument('--once', action='store_true',
+                            help='drain the outbox until it is empty, wait for deliveries and exit')
+        parser.add_argument('--batch-size', type=int, default=OUTBOX_BATCH_SIZE,
+                            help='number of records claimed at a time')
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        relay = OutboxRelay(batch_size=options['batch_size'])
+        if not options['once']:
+            self.stdout.write('Draining outbox, press Ctrl+C to stop')
+            relay.run()
+            return
+
+        claimed = 0
+        while True:
+            drained = relay.drain_once()
+            claimed += drained
+            if drained < relay.batch_size:
+                break
+        delivered = relay.engine.wait_idle(DELIVERY_DEADLINE)
+        stats = relay.engine.stats()
+        self.stdout.write(f'Claimed {claimed}, delivered {stats["delivered"]}, failed {stats["failed"]}'
+                          + ('' if delivered else ', some deliveries are still in flight'))
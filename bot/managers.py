@@ -1,11 +1,29 @@
-from typing import Optional, TYPE_CHECKING
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, List, Optional, Tuple, TYPE_CHECKING
 
-from django.db import models
-from django.db.models.query import QuerySet
+from django.db import models, transaction
+from django.db.models import F, Q
+from django.utils import timezone
 
-from common.constants import (ChatType, MessageDirection, MessageContentType, MessageStatus)
+from common.constants import (ChatType, MessageDirection, MessageContentType, MessageStatus, OutboxStatus)
+from .constants import MESSAGE_WRITE_BEHIND
+from .feed import MessageFeed
+from .identity import IdentityCache
 if TYPE_CHECKING:
-    from bot.models import (BotUser, Chat, Message)
+    from bot.models import (BotUser, Chat, Message, OutboxMessage)
+    from common.entities import EventCommandToSend
+    from common.cache import LRUCache
+
+
+def _cache_identity(cache: 'LRUCache[Any, int]', key: Any, pk: int, created: bool) -> None:
+    """Кэширует идентификатор; только что созданные записи - лишь после фиксации транзакции,
+    чтобы в кэш не попал id откатившейся записи."""
+
+    if created:
+        transaction.on_commit(lambda: cache.set(key, pk))
+    else:
+        cache.set(key, pk)
 
 
 class BotManager(models.Manager):
@@ -18,17 +36,36 @@ class BotManager(models.Manager):
         return self.get(bot_type=bot_type).id
 
     def get_bot_type_by_id(self, bot_id: int) -> int:
-        return self.get(bot_id=bot_id).bot_type
+        return self.get(id=bot_id).bot_type
 
 
 class BotUserManager(models.Manager):
     def get_or_create_user(self, bot_id: int, messenger_user_id: Optional[str], user_name: Optional[str]) -> 'BotUser':
-        user, created = self.get_or_create(bot_id=bot_id, messenger_user_id=messenger_user_id)
-        if created:
-            user.name = user_name
-            user.save()
+        user, created = self.get_or_create(
+            bot_id=bot_id,
+            messenger_user_id=messenger_user_id,
+            defaults={'name': user_name},
+        )
         return user
 
+    def resolve_user_id(self, bot_id: int, messenger_user_id: Optional[str], user_name: Optional[str]) -> int:
+        """Возвращает id пользователя бота, создавая его при необходимости.
+
+        Повторные обращения обслуживаются из кэша идентификаторов без запросов к базе."""
+
+        cache = IdentityCache().users
+        key = (bot_id, messenger_user_id)
+        user_id = cache.get(key)
+        if user_id is None:
+            user, created = self.get_or_create(
+                bot_id=bot_id,
+                messenger_user_id=messenger_user_id,
+                defaults={'name': user_name},
+            )
+            user_id = user.pk
+            _cache_identity(cache, key, user_id, created)
+        return user_id
+
 
 class ChatManager(models.Manager):
     def get_or_create_chat(self,
@@ -45,6 +82,65 @@ class ChatManager(models.Manager):
         )
         return chat
 
+    def resolve_chat_id(self, bot_id: int, chat_id_in_messenger: str, chat_type: ChatType, user_id: int) -> int:
+        """Возвращает id чата, создавая его при необходимости.
+
+        Повторные обращения обслуживаются из кэша идентификаторов без запросов к базе."""
+
+        cache = IdentityCache().chats
+        key = (bot_id, chat_id_in_messenger)
+        chat_id = cache.get(key)
+        if chat_id is None:
+            chat, created = self.get_or_create(
+                bot_id=bot_id,
+                id_in_messenger=chat_id_in_messenger,
+                type=chat_type.value,
+                bot_user_id=user_id,
+            )
+            chat_id = chat.pk
+            _cache_identity(cache, key, chat_id, created)
+        return chat_id
+
+    def get_chat_id(self, bot_id: int, chat_id_in_messenger: str) -> int:
+        """Возвращает id существующего чата, повторные обращения - из кэша идентификаторов."""
+
+        cache = IdentityCache().chats
+        key = (bot_id, chat_id_in_messenger)
+        chat_id = cache.get(key)
+        if chat_id is None:
+            chat_id = self.values_list('id', flat=True).get(bot_id=bot_id, id_in_messenger=chat_id_in_messenger)
+            cache.set(key, chat_id)
+        return chat_id
+
+    def page(self, after: Optional[Tuple[Optional[datetime], int]], size: int) -> List['Chat']:
+        """Возвращает страницу списка чатов: сначала с последними сообщениями, чаты без сообщений - в конце.
+
+        Пагинация по ключу (last_message_time, id): страница начинается после чата after,
+        поэтому стоимость запроса не зависит от номера страницы. Чаты с сообщениями и без них выбираются
+        отдельными запросами: каждый идёт по индексу в порядке сортировки, без сортировки всей таблицы.
+        Пользователь бота выбирается тем же запросом."""
+
+        chats = self.select_related('bot_user').only(
+            'id', 'last_message_time', 'last_message_text', 'bot_user__name',
+        )
+        page: List['Chat'] = []
+        after_id = None
+        if after is None or after[0] is not None:
+            timed = chats.filter(last_message_time__isnull=False)
+            if after is not None:
+                last_time, last_id = after
+                timed = timed.filter(last_message_time__lte=last_time).exclude(
+                    last_message_time=last_time, id__gte=last_id)
+            page = list(timed.order_by('-last_message_time', '-id')[:size])
+            if len(page) == size:
+                return page
+        else:
+            after_id = after[1]
+        untimed = chats.filter(last_message_time__isnull=True)
+        if after_id is not None:
+            untimed = untimed.filter(id__lt=after_id)
+        return page + list(untimed.order_by('-id')[:size - len(page)])
+
 
 class MessageManager(models.Manager):
     """Класс для управления моделью Message."""
@@ -59,16 +155,22 @@ class MessageManager(models.Manager):
                      user_name: Optional[str],
                      message_text: Optional[str] = '',
                      message_id_in_messenger: Optional[str] = '') -> 'Message':
-        """Сохраняет входящие/исходящие сообщения, обновляет соответствующие поля активности чатов."""
+        """Сохраняет входящие/исходящие сообщения, обновляет соответствующие поля активности чатов.
+
+        В режиме MESSAGE_WRITE_BEHIND входящие сообщения и активность чатов записываются пачками в фоне,
+        поэтому для входящего сообщения возвращается ещё не сохранённый инстанс (pk = None).
+        Исходящие сообщения всегда записываются сразу: их id нужен для отправки (EventCommandToSend.message_id);
+        перед этим записываются ожидающие в буфере входящие сообщения того же чата."""
 
         from .models import BotUser, Chat
+        from .persistence import SingletonWriteBuffer
         # can't import the models at the top of the file because of a circular dependency
-        user = BotUser.objects.get_or_create_user(bot_id, messenger_user_id, user_name)
-        chat = Chat.objects.get_or_create_chat(bot_id, chat_id_in_messenger, chat_type, user)
-        message = self.create(
+        user_id = BotUser.objects.resolve_user_id(bot_id, messenger_user_id, user_name)
+        chat_id = Chat.objects.resolve_chat_id(bot_id, chat_id_in_messenger, chat_type, user_id)
+        message = self.model(
             bot_id=bot_id,
-            bot_user=user,
-            chat=chat,
+            bot_user_id=user_id,
+            chat_id=chat_id,
             direction=message_direction.value,
             content_type=message_content_type.value,
             id_in_messenger=message_id_in_messenger,
@@ -76,20 +178,142 @@ class MessageManager(models.Manager):
         )
         if message_direction == MessageDirection.RECEIVED:
             message.status = MessageStatus.DELIVERED.value
-        message.save()
-        # save message in chat last message
-        chat.last_message_time = message.created_at
-        chat.last_message_text = message.text
-        chat.save()
+        last_message_text = message.text[:100] if message.text else message.text
+
+        if MESSAGE_WRITE_BEHIND:
+            buffer = SingletonWriteBuffer().get_buffer
+            if message_direction == MessageDirection.RECEIVED:
+                buffer.add_message(message)
+            else:
+                # вопрос из буфера записывается раньше ответа: иначе он появится в базе позже ответа,
+                # и курсор новых сообщений (created_at, id), уже прошедший ответ, его пропустит
+                buffer.flush_chat(chat_id)
+                message.save(force_insert=True)
+            buffer.touch_chat(chat_id, message.created_at, last_message_text)
+        else:
+            message.save(force_insert=True)
+            # save message in chat last message
+            Chat.objects.filter(pk=chat_id).update(
+                last_message_time=message.created_at,
+                last_message_text=last_message_text,
+                updated_at=timezone.now(),
+            )
+        if message.pk is not None:
+            transaction.on_commit(lambda: MessageFeed().publish((chat_id,)))
 
         return message
 
     def set_sent(self, message_id: int) -> None:
         """Устанавливает статус SENT сообщениям, успешно отправленным через API платформы."""
 
-        message = self.get(id=message_id)
-        message.status = MessageStatus.SENT.value
-        message.save()
+        self.filter(id=message_id).update(status=MessageStatus.SENT.value, updated_at=timezone.now())
+
+    def set_failed(self, message_id: int) -> None:
+        """Устанавливает статус FAILED сообщениям, которые не удалось отправить."""
+
+        self.filter(id=message_id).update(status=MessageStatus.FAILED.value, updated_at=timezone.now())
 
-    def get_chat_messages(self, chat_id: int) -> 'QuerySet[Message]':
-        return self.filter(chat_id=chat_id).order_by('created_at').all()
+    def get_chat_messages(self, chat_id: int, before: Optional[Tuple[datetime, int]] = None,
+                          limit: Optional[int] = None) -> List['Message']:
+        """Возвращает сообщения чата, записанные до сообщения с ключом before (created_at, id):
+        последние limit (все при None) в порядке записи.
+
+        Сообщения упорядочены по времени создания, а не по id: в режиме MESSAGE_WRITE_BEHIND входящее сообщение
+        записывается в базу позже ответа на него и получает больший id.
+        Если в таблице сообщений чата не хватает, остальные дочитываются из архива (bot.archive)."""
+
+        from .archive import MessageArchive
+        messages = self.filter(chat_id=chat_id)
+        if before is not None:
+            last_time, last_id = before
+            messages = messages.filter(created_at__lte=last_time).exclude(created_at=last_time, id__gte=last_id)
+        messages = messages.order_by('-created_at', '-id')
+        page = list(messages[:limit] if limit is not None else messages)
+        if limit is None or len(page) < limit:
+            page.extend(MessageArchive().read_chat(
+                chat_id,
+                (page[-1].created_at, page[-1].pk) if page else before,
+                None if limit is None else limit - len(page),
+            ))
+        page.reverse()
+        return page
+
+    def get_chat_messages_after(self, chat_id: int, after: Optional[Tuple[datetime, int]],
+                                limit: int) -> List['Message']:
+        """Возвращает не более limit сообщений чата, записанных после сообщения с ключом after (created_at, id),
+        в порядке записи; при after = None - с начала чата."""
+
+        messages = self.filter(chat_id=chat_id)
+        if after is not None:
+            last_time, last_id = after
+            messages = messages.filter(created_at__gte=last_time).exclude(created_at=last_time, id__lte=last_id)
+        return list(messages.only('id', 'text', 'direction', 'created_at').order_by('created_at', 'id')[:limit])
+
+
+class OutboxMessageManager(models.Manager):
+    """Класс менеджеров модели OutboxMessage.
+
+    Захват записей выполняется условным UPDATE: из нескольких процессов, выбравших одни и те же записи,
+    аренду получает только первый, поэтому одна запись не отправляется дважды, пока аренда не истекла."""
+
+    def enqueue(self, command: 'EventCommandToSend') -> 'OutboxMessage':
+        """Записывает команду в outbox; вызывается в транзакции сохранения исходящего сообщения."""
+
+        from common import codecs
+        return self.create(message_id=command.message_id, bot_id=command.bot_id, payload=codecs.dumps(command))
+
+    def claim(self, batch_size: int, lease: float) -> Tuple[str, List['OutboxMessage']]:
+        """Захватывает до batch_size готовых к отправке записей. Возвращает токен аренды и захваченные записи."""
+
+        now = timezone.now()
+        token = uuid.uuid4().hex
+        claimable = (Q(status=OutboxStatus.PENDING.value, available_at__lte=now)
+                     | Q(status=OutboxStatus.SENDING.value, lease_expires_at__lt=now))
+        ids = list(self.filter(claimable).order_by('id').values_list('id', flat=True)[:batch_size])
+        if not ids:
+            return token, []
+        self.filter(claimable, id__in=ids).update(
+            status=OutboxStatus.SENDING.value,
+            lease_token=token,
+            lease_expires_at=now + timedelta(seconds=lease),
+            attempts=F('attempts') + 1,
+            updated_at=now,
+        )
+        return token, list(self.filter(lease_token=token).order_by('id'))
+
+    def _finish(self, outbox_id: int, token: str, status: OutboxStatus, error: Optional[str] = None) -> bool:
+        return bool(self.filter(id=outbox_id, lease_token=token).update(
+            status=status.value,
+            lease_token=None,
+            lease_expires_at=None,
+            last_error=error[:255] if error else None,
+            updated_at=timezone.now(),
+        ))
+
+    def mark_sent(self, outbox_id: int, token: str, message_id: Optional[int]) -> None:
+        """Помечает запись и исходящее сообщение отправленными, если аренда всё ещё принадлежит токену."""
+
+        from .models import Message
+        with transaction.atomic():
+            if self._finish(outbox_id, token, OutboxStatus.SENT) and message_id is not None:
+                Message.objects.set_sent(message_id)
+
+    def mark_failed(self, outbox_id: int, token: str, message_id: Optional[int], error: str) -> None:
+        """Помечает запись и исходящее сообщение неудачными, если аренда всё ещё принадлежит токену."""
+
+        from .models import Message
+        with transaction.atomic():
+            if self._finish(outbox_id, token, OutboxStatus.FAILED, error) and message_id is not None:
+                Message.objects.set_failed(message_id)
+
+    def release(self, outbox_id: int, token: str, delay: float) -> None:
+        """Возвращает захваченную запись в очередь с отсрочкой, например при заполненном окне доставки."""
+
+        now = timezone.now()
+        self.filter(id=outbox_id, lease_token=token).update(
+            status=OutboxStatus.PENDING.value,
+            lease_token=None,
+            lease_expires_at=None,
+            available_at=now + timedelta(seconds=delay),
+            updated_at=now,
+        )
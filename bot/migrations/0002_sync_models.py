@@ -0,0 +1,33 @@
+# Generated by Django 3.1.2 on 2026-10-17 03:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bot', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='botuser',
+            name='lang_code',
+            field=models.CharField(choices=[('ru', 'Russian'), ('en', 'English'), ('fr', 'French'), ('uz', "O'zbek")], default='ru', max_length=2, verbose_name='User language'),
+        ),
+        migrations.AlterField(
+            model_name='chat',
+            name='id',
+            field=models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID'),
+        ),
+        migrations.AlterField(
+            model_name='message',
+            name='content_type',
+            field=models.PositiveSmallIntegerField(choices=[(1, 'Text'), (2, 'Image'), (3, 'Contact'), (4, 'Voice'), (5, 'Remove'), (6, 'Command'), (7, 'System'), (8, 'File'), (9, 'Inline')], default=1, verbose_name='Content type'),
+        ),
+        migrations.AlterField(
+            model_name='message',
+            name='id',
+            field=models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID'),
+        ),
+    ]
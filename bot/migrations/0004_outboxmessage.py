@@ -0,0 +1,38 @@
+# Generated by Django 3.1.2 on 2026-10-17 03:15
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bot', '0003_message_created_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OutboxMessage',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('updated_at', models.DateTimeField(auto_now=True, db_index=True)),
+                ('payload', models.TextField(verbose_name='Payload')),
+                ('status', models.PositiveSmallIntegerField(choices=[(1, 'Pending'), (2, 'Sending'), (3, 'Sent'), (5, 'Failed')], default=1, verbose_name='Status')),
+                ('attempts', models.PositiveSmallIntegerField(default=0, verbose_name='Attempts')),
+                ('available_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Available at')),
+                ('lease_token', models.CharField(blank=True, db_index=True, max_length=32, null=True, verbose_name='Lease token')),
+                ('lease_expires_at', models.DateTimeField(blank=True, null=True, verbose_name='Lease expires at')),
+                ('last_error', models.CharField(blank=True, max_length=255, null=True, verbose_name='Last error')),
+                ('bot', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='bot.bot', verbose_name='Bot')),
+                ('message', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='outbox', to='bot.message', verbose_name='Message')),
+            ],
+            options={
+                'verbose_name': 'Outbox message',
+                'verbose_name_plural': 'Outbox messages',
+                'ordering': ['id'],
+                'index_together': {('status', 'available_at')},
+            },
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 3.1.2 on 2026-10-17 03:15
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bot', '0004_outboxmessage'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='chat',
+            index_together={('last_message_time', 'id'), ('bot', 'id_in_messenger')},
+        ),
+    ]
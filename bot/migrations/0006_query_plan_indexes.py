@@ -0,0 +1,26 @@
+# Generated by Django 3.1.2 on 2026-10-17 03:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bot', '0005_chat_page_index'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='bot',
+            name='bot_type',
+            field=models.PositiveSmallIntegerField(choices=[(10, 'Type_jivosite'), (11, 'Type_ok')], db_index=True, verbose_name='Bot Type'),
+        ),
+        migrations.AlterIndexTogether(
+            name='message',
+            index_together={('chat', 'created_at')},
+        ),
+        migrations.AlterIndexTogether(
+            name='outboxmessage',
+            index_together={('status', 'available_at'), ('status', 'lease_expires_at')},
+        ),
+    ]
@@ -1,8 +1,9 @@
 from django.db import models
+from django.utils import timezone
 
-from common.constants import (BotType, ChatType, MessageContentType, MessageDirection, MessageStatus)
+from common.constants import (BotType, ChatType, MessageContentType, MessageDirection, MessageStatus, OutboxStatus)
 from ecom_chatbot.settings import LANGUAGES
-from .managers import BotManager, ChatManager, MessageManager, BotUserManager
+from .managers import BotManager, ChatManager, MessageManager, BotUserManager, OutboxMessageManager
 
 
 class TrackableUpdateCreateModel(models.Model):
@@ -21,7 +22,7 @@ class Bot(TrackableUpdateCreateModel):
     Содержит поля наименования и типа бота."""
 
     name = models.CharField('Name', max_length=255, blank=True)
-    bot_type = models.PositiveSmallIntegerField('Bot Type', choices=BotType.choices())
+    bot_type = models.PositiveSmallIntegerField('Bot Type', choices=BotType.choices(), db_index=True)
     objects = BotManager()
 
     def __str__(self) -> str:
@@ -101,6 +102,8 @@ class Chat(TrackableUpdateCreateModel):
         unique_together = (('bot', 'id_in_messenger'),)
         index_together = (
             ('bot', 'id_in_messenger'),
+            # пагинация списка чатов по ключу (ChatManager.page)
+            ('last_message_time', 'id'),
         )
 
 
@@ -112,6 +115,8 @@ class Message(TrackableUpdateCreateModel):
     и сопоставления с индексацией сообщений в социальной платформе.
     """
 
+    # время фиксируется при создании инстанса, а не при записи: сообщения могут записываться пачками с задержкой
+    created_at = models.DateTimeField(default=timezone.now, editable=False, db_index=True)
     bot = models.ForeignKey(Bot, verbose_name='Bot', on_delete=models.CASCADE, db_index=True)
     bot_user = models.ForeignKey(BotUser, verbose_name='Bot user', on_delete=models.SET_NULL, blank=True, null=True)
     chat = models.ForeignKey(
@@ -164,3 +169,51 @@ class Message(TrackableUpdateCreateModel):
         verbose_name_plural = 'Messages'
         app_label = 'bot'
         ordering = ['-created_at', 'bot', 'bot_user']
+        index_together = (
+            # история чата и новые сообщения по ключу (created_at, id) (MessageManager.get_chat_messages)
+            ('chat', 'created_at'),
+        )
+
+
+class OutboxMessage(TrackableUpdateCreateModel):
+    """Модель для описания исходящего сообщения, ожидающего отправки на платформу.
+
+    Записывается в одной транзакции с исходящим сообщением и содержит сериализованную команду (ECTS).
+    Отправитель захватывает записи пачками с арендой (lease_token, lease_expires_at), после отправки
+    запись помечается отправленной или неудачной; записи с истёкшей арендой захватываются повторно."""
+
+    message = models.OneToOneField(
+        Message,
+        verbose_name='Message',
+        on_delete=models.CASCADE,
+        related_name='outbox',
+        blank=True,
+        null=True,
+    )
+    bot = models.ForeignKey(Bot, verbose_name='Bot', on_delete=models.CASCADE)
+    payload = models.TextField('Payload')
+    status = models.PositiveSmallIntegerField(
+        'Status',
+        choices=OutboxStatus.choices(),
+        default=OutboxStatus.PENDING.value,
+    )
+    attempts = models.PositiveSmallIntegerField('Attempts', default=0)
+    available_at = models.DateTimeField('Available at', default=timezone.now)
+    lease_token = models.CharField('Lease token', max_length=32, blank=True, null=True, db_index=True)
+    lease_expires_at = models.DateTimeField('Lease expires at', blank=True, null=True)
+    last_error = models.CharField('Last error', max_length=255, blank=True, null=True)
+    objects = OutboxMessageManager()
+
+    def __str__(self) -> str:
+        return f'#{self.id} <{self.bot}> {self.get_status_display()}'
+
+    class Meta:
+        verbose_name = 'Outbox message'
+        verbose_name_plural = 'Outbox messages'
+        app_label = 'bot'
+        ordering = ['id']
+        index_together = (
+            ('status', 'available_at'),
+            # повторный захват записей с истёкшей арендой (OutboxMessageManager.claim)
+            ('status', 'lease_expires_at'),
+        )
@@ -0,0 +1,174 @@
+"""Модуль транзакционного outbox исходящих сообщений.
+
+Исходящее сообщение и запись outbox с сериализованной командой (ECTS) сохраняются в одной транзакции,
+поэтому неотправленные ответы и уведомления переживают перезапуск и падение процесса.
+Отправитель (поток в процессе приложения или команда manage.py drain_outbox) захватывает записи пачками
+с арендой, передаёт их движку доставки и по результату помечает отправленными или неудачными.
+Несколько отправителей могут работать одновременно: запись захватывается только одним из них."""
+
+import logging
+import threading
+from functools import partial
+from typing import Any, Dict, Optional
+
+from django.db import close_old_connections, connection, transaction
+
+from clients.common import PlatformClientFactory
+from clients.delivery import DeliveryEngine, SingletonDelivery
+from common.constants import OutboxStatus
+from common.entities import EventCommandToSend
+from common.schemas import get_schema
+from patterns.singleton import Singleton
+from .constants import (OUTBOX_IN_PROCESS, OUTBOX_BATCH_SIZE, OUTBOX_POLL_INTERVAL, OUTBOX_LEASE,
+                        OUTBOX_MAX_ATTEMPTS)
+from .models import OutboxMessage
+from .querylog import profile, stage
+from .registry import BotRegistry
+
+
+logger = logging.getLogger('root')
+
+# отсрочка повторного захвата записи, которую не принял движок доставки (окно заполнено)
+RELEASE_DELAY = 1.0
+
+
+class OutboxRelay:
+    """Захватывает записи outbox пачками и передаёт их движку доставки."""
+
+    def __init__(self, engine: Optional[DeliveryEngine] = None, batch_size: int = OUTBOX_BATCH_SIZE,
+                 interval: float = OUTBOX_POLL_INTERVAL, lease: float = OUTBOX_LEASE,
+                 max_attempts: int = OUTBOX_MAX_ATTEMPTS) -> None:
+        self._engine = engine
+        self.batch_size = max(1, batch_size)
+        self.interval = interval
+        self.lease = lease
+        self.max_attempts = max_attempts
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self.claimed = 0
+        self.dispatched = 0
+        self.released = 0
+        self.abandoned = 0
+
+    @property
+    def engine(self) -> DeliveryEngine:
+        if self._engine is None:
+            self._engine = SingletonDelivery().get_engine
+        return self._engine
+
+    def start(self) -> None:
+        """Запускает фоновый поток отправителя."""
+
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self.run, name='outbox-relay', daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def wake(self) -> None:
+        """Будит отправителя, не дожидаясь очередного интервала опроса."""
+
+        self._wakeup.set()
+
+    def run(self) -> None:
+        """Цикл отправителя: разбирает outbox, пока есть готовые записи, затем ждёт пробуждения или интервала."""
+
+        try:
+            while not self._stopped.is_set():
+                close_old_connections()
+                try:
+                    drained = self.drain_once()
+                except Exception as e:
+                    logger.exception(f'Outbox drain failed: {e.args}')
+                    drained = 0
+                if drained < self.batch_size:
+                    self._wakeup.wait(self.interval)
+                    self._wakeup.clear()
+        finally:
+            connection.close()
+
+    def drain_once(self) -> int:
+        """Захватывает одну пачку записей и передаёт их движку доставки. Возвращает количество захваченных записей."""
+
+        with profile('outbox relay') as current, stage('send'):
+            token, rows = OutboxMessage.objects.claim(self.batch_size, self.lease)
+            if not rows:
+                current.discard()
+            for row in rows:
+                self._dispatch(row, token)
+        with self._lock:
+            self.claimed += len(rows)
+        return len(rows)
+
+    def _dispatch(self, row: OutboxMessage, token: str) -> None:
+        if row.attempts > self.max_attempts:
+            OutboxMessage.objects.mark_failed(row.pk, token, row.message_id, f'abandoned after {row.attempts} claims')
+            with self._lock:
+                self.abandoned += 1
+            return
+        try:
+            command = get_schema(EventCommandToSend).loads(row.payload)
+            client = PlatformClientFactory.create(BotRegistry().get_bot_type_by_id(row.bot_id))
+            delivery = client.form_delivery(command)
+        except Exception as e:
+            logger.exception(f'Outbox message #{row.pk} is malformed: {e.args}')
+            OutboxMessage.objects.mark_failed(row.pk, token, row.message_id, f'malformed: {e}')
+            return
+        delivery.on_delivered = partial(OutboxMessage.objects.mark_sent, row.pk, token, row.message_id)
+        delivery.on_failed = partial(OutboxMessage.objects.mark_failed, row.pk, token, row.message_id)
+        if self.engine.submit(delivery):
+            with self._lock:
+                self.dispatched += 1
+        else:
+            OutboxMessage.objects.release(row.pk, token, RELEASE_DELAY)
+            with self._lock:
+                self.released += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats: Dict[str, Any] = {
+                'running': self._thread is not None and self._thread.is_alive(),
+                'claimed': self.claimed,
+                'dispatched': self.dispatched,
+                'released': self.released,
+                'abandoned': self.abandoned,
+            }
+        stats['pending'] = OutboxMessage.objects.filter(status=OutboxStatus.PENDING.value).count()
+        return stats
+
+
+class SingletonOutbox(metaclass=Singleton):
+    """Класс для хранения и передачи единственного инстанса отправителя outbox процесса.
+
+    Фоновый поток отправителя запускается при старте приложения (BotConfig.ready) или при первом обращении,
+    если OUTBOX_IN_PROCESS включён."""
+
+    _relay: Optional[OutboxRelay] = None
+    _lock = threading.Lock()
+
+    @property
+    def get_relay(self) -> OutboxRelay:
+        with self._lock:
+            if self._relay is None:
+                self._relay = OutboxRelay()
+                if OUTBOX_IN_PROCESS:
+                    self._relay.start()
+        return self._relay
+
+
+def enqueue(command: EventCommandToSend) -> OutboxMessage:
+    """Записывает команду в outbox в текущей транзакции; отправитель процесса будится после её фиксации."""
+
+    row = OutboxMessage.objects.enqueue(command)
+    if OUTBOX_IN_PROCESS:
+        transaction.on_commit(lambda: SingletonOutbox().get_relay.wake())
+    return row
@@ -0,0 +1,28 @@
+"""Модуль курсоров пагинации по ключу.
+
+Курсор - непрозрачная для клиента строка с ключом последней записи страницы (время, id),
+следующая страница начинается после этой записи."""
+
+import base64
+import binascii
+from datetime import datetime
+from typing import Optional, Tuple
+
+
+Key = Tuple[Optional[datetime], int]
+
+
+def encode_cursor(moment: Optional[datetime], pk: int) -> str:
+    raw = f'{moment.isoformat() if moment is not None else ""}|{pk}'
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str) -> Key:
+    """Разбирает курсор; при некорректном курсоре поднимает ValueError."""
+
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+    except (binascii.Error, UnicodeDecodeError) as err:
+        raise ValueError(f'Malformed cursor: {cursor!r}') from err
+    moment, _, pk = raw.rpartition('|')
+    return (datetime.fromisoformat(moment) if moment else None), int(pk)
@@ -0,0 +1,184 @@
+"""Модуль отложенной (write-behind) записи сообщений.
+
+Входящие сообщения и обновления активности чатов (last_message_time/last_message_text) накапливаются
+в буфере и записываются в базу пачками: одним bulk_create для сообщений и одним bulk_update для чатов -
+по достижении размера пачки или по истечении интервала."""
+
+import atexit
+import logging
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from django.db import close_old_connections, connection, transaction
+from django.utils import timezone
+
+from patterns.singleton import Singleton
+from .constants import MESSAGE_BATCH_SIZE, MESSAGE_FLUSH_INTERVAL
+from .feed import MessageFeed
+from .models import Chat, Message
+
+
+logger = logging.getLogger('root')
+
+
+class MessageWriteBuffer:
+    """Буфер несохранённых сообщений и обновлений чатов с фоновым сбросом в базу."""
+
+    def __init__(self, batch_size: int = MESSAGE_BATCH_SIZE, interval: float = MESSAGE_FLUSH_INTERVAL) -> None:
+        self.batch_size = max(1, batch_size)
+        self.interval = interval
+        # при недоступности базы буфер не должен расти бесконечно
+        self.max_pending = self.batch_size * 10
+        self._messages: List[Message] = []
+        self._chats: Dict[int, Tuple[datetime, Optional[str]]] = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.flushes = 0
+        self.flushed_messages = 0
+        self.flushed_chats = 0
+        self.dropped = 0
+        self.flush_time = 0.0
+
+    def start(self) -> None:
+        """Запускает фоновый поток периодического сброса буфера."""
+
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name='message-write-buffer', daemon=True)
+            self._thread.start()
+        atexit.register(self.flush)
+
+    def add_message(self, message: Message) -> None:
+        """Ставит несохранённое сообщение в очередь на запись."""
+
+        with self._lock:
+            self._messages.append(message)
+            full = len(self._messages) >= self.batch_size
+        if full:
+            self._wakeup.set()
+
+    def touch_chat(self, chat_id: int, message_time: datetime, message_text: Optional[str]) -> None:
+        """Запоминает последнее сообщение чата; несколько обновлений одного чата схлопываются в одно."""
+
+        with self._lock:
+            current = self._chats.get(chat_id)
+            if current is None or current[0] <= message_time:
+                self._chats[chat_id] = (message_time, message_text)
+
+    def _run(self) -> None:
+        try:
+            while True:
+                self._wakeup.wait(self.interval)
+                self._wakeup.clear()
+                close_old_connections()
+                self.flush()
+        finally:
+            connection.close()
+
+    def flush(self) -> int:
+        """Записывает накопленные сообщения и обновления чатов. Возвращает количество записанных сообщений."""
+
+        with self._flush_lock:
+            with self._lock:
+                messages, self._messages = self._messages, []
+                chats, self._chats = self._chats, {}
+            if not messages and not chats:
+                return 0
+
+            started = time.monotonic()
+            try:
+                with transaction.atomic():
+                    Message.objects.bulk_create(messages, batch_size=self.batch_size)
+                    self._update_chats(chats)
+            except Exception as e:
+                logger.exception(f'Message write-behind flush failed: {e.args}')
+                self._restore(messages, chats)
+                return 0
+
+            MessageFeed().publish({message.chat_id for message in messages})
+            with self._lock:
+                self.flushes += 1
+                self.flushed_messages += len(messages)
+                self.flushed_chats += len(chats)
+                self.flush_time += time.monotonic() - started
+            return len(messages)
+
+    def flush_chat(self, chat_id: int) -> int:
+        """Записывает накопленные сообщения одного чата, остальные остаются в буфере.
+        Возвращает количество записанных сообщений."""
+
+        with self._flush_lock:
+            with self._lock:
+                messages = [message for message in self._messages if message.chat_id == chat_id]
+                if not messages:
+                    return 0
+                self._messages = [message for message in self._messages if message.chat_id != chat_id]
+
+            try:
+                Message.objects.bulk_create(messages)
+            except Exception as e:
+                logger.exception(f'Message write-behind flush failed: {e.args}')
+                self._restore(messages, {})
+                return 0
+
+            MessageFeed().publish((chat_id,))
+            with self._lock:
+                self.flushed_messages += len(messages)
+            return len(messages)
+
+    @staticmethod
+    def _update_chats(chats: Dict[int, Tuple[datetime, Optional[str]]]) -> None:
+        now = timezone.now()
+        objs = [
+            Chat(pk=chat_id, last_message_time=message_time, last_message_text=message_text, updated_at=now)
+            for chat_id, (message_time, message_text) in chats.items()
+        ]
+        Chat.objects.bulk_update(objs, ['last_message_time', 'last_message_text', 'updated_at'])
+
+    def _restore(self, messages: List[Message], chats: Dict[int, Tuple[datetime, Optional[str]]]) -> None:
+        """Возвращает в буфер пачку, которую не удалось записать, отбрасывая самые старые записи сверх лимита."""
+
+        with self._lock:
+            self._messages = messages + self._messages
+            overflow = len(self._messages) - self.max_pending
+            if overflow > 0:
+                self._messages = self._messages[overflow:]
+                self.dropped += overflow
+                logger.error(f'Message write-behind buffer overflow, dropped {overflow} messages')
+            for chat_id, (message_time, message_text) in chats.items():
+                if chat_id not in self._chats:
+                    self._chats[chat_id] = (message_time, message_text)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'pending_messages': len(self._messages),
+                'pending_chats': len(self._chats),
+                'flushes': self.flushes,
+                'flushed_messages': self.flushed_messages,
+                'flushed_chats': self.flushed_chats,
+                'dropped': self.dropped,
+                'flush_time_avg': self.flush_time / self.flushes if self.flushes else 0.0,
+            }
+
+
+class SingletonWriteBuffer(metaclass=Singleton):
+    """Класс для хранения и передачи единственного инстанса буфера записи сообщений.
+
+    Буфер создаётся и запускается при первом обращении."""
+
+    _buffer: Optional[MessageWriteBuffer] = None
+    _lock = threading.Lock()
+
+    @property
+    def get_buffer(self) -> MessageWriteBuffer:
+        with self._lock:
+            if self._buffer is None:
+                self._buffer = MessageWriteBuffer()
+                self._buffer.start()
+        return self._buffer
@@ -0,0 +1,186 @@
+"""Модуль асинхронной обработки входящих вебхуков.
+
+Вью только разбирает вебхук в ECR и ставит его в ограниченную очередь, после чего сразу отвечает 200 ОК.
+Пул воркеров разбирает очередь: сообщения одного чата (bot_id, chat_id_in_messenger) всегда попадают
+в одну и ту же очередь-шард и обрабатываются строго по порядку поступления. Если очередь чата переполнена,
+команда не обрабатывается в обход неё (это нарушило бы порядок): вью отвечает 503, и платформа повторяет вебхук."""
+
+import logging
+import queue
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Callable, Deque, Dict, List, Optional
+
+from django.db import close_old_connections, connection
+
+from common.entities import EventCommandReceived
+from patterns.singleton import Singleton
+from .constants import WEBHOOK_QUEUE_SIZE, WEBHOOK_WORKERS
+from .handlers import process_event
+from .querylog import profile
+
+
+logger = logging.getLogger('root')
+
+EventProcessor = Callable[[int, EventCommandReceived], None]
+
+
+@dataclass
+class WebhookJob:
+    """Задание на обработку входящей команды: тип платформы, сама команда и время постановки в очередь."""
+
+    bot_type: int
+    event: EventCommandReceived
+    enqueued_at: float = field(default_factory=time.monotonic)
+
+
+class WebhookPipeline:
+    """Ограниченная очередь входящих команд с пулом воркеров.
+
+    Каждому воркеру соответствует собственная очередь-шард, номер шарда вычисляется по ключу
+    (bot_id, chat_id_in_messenger), поэтому порядок сообщений внутри чата сохраняется."""
+
+    _stop_marker: Any = object()
+
+    def __init__(self, processor: EventProcessor, workers: int = WEBHOOK_WORKERS,
+                 maxsize: int = WEBHOOK_QUEUE_SIZE) -> None:
+        self._processor = processor
+        self._workers = max(1, workers)
+        shard_size = max(1, maxsize // self._workers)
+        self._queues: List['queue.Queue[Any]'] = [queue.Queue(maxsize=shard_size) for _ in range(self._workers)]
+        self._threads: List[threading.Thread] = []
+        self._lock = threading.Lock()
+        self._waits: Deque[float] = deque(maxlen=1024)
+        self._wait_max = 0.0
+        self._wait_total = 0.0
+        self.enqueued = 0
+        self.processed = 0
+        self.failed = 0
+        self.rejected = 0
+
+    @property
+    def running(self) -> bool:
+        return any(thread.is_alive() for thread in self._threads)
+
+    def start(self) -> None:
+        """Запускает воркеры, если они ещё не запущены."""
+
+        with self._lock:
+            if self.running:
+                return
+            self._threads = [
+                threading.Thread(target=self._work, args=(q,), name=f'webhook-worker-{i}', daemon=True)
+                for i, q in enumerate(self._queues)
+            ]
+            for thread in self._threads:
+                thread.start()
+        logger.info(f'Webhook pipeline started: {self._workers} workers')
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """Останавливает воркеры после обработки уже поставленных в очередь заданий."""
+
+        for q in self._queues:
+            q.put(self._stop_marker)
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def _shard(self, event: EventCommandReceived) -> 'queue.Queue[Any]':
+        return self._queues[hash((event.bot_id, event.chat_id_in_messenger)) % self._workers]
+
+    def submit(self, bot_type: int, event: EventCommandReceived, timeout: float = 0.0) -> bool:
+        """Ставит команду в очередь её чата, ожидая места не дольше timeout секунд.
+        Возвращает False, если очередь так и не освободилась."""
+
+        try:
+            self._shard(event).put(WebhookJob(bot_type, event), block=timeout > 0,
+                                   timeout=timeout if timeout > 0 else None)
+        except queue.Full:
+            with self._lock:
+                self.rejected += 1
+            logger.warning(f'Webhook queue is full, chat: {event.chat_id_in_messenger}')
+            return False
+        with self._lock:
+            self.enqueued += 1
+        return True
+
+    def join(self) -> None:
+        """Блокирует вызывающий поток до обработки всех поставленных заданий."""
+
+        for q in self._queues:
+            q.join()
+
+    def _work(self, jobs: 'queue.Queue[Any]') -> None:
+        try:
+            while True:
+                job = jobs.get()
+                try:
+                    if job is self._stop_marker:
+                        return
+                    self._run(job)
+                finally:
+                    jobs.task_done()
+        finally:
+            connection.close()
+
+    def _run(self, job: WebhookJob) -> None:
+        wait = time.monotonic() - job.enqueued_at
+        close_old_connections()
+        try:
+            with profile('webhook worker'):
+                self._processor(job.bot_type, job.event)
+            failed = False
+        except Exception as e:
+            # воркер не должен падать из-за ошибки в обработке отдельного сообщения
+            logger.exception(f'Webhook processing failed, chat {job.event.chat_id_in_messenger}: {e.args}')
+            failed = True
+        finally:
+            close_old_connections()
+
+        with self._lock:
+            self._waits.append(wait)
+            self._wait_total += wait
+            self._wait_max = max(self._wait_max, wait)
+            if failed:
+                self.failed += 1
+            else:
+                self.processed += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Возвращает глубину очереди и статистику времени ожидания заданий (в секундах)."""
+
+        with self._lock:
+            waits = sorted(self._waits)
+            handled = self.processed + self.failed
+            return {
+                'workers': self._workers,
+                'running': self.running,
+                'depth': sum(q.qsize() for q in self._queues),
+                'depth_by_worker': [q.qsize() for q in self._queues],
+                'enqueued': self.enqueued,
+                'processed': self.processed,
+                'failed': self.failed,
+                'rejected': self.rejected,
+                'wait_avg': self._wait_total / handled if handled else 0.0,
+                'wait_p95': waits[int(len(waits) * 0.95)] if waits else 0.0,
+                'wait_max': self._wait_max,
+            }
+
+
+class SingletonPipeline(metaclass=Singleton):
+    """Класс для хранения и передачи единственного инстанса очереди вебхуков.
+
+    Очередь создаётся и запускается при первом обращении."""
+
+    _pipeline: Optional[WebhookPipeline] = None
+    _lock = threading.Lock()
+
+    @property
+    def get_pipeline(self) -> WebhookPipeline:
+        with self._lock:
+            if self._pipeline is None:
+                self._pipeline = WebhookPipeline(process_event)
+                self._pipeline.start()
+        return self._pipeline
@@ -0,0 +1,242 @@
+"""Модуль учёта запросов к базе данных.
+
+Профиль (profile) считает запросы, выполненные в потоке за время блока: их количество, суммарное время
+и самый медленный запрос. Запросы распределяются по этапам обработки (stage): parse - разбор вебхука,
+handler - хендлер, dialog - логика диалога, persist - запись сообщений и outbox, send - отправка из outbox.
+Запрос относится к самому внутреннему открытому этапу, поэтому этапы не пересекаются.
+
+Профили запросов к приложению (QueryProfileMiddleware), заданий очереди вебхуков и пачек outbox
+записываются в лог и в кольцевой буфер QueryLog, сводка по которому отдаётся в /stats/.
+Вне профиля этапы ничего не считают."""
+
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Callable, Deque, Dict, Iterator, List, Optional
+
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+from django.http import HttpRequest, HttpResponse
+
+from patterns.singleton import Singleton
+from .constants import QUERY_BUDGET, QUERY_LOG_SIZE, QUERY_PROFILE
+
+
+logger = logging.getLogger('root')
+
+# запросы вне этапов
+NO_STAGE = '-'
+
+
+class StageStats:
+    """Количество и суммарное время запросов одного этапа."""
+
+    __slots__ = ('queries', 'sql_time')
+
+    def __init__(self) -> None:
+        self.queries = 0
+        self.sql_time = 0.0
+
+
+class QueryProfile:
+    """Запросы к базе, выполненные потоком за время профиля."""
+
+    def __init__(self, label: str) -> None:
+        self.label = label
+        self.queries = 0
+        self.sql_time = 0.0
+        self.duration = 0.0
+        self.slowest_sql: Optional[str] = None
+        self.slowest_time = 0.0
+        self.stages: Dict[str, StageStats] = {}
+        self.discarded = False
+
+    def record(self, stage: str, sql: str, elapsed: float) -> None:
+        self.queries += 1
+        self.sql_time += elapsed
+        stats = self.stages.get(stage)
+        if stats is None:
+            stats = self.stages[stage] = StageStats()
+        stats.queries += 1
+        stats.sql_time += elapsed
+        if elapsed >= self.slowest_time:
+            self.slowest_sql, self.slowest_time = sql, elapsed
+
+    def stage_queries(self, stage: str) -> int:
+        stats = self.stages.get(stage)
+        return stats.queries if stats is not None else 0
+
+    def discard(self) -> None:
+        """Не записывать профиль в лог и буфер (например, пустой опрос outbox)."""
+
+        self.discarded = True
+
+    def report(self) -> Dict[str, Any]:
+        return {
+            'label': self.label,
+            'queries': self.queries,
+            'sql_ms': round(self.sql_time * 1000, 3),
+            'duration_ms': round(self.duration * 1000, 3),
+            'slowest_ms': round(self.slowest_time * 1000, 3),
+            'slowest_sql': self.slowest_sql[:500] if self.slowest_sql else None,
+            'stages': {
+                name: {'queries': stats.queries, 'sql_ms': round(stats.sql_time * 1000, 3)}
+                for name, stats in self.stages.items()
+            },
+        }
+
+    def __str__(self) -> str:
+        stages = ', '.join(f'{name}={stats.queries}' for name, stats in self.stages.items())
+        return (f'{self.label}: {self.queries} queries, {self.sql_time * 1000:.1f} ms SQL '
+                f'of {self.duration * 1000:.1f} ms [{stages}]; slowest {self.slowest_time * 1000:.1f} ms: '
+                f'{(self.slowest_sql or "")[:200]}')
+
+
+class QueryLog(metaclass=Singleton):
+    """Кольцевой буфер последних профилей процесса."""
+
+    def __init__(self, size: int = QUERY_LOG_SIZE) -> None:
+        self._profiles: Deque[QueryProfile] = deque(maxlen=max(1, size))
+        self._lock = threading.Lock()
+        self.recorded = 0
+        self.over_budget = 0
+
+    def add(self, profile: QueryProfile) -> None:
+        with self._lock:
+            self._profiles.append(profile)
+            self.recorded += 1
+            if profile.queries > QUERY_BUDGET:
+                self.over_budget += 1
+
+    def recent(self) -> List[QueryProfile]:
+        with self._lock:
+            return list(self._profiles)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._profiles.clear()
+            self.recorded = 0
+            self.over_budget = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """Сводка по профилям буфера: по каждой метке - среднее и максимальное количество запросов и время SQL."""
+
+        profiles = self.recent()
+        labels: Dict[str, Dict[str, Any]] = {}
+        for profile in profiles:
+            entry = labels.setdefault(profile.label, {'count': 0, 'queries': 0, 'queries_max': 0, 'sql_ms': 0.0,
+                                                      'stages': {}})
+            entry['count'] += 1
+            entry['queries'] += profile.queries
+            entry['queries_max'] = max(entry['queries_max'], profile.queries)
+            entry['sql_ms'] += profile.sql_time * 1000
+            for name, stats in profile.stages.items():
+                entry['stages'][name] = entry['stages'].get(name, 0) + stats.queries
+        by_label = {
+            label: {
+                'count': entry['count'],
+                'queries_avg': round(entry['queries'] / entry['count'], 2),
+                'queries_max': entry['queries_max'],
+                'sql_ms_avg': round(entry['sql_ms'] / entry['count'], 3),
+                'stage_queries_avg': {
+                    name: round(queries / entry['count'], 2) for name, queries in entry['stages'].items()
+                },
+            }
+            for label, entry in labels.items()
+        }
+        slowest = max(profiles, key=lambda profile: profile.slowest_time, default=None)
+        return {
+            'size': len(profiles),
+            'recorded': self.recorded,
+            'budget': QUERY_BUDGET,
+            'over_budget': self.over_budget,
+            'by_label': by_label,
+            'slowest': slowest.report() if slowest is not None else None,
+        }
+
+
+_local = threading.local()
+
+
+def _profiles() -> List[QueryProfile]:
+    profiles: Optional[List[QueryProfile]] = getattr(_local, 'profiles', None)
+    if profiles is None:
+        profiles = _local.profiles = []
+        _local.stages = []
+    return profiles
+
+
+def _record_query(execute: Callable[..., Any], sql: str, params: Any, many: bool, context: Dict[str, Any]) -> Any:
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed = time.perf_counter() - started
+        stage_name = _local.stages[-1] if _local.stages else NO_STAGE
+        for profile in _local.profiles:
+            profile.record(stage_name, sql, elapsed)
+
+
+@contextmanager
+def profile(label: str, record: bool = True) -> Iterator[QueryProfile]:
+    """Считает запросы потока за время блока. При record профиль пишется в лог и в QueryLog.
+
+    Профили могут быть вложенными: запрос учитывается во всех открытых профилях потока."""
+
+    profiles = _profiles()
+    current = QueryProfile(label)
+    profiles.append(current)
+    started = time.perf_counter()
+    try:
+        if len(profiles) == 1:
+            with connection.execute_wrapper(_record_query):
+                yield current
+        else:
+            yield current
+    finally:
+        current.duration = time.perf_counter() - started
+        profiles.remove(current)
+        if record and not current.discarded:
+            if current.queries > QUERY_BUDGET:
+                logger.warning(f'Query budget {QUERY_BUDGET} exceeded: {current}')
+            else:
+                logger.info(f'Queries {current}')
+            QueryLog().add(current)
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """Относит запросы блока к этапу name. Используется и как декоратор."""
+
+    if not getattr(_local, 'profiles', None):
+        yield
+        return
+    _local.stages.append(name)
+    try:
+        yield
+    finally:
+        _local.stages.pop()
+
+
+class QueryProfileMiddleware:
+    """Профилирует запросы к базе каждого запроса к приложению. Отключается настройкой QUERY_PROFILE.
+
+    Метка профиля - шаблон маршрута (например, chats/<int:pk>/messages/), а не путь, чтобы сводка
+    QueryLog группировала запросы к одному вью."""
+
+    def __init__(self, get_response: Callable[[HttpRequest], HttpResponse]) -> None:
+        if not QUERY_PROFILE:
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+
+    def __call__(self, request: HttpRequest) -> HttpResponse:
+        with profile(request.path) as current:
+            response = self.get_response(request)
+            match = getattr(request, 'resolver_match', None)
+            if match is not None and match.route:
+                current.label = f'{request.method} {match.route}'
+            else:
+                current.label = f'{request.method} {request.path}'
+        return response
@@ -0,0 +1,106 @@
+"""Модуль реестра ботов процесса.
+
+Реестр загружает все боты одним запросом и отвечает на вопросы "id бота по типу платформы"
+и "тип/имя/учётные данные бота по id" из памяти. Перестраивается при сохранении или удалении Bot
+(см. bot.signals), а также по истечении BOT_REGISTRY_TTL - чтобы подхватить изменения из других процессов."""
+
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, Mapping, Optional
+
+from common.constants import BotType
+from patterns.singleton import Singleton
+from .constants import BOT_REGISTRY_TTL
+from .models import Bot
+
+
+logger = logging.getLogger('root')
+
+# учётные данные платформ задаются переменными окружения и общие для всех ботов одного типа:
+# тип бота -> (имя учётных данных -> переменная окружения)
+PLATFORM_CREDENTIALS: Dict[int, Mapping[str, str]] = {
+    BotType.TYPE_OK.value: {'token': 'OK_TOKEN'},
+    BotType.TYPE_JIVOSITE.value: {'key': 'JIVO_WH_KEY', 'token': 'JIVO_TOKEN'},
+}
+
+
+def platform_credentials(bot_type: int) -> Dict[str, Optional[str]]:
+    """Читает учётные данные платформы из окружения в момент вызова (при каждой загрузке реестра),
+    а не при импорте модуля - до загрузки .env."""
+
+    return {name: os.getenv(variable) for name, variable in PLATFORM_CREDENTIALS.get(bot_type, {}).items()}
+
+
+@dataclass(frozen=True)
+class BotEntry:
+    """Неизменяемая запись реестра о боте."""
+
+    id: int
+    bot_type: int
+    name: str
+    credentials: Mapping[str, Optional[str]] = field(default_factory=dict, compare=False)
+
+
+class BotRegistry(metaclass=Singleton):
+    """Отображения тип платформы -> id бота и id бота -> BotEntry, загружаемые один раз на процесс."""
+
+    def __init__(self) -> None:
+        self._by_id: Dict[int, BotEntry] = {}
+        self._by_type: Dict[int, int] = {}
+        self._loaded_at: Optional[float] = None
+        self._lock = threading.Lock()
+        self.loads = 0
+
+    def _ensure_loaded(self) -> None:
+        loaded_at = self._loaded_at
+        if loaded_at is not None and time.monotonic() - loaded_at < BOT_REGISTRY_TTL:
+            return
+        with self._lock:
+            if self._loaded_at is loaded_at:
+                self._load()
+
+    def _load(self) -> None:
+        by_id: Dict[int, BotEntry] = {}
+        by_type: Dict[int, int] = {}
+        for bot_id, bot_type, name in Bot.objects.order_by('id').values_list('id', 'bot_type', 'name'):
+            by_id[bot_id] = BotEntry(bot_id, bot_type, name, platform_credentials(bot_type))
+            if bot_type in by_type:
+                logger.warning(f'Several bots of type {bot_type}, webhooks are routed to #{by_type[bot_type]}')
+            else:
+                by_type[bot_type] = bot_id
+        # новые словари подменяются целиком, читатели без блокировки видят либо старое, либо новое состояние
+        self._by_id, self._by_type = by_id, by_type
+        self._loaded_at = time.monotonic()
+        self.loads += 1
+
+    def invalidate(self) -> None:
+        """Помечает реестр устаревшим, он будет перестроен при следующем обращении."""
+
+        with self._lock:
+            self._loaded_at = None
+
+    def get(self, bot_id: int) -> BotEntry:
+        self._ensure_loaded()
+        try:
+            return self._by_id[bot_id]
+        except KeyError:
+            raise Bot.DoesNotExist(f'Bot #{bot_id} does not exist')
+
+    def get_bot_id_by_type(self, bot_type: int) -> int:
+        self._ensure_loaded()
+        try:
+            return self._by_type[bot_type]
+        except KeyError:
+            raise Bot.DoesNotExist(f'Bot of type {bot_type} does not exist')
+
+    def get_bot_type_by_id(self, bot_id: int) -> int:
+        return self.get(bot_id).bot_type
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'bots': len(self._by_id),
+            'loads': self.loads,
+        }
@@ -0,0 +1,98 @@
+"""Модуль кэша готовых экранов диалога.
+
+Экраны просмотра каталога (приветствие, список категорий, список товаров категории, карточка товара,
+подтверждение заказа) одинаковы для всех пользователей, кроме bot_id и chat_id_in_messenger.
+Поэтому текст экрана и кнопки с уже сериализованными Callback строятся один раз на ключ
+(CallbackType, id, курсор страницы, язык), а для каждого ответа в них подставляются только поля конкретного чата.
+
+Кэш сбрасывается при переходе на более новую версию снимка каталога (shop.catalog). Фразы диалога читаются
+из common/strings.ini один раз при запуске процесса (common.strings), поэтому их изменение требует перезапуска."""
+
+import threading
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+from common.builders import MessageDirector
+from common.cache import LRUCache
+from common.constants import GenericTemplateActionType, MessageContentType, MessageDirection
+from common.entities import EventCommandToSend, GenericTemplateAction, InlineButton, Payload
+from patterns.singleton import Singleton
+from .constants import SCREEN_CACHE_SIZE
+
+
+DEFAULT_LANGUAGE = 'ru'
+
+
+@dataclass(frozen=True)
+class Screen:
+    """Шаблон экрана: текст и кнопки (заголовок, payload) без привязки к чату."""
+
+    text: str
+    content_type: MessageContentType
+    buttons: Tuple[Tuple[str, Optional[str]], ...] = ()
+
+    def stamp(self, bot_id: int, chat_id_in_messenger: str, **text_args: Any) -> EventCommandToSend:
+        """Собирает новый ECTS для чата; при переданных text_args текст шаблона форматируется ими."""
+
+        payload = Payload()
+        payload.direction = MessageDirection.SENT
+        payload.text = self.text.format(**text_args) if text_args else self.text
+        cmd = EventCommandToSend(bot_id, chat_id_in_messenger, self.content_type, payload)
+        if self.content_type == MessageContentType.INLINE:
+            cmd.inline_buttons = [
+                InlineButton(title, GenericTemplateAction(GenericTemplateActionType.POSTBACK, payload=action_payload))
+                for title, action_payload in self.buttons
+            ]
+        return cmd
+
+
+def build_screen(text: str, button_data: Optional[List[Dict[str, Any]]] = None) -> Screen:
+    """Строит шаблон экрана тем же построителем, что и обычные ответы, чтобы формат кнопок совпадал."""
+
+    ects = MessageDirector().create_ects(0, '', text, button_data)
+    buttons = tuple((button.text, button.action.payload) for button in ects.inline_buttons or ())
+    return Screen(text, ects.content_type, buttons)
+
+
+class ScreenCache(metaclass=Singleton):
+    """Хранит шаблоны экранов процесса, привязанные к версии снимка каталога."""
+
+    def __init__(self) -> None:
+        self.screens: LRUCache[Hashable, Screen] = LRUCache(SCREEN_CACHE_SIZE)
+        self._version: Optional[int] = None
+        self._lock = threading.Lock()
+        self.invalidations = 0
+
+    def get(self, key: Hashable, catalog_version: int, build: Callable[[], Screen]) -> Screen:
+        """Возвращает шаблон экрана по ключу, строя его через build при промахе.
+
+        catalog_version = 0 означает, что снимок каталога недоступен: экран строится без кэширования,
+        как и для запроса, получившего снимок старее текущей версии кэша."""
+
+        if not catalog_version:
+            return build()
+        if catalog_version != self._version:
+            with self._lock:
+                # кэш очищается один раз на версию: запрос со старым снимком не сбрасывает экраны новой версии
+                if self._version is None or catalog_version > self._version:
+                    self.screens.clear()
+                    self._version = catalog_version
+                    self.invalidations += 1
+                elif catalog_version < self._version:
+                    return build()
+        # версия входит в ключ: экран, построенный по старому снимку параллельным запросом, не будет выдан
+        screen = self.screens.get((catalog_version, key))
+        if screen is None:
+            screen = build()
+            self.screens.set((catalog_version, key), screen)
+        return screen
+
+    def clear(self) -> None:
+        with self._lock:
+            self.screens.clear()
+            self._version = None
+
+    def stats(self) -> Dict[str, Any]:
+        stats = self.screens.stats()
+        stats['invalidations'] = self.invalidations
+        return stats
@@ -0,0 +1,26 @@
+"""Модуль обработчиков сигналов моделей бота."""
+
+from typing import Any
+
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .identity import IdentityCache
+from .models import Bot, BotUser, Chat
+from .registry import BotRegistry
+
+
+@receiver(post_delete, sender=BotUser)  # type: ignore
+def forget_bot_user(sender: Any, instance: BotUser, **kwargs: Any) -> None:
+    IdentityCache().users.delete((instance.bot_id, instance.messenger_user_id))
+
+
+@receiver(post_delete, sender=Chat)  # type: ignore
+def forget_chat(sender: Any, instance: Chat, **kwargs: Any) -> None:
+    IdentityCache().chats.delete((instance.bot_id, instance.id_in_messenger))
+
+
+@receiver(post_save, sender=Bot)  # type: ignore
+@receiver(post_delete, sender=Bot)  # type: ignore
+def refresh_bot_registry(sender: Any, instance: Bot, **kwargs: Any) -> None:
+    BotRegistry().invalidate()
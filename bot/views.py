@@ -1,15 +1,38 @@
-from django.http import HttpRequest, HttpResponse
+from django.contrib.admin.views.decorators import staff_member_required
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpRequest, HttpResponse, HttpResponseBadRequest, JsonResponse, StreamingHttpResponse
 from django.shortcuts import render
 # чтобы разрешить кросс-сайт POST запросы
 from django.views.decorators.csrf import csrf_exempt
 from django.db import IntegrityError
-from typing import List, Dict, Any, Optional
+from datetime import datetime
+from typing import Iterator, List, Dict, Any, Optional, Tuple
 from marshmallow.exceptions import ValidationError
+import json
 import logging
+import math
+import time
 
+from clients.commands import SingletonCommandStore
+from clients.delivery import SingletonDelivery
 from common.constants import BotType
-from common.entities import EventCommandReceived, EventCommandToSend
-from .handlers import message_handler
+from common.entities import EventCommandReceived
+from .constants import (WEBHOOK_ASYNC, WEBHOOK_QUEUE_TIMEOUT, MESSAGE_WRITE_BEHIND, CHAT_PAGE_SIZE, CHAT_PAGE_SIZE_MAX,
+                        MESSAGE_PAGE_SIZE, MESSAGE_PAGE_SIZE_MAX, MESSAGE_LONG_POLL_MAX, MESSAGE_LONG_POLL_WAIT,
+                        MESSAGE_FEED_RECHECK, MESSAGE_STREAM_DURATION)
+from .archive import MessageArchive
+from .feed import MessageFeed, Watch
+from .handlers import process_event
+from .identity import IdentityCache
+from .outbox import SingletonOutbox
+from .pagination import decode_cursor, encode_cursor
+from .persistence import SingletonWriteBuffer
+from .pipeline import SingletonPipeline
+from .querylog import QueryLog, stage
+from .registry import BotRegistry
+from .screens import ScreenCache
+from shop.catalog import CatalogStore
+from shop.search import ProductSearch
 from clients.common import PlatformClientFactory
 from .models import Chat, Message
 
@@ -17,12 +40,34 @@ from .models import Chat, Message
 logger = logging.getLogger('root')
 
 
+def _dispatch(bot_type: int, event: EventCommandReceived) -> bool:
+    """Передаёт команду на обработку: в очередь вебхуков в режиме WEBHOOK_ASYNC, иначе - сразу в хендлер.
+
+    Если очередь чата не освободилась за WEBHOOK_QUEUE_TIMEOUT секунд, возвращает False: обработка в обход очереди
+    нарушила бы порядок сообщений чата, поэтому команда не принимается и платформа повторит вебхук."""
+
+    if WEBHOOK_ASYNC:
+        return SingletonPipeline().get_pipeline.submit(bot_type, event, WEBHOOK_QUEUE_TIMEOUT)
+    process_event(bot_type, event)
+    return True
+
+
+def _busy() -> HttpResponse:
+    """Ответ платформе при переполнении очереди вебхуков: 503 с предложением повторить позже."""
+
+    response = HttpResponse('Busy', status=503)
+    response['Retry-After'] = str(max(1, math.ceil(WEBHOOK_QUEUE_TIMEOUT)))
+    return response
+
+
 @csrf_exempt  # type: ignore
 def ok_webhook(request: HttpRequest) -> HttpResponse:
     """Обрабатывает входящие вебхуки со стороны OK и возвращает 200 ОК.
 
     Проводит верификацию хоста (?), проводит парсинг в ECR,
-    направляет в хендлер для получения ответа и отсылает обратно клиенту при удаче."""
+    направляет в хендлер для получения ответа и отсылает обратно клиенту при удаче.
+    В режиме WEBHOOK_ASYNC обработка выполняется воркерами очереди уже после ответа платформе,
+    при переполнении очереди чата возвращает 503."""
 
     client = PlatformClientFactory.create(BotType.TYPE_OK.value)
 
@@ -30,11 +75,11 @@ def ok_webhook(request: HttpRequest) -> HttpResponse:
     # todo doesn't work yet due to ngrok
     logger.debug(f'verified: {client.verify_request(request)}')
     try:
-        event: EventCommandReceived = client.parse_webhook(request)
+        with stage('parse'):
+            event: EventCommandReceived = client.parse_webhook(request)
         logger.debug(event)
-        result: Optional[EventCommandToSend] = message_handler(event)
-        if result is not None:
-            client.send_message(result)
+        if not _dispatch(BotType.TYPE_OK.value, event):
+            return _busy()
     except ValidationError as e:
         logger.error(f'OK webhook: {e.args}')
     except IntegrityError as e:
@@ -48,50 +93,196 @@ def ok_webhook(request: HttpRequest) -> HttpResponse:
 def jivo_webhook(request: HttpRequest) -> HttpResponse:
     """Обрабатывает входящие вебхуки со стороны JivoSite и возвращает 200 ОК.
 
-    Проводит парсинг в ECR, направляет в хендлер для получения ответа и отсылает обратно клиенту при удаче."""
+    Проводит парсинг в ECR, направляет в хендлер для получения ответа и отсылает обратно клиенту при удаче.
+    В режиме WEBHOOK_ASYNC обработка выполняется воркерами очереди уже после ответа платформе,
+    при переполнении очереди чата возвращает 503."""
 
     logger.debug(f'"inc jivo wh from: {request.get_host()}')
     client = PlatformClientFactory.create(BotType.TYPE_JIVOSITE.value)
     try:
-        event: EventCommandReceived = client.parse_webhook(request)
+        with stage('parse'):
+            event: EventCommandReceived = client.parse_webhook(request)
         if not event:
             return HttpResponse('OK')
         logger.debug(event)
-        result: Optional[EventCommandToSend] = message_handler(event)
-        if result is not None:
-            client.send_message(result)
+        if not _dispatch(BotType.TYPE_JIVOSITE.value, event):
+            return _busy()
     except ValidationError as e:
         logger.error(f'JIVO webhook: {e.args}')
 
     return HttpResponse('OK')
 
 
+def _message_data(message: Message) -> Dict[str, Any]:
+    return {
+        'number': message.pk,
+        'content': message.text,
+        'direction': bool(message.direction % 2),
+        'time': message.created_at,
+    }
+
+
+def _message_cursor(message: Message) -> str:
+    return encode_cursor(message.created_at, message.pk)
+
+
+def _decode_message_cursor(cursor: Optional[str]) -> Optional[Tuple[datetime, int]]:
+    """Разбирает курсор сообщения (created_at, id); пустой курсор - None, некорректный - ValueError."""
+
+    if not cursor:
+        return None
+    moment, pk = decode_cursor(cursor)
+    if moment is None:
+        raise ValueError(f'Malformed cursor: {cursor!r}')
+    return moment, pk
+
+
 def chat_view(request: HttpRequest, pk: Optional[int] = None) -> HttpResponse:
-    """Отображает список проведённых чатов и содержимое просматриваемого чата."""
+    """Отображает список проведённых чатов и содержимое просматриваемого чата.
+
+    Список чатов выводится страницами по CHAT_PAGE_SIZE (параметр size, не более CHAT_PAGE_SIZE_MAX),
+    следующая страница запрашивается по курсору (параметр after). С параметром format=json
+    возвращается только страница списка чатов и курсор следующей страницы."""
+
+    try:
+        size = min(max(int(request.GET.get('size', CHAT_PAGE_SIZE)), 1), CHAT_PAGE_SIZE_MAX)
+        after = request.GET.get('after')
+        page = Chat.objects.page(decode_cursor(after) if after else None, size + 1)
+    except ValueError as e:
+        return HttpResponseBadRequest(f'Bad page parameters: {e}')
+    next_cursor = encode_cursor(page[size - 1].last_message_time, page[size - 1].pk) if len(page) > size else None
 
     chats: List[Dict[str, Any]] = [
         {
             'number': chat.pk,
-            'name': chat.bot_user.name,
+            'name': chat.bot_user.name if chat.bot_user else None,
             'chat_last_message': chat.last_message_text,
             'time': chat.last_message_time
-        } for chat in Chat.objects.all()
+        } for chat in page[:size]
     ]
+    if request.GET.get('format') == 'json':
+        return JsonResponse({'chats': chats, 'next': next_cursor})
+
     messages: List[Dict[str, Any]] = []
+    earlier: Optional[str] = None
+    last_cursor = ''
     if pk:
-        messages = [
-            {
-                'number': message.pk,
-                'content': message.text,
-                'direction': bool(message.direction % 2),
-                'time': message.created_at,
-            } for message in Message.objects.get_chat_messages(pk)
-        ]
+        try:
+            before = _decode_message_cursor(request.GET.get('before'))
+        except ValueError as e:
+            return HttpResponseBadRequest(f'Bad page parameters: {e}')
+        history = Message.objects.get_chat_messages(pk, before, MESSAGE_PAGE_SIZE + 1)
+        if len(history) > MESSAGE_PAGE_SIZE:
+            history = history[1:]
+            earlier = _message_cursor(history[0])
+        if history:
+            last_cursor = _message_cursor(history[-1])
+        messages = [_message_data(message) for message in history]
     context: Dict[str, Any] = {
         'title_page': 'Список чатов',
         'chat_list': chats,
+        'next_cursor': next_cursor,
+        'page_size': size,
+        'is_first_page': not after,
         'message_list': messages,
+        'last_cursor': last_cursor,
+        'earlier_before': earlier,
+        'long_poll_wait': MESSAGE_LONG_POLL_WAIT,
+        # новые сообщения дописываются только на последней странице истории
+        'is_live': pk is not None and not request.GET.get('before'),
         'selected': pk,
     }
 
     return render(request, 'bot/chat_view.html', context)
+
+
+def _wait_for_messages(watch: Watch, pk: int, after: Optional[Tuple[datetime, int]], limit: int,
+                       timeout: float) -> List[Message]:
+    """Ждёт не дольше timeout секунд сообщений чата после after. Запрос будится оповещением о записи
+    сообщения в этом процессе; сообщения из других процессов находятся проверкой базы раз в MESSAGE_FEED_RECHECK."""
+
+    deadline = time.monotonic() + timeout
+    messages = Message.objects.get_chat_messages_after(pk, after, limit)
+    remaining = deadline - time.monotonic()
+    while not messages and remaining > 0:
+        watch.wait(min(remaining, MESSAGE_FEED_RECHECK))
+        messages = Message.objects.get_chat_messages_after(pk, after, limit)
+        remaining = deadline - time.monotonic()
+    return messages
+
+
+def chat_messages_view(request: HttpRequest, pk: int) -> JsonResponse:
+    """Отдаёт в формате JSON сообщения чата, записанные после курсора after (без него - с начала чата),
+    не более limit за раз.
+
+    С параметром wait (секунды, не более MESSAGE_LONG_POLL_MAX) при отсутствии новых сообщений ответ
+    откладывается до их появления (long-polling). Следующий запрос передаёт в after полученный cursor."""
+
+    try:
+        after = _decode_message_cursor(request.GET.get('after'))
+        limit = min(max(int(request.GET.get('limit', MESSAGE_PAGE_SIZE)), 1), MESSAGE_PAGE_SIZE_MAX)
+        wait = min(max(float(request.GET.get('wait', 0)), 0.0), MESSAGE_LONG_POLL_MAX)
+    except ValueError as e:
+        return JsonResponse({'error': f'Bad parameters: {e}'}, status=400)
+
+    with MessageFeed().watch(pk) as watch:
+        messages = _wait_for_messages(watch, pk, after, limit, wait)
+    return JsonResponse({
+        'messages': [_message_data(message) for message in messages],
+        'cursor': _message_cursor(messages[-1]) if messages else request.GET.get('after', ''),
+    })
+
+
+def chat_stream_view(request: HttpRequest, pk: int) -> HttpResponse:
+    """Поток server-sent events с новыми сообщениями чата.
+
+    Поток начинается после курсора after (или Last-Event-ID при переподключении) и закрывается
+    через MESSAGE_STREAM_DURATION секунд; браузер переподключается сам. Пока поток открыт, он занимает поток
+    веб-сервера, поэтому для большого числа операторов лучше подходит long-polling (chat_messages_view)."""
+
+    try:
+        after = _decode_message_cursor(request.META.get('HTTP_LAST_EVENT_ID') or request.GET.get('after'))
+    except ValueError as e:
+        return HttpResponseBadRequest(f'Bad parameters: {e}')
+
+    def events(after: Optional[Tuple[datetime, int]]) -> Iterator[str]:
+        deadline = time.monotonic() + MESSAGE_STREAM_DURATION
+        with MessageFeed().watch(pk) as watch:
+            yield 'retry: 3000\n\n'
+            while time.monotonic() < deadline:
+                messages = _wait_for_messages(
+                    watch, pk, after, MESSAGE_PAGE_SIZE, min(MESSAGE_FEED_RECHECK, deadline - time.monotonic()))
+                for message in messages:
+                    data = json.dumps(_message_data(message), cls=DjangoJSONEncoder)
+                    yield f'id: {_message_cursor(message)}\nevent: message\ndata: {data}\n\n'
+                    after = (message.created_at, message.pk)
+                if not messages:
+                    yield ': keep-alive\n\n'
+
+    response = StreamingHttpResponse(events(after), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+@staff_member_required  # type: ignore
+def stats_view(request: HttpRequest) -> JsonResponse:
+    """Отдаёт в формате JSON текущую статистику внутренних подсистем бота."""
+
+    stats: Dict[str, Any] = {
+        'webhook_pipeline': SingletonPipeline().get_pipeline.stats() if WEBHOOK_ASYNC else None,
+        'message_write_buffer': SingletonWriteBuffer().get_buffer.stats() if MESSAGE_WRITE_BEHIND else None,
+        'identity_cache': IdentityCache().stats(),
+        'bot_registry': BotRegistry().stats(),
+        'catalog_snapshot': CatalogStore().stats(),
+        'product_search': ProductSearch().stats(),
+        'screen_cache': ScreenCache().stats(),
+        'delivery': SingletonDelivery().get_engine.stats(),
+        'outbox': SingletonOutbox().get_relay.stats(),
+        'command_store': SingletonCommandStore().get_store.stats(),
+        'message_feed': MessageFeed().stats(),
+        'message_archive': MessageArchive().stats(),
+        'query_log': QueryLog().stats(),
+    }
+
+    return JsonResponse(stats)
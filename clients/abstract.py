@@ -1,12 +1,17 @@
+import logging
 from typing import TYPE_CHECKING
 from abc import ABC, abstractmethod
 
 from common.entities import EventCommandToSend, EventCommandReceived
+from .delivery import Delivery, SingletonDelivery
 
 if TYPE_CHECKING:
     from django.http import HttpRequest
 
 
+logger = logging.getLogger('root')
+
+
 class SocialPlatformClient(ABC):
     """Абстрактный интерфейс, описывающий поведение социальной платформы."""
 
@@ -15,9 +20,16 @@ class SocialPlatformClient(ABC):
         pass
 
     @abstractmethod
-    def send_message(self, payload: EventCommandToSend) -> None:
+    def form_delivery(self, payload: EventCommandToSend) -> Delivery:
+        """Формирует сообщение платформы для доставки движком доставки (clients.delivery)."""
         pass
 
+    def send_message(self, payload: EventCommandToSend) -> None:
+        """Передаёт сообщение движку доставки без записи в outbox."""
+
+        if not SingletonDelivery().get_engine.submit(self.form_delivery(payload)):
+            logger.error(f'Delivery window is full, message #{payload.message_id} dropped')
+
     @staticmethod
     @abstractmethod
     def verify_request(request: 'HttpRequest') -> bool:
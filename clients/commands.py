@@ -0,0 +1,200 @@
+"""Модуль хранилища команд кнопок.
+
+Платформы, которые присылают в вебхуке только текст нажатой кнопки (Jivo), не возвращают её полезную нагрузку.
+Поэтому при отправке сообщения с кнопками запоминается соответствие чат -> текст кнопки -> команда (Callback),
+а при разборе вебхука команда восстанавливается по тексту. Вместе с командами под ключом SOURCE_KEY хранится
+id сообщения, в котором кнопки отправлены: по нему нажатие кнопки идентифицируется так же, как callback
+платформ, возвращающих id сообщения с кнопкой (OK). Записи живут не дольше COMMAND_STORE_TTL секунд
+и удаляются при закрытии чата.
+
+Хранилище выбирается настройкой COMMAND_STORE:
+
+- local - LRU-кэш в памяти процесса с ограничением размера;
+- sqlite - общий для всех процессов приложения файл SQLite (COMMAND_STORE_PATH): нажатие кнопки может
+  обработать не тот процесс, который отправил сообщение."""
+
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Any, Dict, Optional, Tuple
+
+from bot.constants import COMMAND_STORE, COMMAND_STORE_PATH, COMMAND_STORE_SIZE, COMMAND_STORE_TTL
+from common.cache import LRUCache
+from patterns.singleton import Singleton
+
+
+Commands = Dict[str, Optional[str]]
+# ключ записи чата с id сообщения, в котором отправлены кнопки: текст кнопки не начинается с символа \0
+SOURCE_KEY = '\0source'
+
+
+class CommandStore(ABC):
+    """Интерфейс хранилища команд кнопок чатов."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @abstractmethod
+    def save(self, chat_id: str, commands: Commands) -> None:
+        """Запоминает команды кнопок последнего сообщения чата, заменяя предыдущие."""
+        pass
+
+    @abstractmethod
+    def _load(self, chat_id: str) -> Optional[Commands]:
+        pass
+
+    @abstractmethod
+    def evict(self, chat_id: str) -> None:
+        """Удаляет команды чата (чат закрыт)."""
+        pass
+
+    @abstractmethod
+    def clear(self) -> None:
+        pass
+
+    def lookup(self, chat_id: str, text: Optional[str]) -> Tuple[Optional[str], Optional[str]]:
+        """Возвращает команду кнопки с текстом text, отправленной в чат, и id сообщения с этой кнопкой
+        (None, если он не сохранён). Если кнопки нет, возвращает (None, None)."""
+
+        commands = self._load(chat_id) or {}
+        command = commands.get(text) if text is not None and text != SOURCE_KEY else None
+        with self._lock:
+            if command is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return command, commands.get(SOURCE_KEY) if command is not None else None
+
+    def resolve(self, chat_id: str, text: Optional[str]) -> Optional[str]:
+        """Возвращает команду кнопки с текстом text, отправленной в чат, или None."""
+
+        return self.lookup(chat_id, text)[0]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            requests = self.hits + self.misses
+            return {
+                'backend': type(self).__name__,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / requests if requests else 0.0,
+            }
+
+
+class LocalCommandStore(CommandStore):
+    """Хранилище в памяти процесса: LRU-кэш чатов с ограничением размера и временем жизни записей."""
+
+    def __init__(self, maxsize: int = COMMAND_STORE_SIZE, ttl: float = COMMAND_STORE_TTL) -> None:
+        super().__init__()
+        self._cache: LRUCache[str, Commands] = LRUCache(maxsize, ttl)
+
+    def save(self, chat_id: str, commands: Commands) -> None:
+        self._cache.set(chat_id, commands)
+
+    def _load(self, chat_id: str) -> Optional[Commands]:
+        return self._cache.get(chat_id)
+
+    def evict(self, chat_id: str) -> None:
+        self._cache.delete(chat_id)
+
+    def clear(self) -> None:
+        self._cache.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        stats = super().stats()
+        cache = self._cache.stats()
+        stats.update(chats=cache['size'], maxsize=cache['maxsize'], evictions=cache['evictions'])
+        stats['memory_bytes'] = sum(
+            sys.getsizeof(chat_id) + sys.getsizeof(commands)
+            + sum(sys.getsizeof(text) + sys.getsizeof(command) for text, command in commands.items())
+            for chat_id, commands in self._cache.items()
+        )
+        return stats
+
+
+class SQLiteCommandStore(CommandStore):
+    """Общее для процессов хранилище в файле SQLite.
+
+    У каждого потока своё соединение, файл открывается в режиме WAL: чтения не блокируются записью.
+    Просроченные записи не отдаются и периодически удаляются при сохранении."""
+
+    PURGE_EVERY = 1000
+
+    def __init__(self, path: str = COMMAND_STORE_PATH, ttl: float = COMMAND_STORE_TTL) -> None:
+        super().__init__()
+        self.path = path
+        self.ttl = ttl
+        self._local = threading.local()
+        self._saves = 0
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connection() as conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS chat_commands '
+                '(chat_id TEXT PRIMARY KEY, commands TEXT NOT NULL, expires_at REAL NOT NULL)'
+            )
+
+    def _connection(self) -> sqlite3.Connection:
+        conn: Optional[sqlite3.Connection] = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def save(self, chat_id: str, commands: Commands) -> None:
+        now = time.time()
+        with self._lock:
+            self._saves += 1
+            purge = self._saves % self.PURGE_EVERY == 0
+        with self._connection() as conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO chat_commands (chat_id, commands, expires_at) VALUES (?, ?, ?)',
+                (chat_id, json.dumps(commands), now + self.ttl),
+            )
+            if purge:
+                conn.execute('DELETE FROM chat_commands WHERE expires_at <= ?', (now,))
+
+    def _load(self, chat_id: str) -> Optional[Commands]:
+        row = self._connection().execute(
+            'SELECT commands FROM chat_commands WHERE chat_id = ? AND expires_at > ?', (chat_id, time.time())
+        ).fetchone()
+        return json.loads(row[0]) if row is not None else None
+
+    def evict(self, chat_id: str) -> None:
+        with self._connection() as conn:
+            conn.execute('DELETE FROM chat_commands WHERE chat_id = ?', (chat_id,))
+
+    def clear(self) -> None:
+        with self._connection() as conn:
+            conn.execute('DELETE FROM chat_commands')
+
+    def stats(self) -> Dict[str, Any]:
+        stats = super().stats()
+        stats['chats'] = self._connection().execute(
+            'SELECT COUNT(*) FROM chat_commands WHERE expires_at > ?', (time.time(),)
+        ).fetchone()[0]
+        stats['file_bytes'] = sum(
+            os.path.getsize(path) for path in (self.path, f'{self.path}-wal') if os.path.exists(path)
+        )
+        return stats
+
+
+class SingletonCommandStore(metaclass=Singleton):
+    """Класс для хранения и передачи единственного инстанса хранилища команд процесса."""
+
+    _store: Optional[CommandStore] = None
+    _lock = threading.Lock()
+
+    @property
+    def get_store(self) -> CommandStore:
+        with self._lock:
+            if self._store is None:
+                self._store = SQLiteCommandStore() if COMMAND_STORE == 'sqlite' else LocalCommandStore()
+        return self._store
@@ -0,0 +1,317 @@
+"""Модуль доставки исходящих сообщений на платформы.
+
+Заменяет интервальные задания планировщика на каждое сообщение. Для каждой платформы используется
+одна HTTP-сессия с пулом keep-alive соединений, запросы выполняются с явными таймаутами соединения и чтения.
+При сетевых ошибках, 429 и 5xx попытка повторяется с экспоненциальной задержкой со случайным разбросом,
+пока не истечёт срок доставки. Количество принятых, но ещё не доставленных сообщений ограничено окном:
+при заполненном окне новые сообщения не принимаются. Частота запросов каждого бота к платформе ограничивается
+корзиной токенов (clients.ratelimit): запрос без токена откладывается, сигнал платформы о превышении лимита
+блокирует корзину."""
+
+import heapq
+import logging
+import queue
+import random
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+from django.db import close_old_connections, connection
+
+from bot.constants import (DELIVERY_WORKERS, DELIVERY_MAX_IN_FLIGHT, DELIVERY_CONNECT_TIMEOUT, DELIVERY_READ_TIMEOUT,
+                           DELIVERY_BACKOFF_BASE, DELIVERY_BACKOFF_CAP, DELIVERY_DEADLINE, RATE_LIMIT_ENABLED)
+from patterns.singleton import Singleton
+from .ratelimit import RateLimiter, make_limiter
+
+
+logger = logging.getLogger('root')
+
+RETRY_STATUSES = frozenset((429, 500, 502, 503, 504))
+# ответы, которыми платформа сообщает о превышении лимита запросов
+THROTTLE_STATUSES = frozenset((429, 503))
+
+
+@dataclass
+class Delivery:
+    """Исходящее сообщение: платформа, адрес, тело запроса и обработчики ответа.
+
+    check поднимает исключение, если платформа отклонила сообщение (повторная попытка не выполняется),
+    on_delivered вызывается после успешной доставки, on_failed - с описанием причины, если доставить не удалось.
+    bot_id определяет корзину токенов ограничения частоты запросов."""
+
+    platform: str
+    url: str
+    data: str
+    headers: Dict[str, Any]
+    check: Callable[[requests.Response], None]
+    on_delivered: Optional[Callable[[], None]] = None
+    on_failed: Optional[Callable[[str], None]] = None
+    bot_id: Optional[int] = None
+    submitted_at: float = field(default_factory=time.monotonic)
+    attempts: int = 0
+
+    @property
+    def bucket(self) -> str:
+        return f'{self.platform}:{self.bot_id}'
+
+
+def make_session(pool_size: int) -> requests.Session:
+    """Создаёт HTTP-сессию с пулом keep-alive соединений к одной платформе."""
+
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def retry_after(response: requests.Response) -> Optional[float]:
+    """Время ожидания в секундах из заголовка Retry-After ответа (поддерживается только число секунд)."""
+
+    try:
+        return max(0.0, float(response.headers['Retry-After']))
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+class DeliveryEngine:
+    """Пул воркеров доставки с очередью отложенных повторных попыток и статистикой."""
+
+    _stop_marker: Any = object()
+
+    def __init__(self, workers: int = DELIVERY_WORKERS, max_in_flight: int = DELIVERY_MAX_IN_FLIGHT,
+                 connect_timeout: float = DELIVERY_CONNECT_TIMEOUT, read_timeout: float = DELIVERY_READ_TIMEOUT,
+                 backoff_base: float = DELIVERY_BACKOFF_BASE, backoff_cap: float = DELIVERY_BACKOFF_CAP,
+                 deadline: float = DELIVERY_DEADLINE,
+                 session_factory: Callable[[int], requests.Session] = make_session,
+                 limiter: Optional[RateLimiter] = None) -> None:
+        self._workers = max(1, workers)
+        self.max_in_flight = max(1, max_in_flight)
+        self.timeout = (connect_timeout, read_timeout)
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.deadline = deadline
+        self._session_factory = session_factory
+        self.limiter = limiter
+        self._sessions: Dict[str, requests.Session] = {}
+        self._ready: 'queue.Queue[Any]' = queue.Queue()
+        self._delayed: List[Tuple[float, int, Delivery]] = []
+        self._delayed_cond = threading.Condition()
+        self._seq = 0
+        self._threads: List[threading.Thread] = []
+        self._running = False
+        self._lock = threading.Lock()
+        self._latencies: Deque[float] = deque(maxlen=1024)
+        self._delivered_at: Deque[float] = deque(maxlen=10000)
+        self.in_flight = 0
+        self.submitted = 0
+        self.delivered = 0
+        self.failed = 0
+        self.retried = 0
+        self.rejected = 0
+        self.throttled = 0
+
+    def start(self) -> None:
+        """Запускает воркеры доставки и поток отложенных повторных попыток."""
+
+        with self._lock:
+            if self._running:
+                return
+            self._running = True
+            self._threads = [
+                threading.Thread(target=self._work, name=f'delivery-worker-{i}', daemon=True)
+                for i in range(self._workers)
+            ]
+            self._threads.append(threading.Thread(target=self._schedule, name='delivery-retry', daemon=True))
+            for thread in self._threads:
+                thread.start()
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """Останавливает воркеры; отложенные повторные попытки отбрасываются."""
+
+        with self._lock:
+            if not self._running:
+                return
+            self._running = False
+        with self._delayed_cond:
+            self._delayed_cond.notify_all()
+        for _ in range(self._workers):
+            self._ready.put(self._stop_marker)
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def submit(self, delivery: Delivery) -> bool:
+        """Принимает сообщение к доставке. Возвращает False, если окно доставки заполнено."""
+
+        with self._lock:
+            if self.in_flight >= self.max_in_flight:
+                self.rejected += 1
+                return False
+            self.in_flight += 1
+            self.submitted += 1
+        self._ready.put(delivery)
+        return True
+
+    def _session(self, platform: str) -> requests.Session:
+        session = self._sessions.get(platform)
+        if session is None:
+            with self._lock:
+                session = self._sessions.get(platform)
+                if session is None:
+                    session = self._session_factory(self._workers)
+                    self._sessions[platform] = session
+        return session
+
+    def _work(self) -> None:
+        try:
+            while True:
+                delivery = self._ready.get()
+                if delivery is self._stop_marker:
+                    return
+                close_old_connections()
+                try:
+                    self._attempt(delivery)
+                except Exception as e:
+                    logger.exception(f'Delivery to {delivery.platform} crashed: {e.args}')
+                    self._finish(delivery, False, f'crashed: {e}')
+        finally:
+            connection.close()
+
+    def _attempt(self, delivery: Delivery) -> None:
+        if self.limiter is not None:
+            wait = self.limiter.acquire(delivery.bucket)
+            if wait > 0:
+                with self._lock:
+                    self.throttled += 1
+                self._defer(delivery, wait)
+                return
+        delivery.attempts += 1
+        try:
+            response = self._session(delivery.platform).post(
+                delivery.url, data=delivery.data, headers=delivery.headers, timeout=self.timeout)
+        except (requests.Timeout, requests.ConnectionError) as e:
+            logger.error(f'{delivery.platform} unreachable: {e.args}')
+            self._retry(delivery)
+            return
+
+        logger.debug(f'{delivery.platform} answered: {response.status_code} {response.text}')
+        if response.status_code in RETRY_STATUSES:
+            delay = retry_after(response)
+            if self.limiter is not None and (response.status_code in THROTTLE_STATUSES or delay is not None):
+                delay = self.backoff(delivery.attempts) if delay is None else delay
+                logger.warning(f'{delivery.platform} rate limit hit, {delivery.bucket} paused for {delay:.1f}s')
+                self.limiter.back_off(delivery.bucket, delay)
+            self._retry(delivery, delay)
+            return
+        try:
+            delivery.check(response)
+        except Exception as e:
+            logger.error(f'{delivery.platform} rejected message: {e}')
+            self._finish(delivery, False, f'rejected: {e}')
+            return
+        if delivery.on_delivered is not None:
+            delivery.on_delivered()
+        self._finish(delivery, True)
+
+    def backoff(self, attempts: int) -> float:
+        """Задержка перед следующей попыткой: случайная величина от 0 до base * 2^(attempts - 1), не более cap."""
+
+        return random.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** (attempts - 1)))
+
+    def _retry(self, delivery: Delivery, delay: Optional[float] = None) -> None:
+        if self._defer(delivery, self.backoff(delivery.attempts) if delay is None else delay):
+            with self._lock:
+                self.retried += 1
+
+    def _defer(self, delivery: Delivery, delay: float) -> bool:
+        """Откладывает попытку на delay секунд. Если срок доставки к тому времени истечёт, доставка завершается."""
+
+        due = time.monotonic() + delay
+        if due - delivery.submitted_at > self.deadline:
+            logger.error(f'{delivery.platform} delivery expired after {delivery.attempts} attempts')
+            self._finish(delivery, False, f'expired after {delivery.attempts} attempts')
+            return False
+        with self._delayed_cond:
+            self._seq += 1
+            heapq.heappush(self._delayed, (due, self._seq, delivery))
+            self._delayed_cond.notify()
+        return True
+
+    def _schedule(self) -> None:
+        """Переносит отложенные попытки в очередь воркеров по наступлении их времени."""
+
+        with self._delayed_cond:
+            while self._running:
+                now = time.monotonic()
+                while self._delayed and self._delayed[0][0] <= now:
+                    self._ready.put(heapq.heappop(self._delayed)[2])
+                timeout = self._delayed[0][0] - now if self._delayed else None
+                self._delayed_cond.wait(timeout)
+
+    def _finish(self, delivery: Delivery, delivered: bool, error: str = '') -> None:
+        if not delivered and delivery.on_failed is not None:
+            try:
+                delivery.on_failed(error)
+            except Exception as e:
+                logger.exception(f'Delivery failure handler crashed: {e.args}')
+        now = time.monotonic()
+        with self._lock:
+            self.in_flight -= 1
+            if delivered:
+                self.delivered += 1
+                self._latencies.append(now - delivery.submitted_at)
+                self._delivered_at.append(now)
+            else:
+                self.failed += 1
+
+    def wait_idle(self, timeout: float) -> bool:
+        """Ожидает завершения доставки всех принятых сообщений. Возвращает False по истечении таймаута."""
+
+        deadline = time.monotonic() + timeout
+        while self.in_flight and time.monotonic() < deadline:
+            time.sleep(0.05)
+        return not self.in_flight
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            latencies = sorted(self._latencies)
+            now = time.monotonic()
+            recent = sum(1 for moment in self._delivered_at if now - moment <= 60)
+            return {
+                'in_flight': self.in_flight,
+                'max_in_flight': self.max_in_flight,
+                'retry_pending': len(self._delayed),
+                'submitted': self.submitted,
+                'delivered': self.delivered,
+                'failed': self.failed,
+                'retried': self.retried,
+                'rejected': self.rejected,
+                'throttled': self.throttled,
+                'rate_limit': self.limiter.stats() if self.limiter is not None else None,
+                'throughput_per_sec': recent / 60,
+                'latency_avg': sum(latencies) / len(latencies) if latencies else 0.0,
+                'latency_p95': latencies[int(len(latencies) * 0.95)] if latencies else 0.0,
+                'latency_max': latencies[-1] if latencies else 0.0,
+            }
+
+
+class SingletonDelivery(metaclass=Singleton):
+    """Класс для хранения и передачи единственного инстанса движка доставки.
+
+    Движок создаётся и запускается при первом обращении."""
+
+    _engine: Optional[DeliveryEngine] = None
+    _lock = threading.Lock()
+
+    @property
+    def get_engine(self) -> DeliveryEngine:
+        with self._lock:
+            if self._engine is None:
+                self._engine = DeliveryEngine(limiter=make_limiter() if RATE_LIMIT_ENABLED else None)
+                self._engine.start()
+        return self._engine
@@ -2,8 +2,8 @@ import os
 from enum import Enum
 
 
-JIVO_WH_KEY = os.getenv('JIVO_WH_KEY')
-JIVO_TOKEN = os.getenv('JIVO_TOKEN')
+# адрес API: переопределяется для нагрузочных тестов с локальной заменой платформы (util.loadtest)
+JIVO_API_URL = os.getenv('JIVO_API_URL', 'https://bot.jivosite.com')
 
 
 class JivoResponseType(Enum):
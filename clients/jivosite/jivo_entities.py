@@ -7,7 +7,7 @@ import marshmallow
 import marshmallow_enum
 from marshmallow_dataclass import dataclass
 
-from common.entities import SkipNoneSchema
+from common.entities import SkipNoneSchema, LinterFix
 
 from clients.jivosite.jivo_constants import JivoMessageType, JivoEventType, JivoResponseType
 
@@ -38,7 +38,7 @@ class JivoErrorMessage:
 
 
 @dataclass(order=True)
-class JivoButton:
+class JivoButton(LinterFix):
     """Класс данных для хранения информации о кнопке в сообщении."""
 
     Schema: ClassVar[Type[marshmallow.Schema]] = marshmallow.Schema
@@ -48,7 +48,7 @@ class JivoButton:
 
 
 @dataclass(order=True, base_schema=SkipNoneSchema)
-class JivoMessage:
+class JivoMessage(LinterFix):
     """Класс данных для хранения информации о сообщении в системе JivoSite.
 
     Содержит тип, текст, таймстамп, id нажатой кнопки (не используется), заголовок и кнопки.
@@ -69,7 +69,7 @@ class JivoMessage:
 
 
 @dataclass(order=True, base_schema=SkipNoneSchema)
-class JivoEvent:
+class JivoEvent(LinterFix):
     """Класс данных для хранения информации об исходящем сообщении JivoSite.
 
     Содержит тип, идентификатор сообщения, информацию о чате и клиенте Jivo, а также тело сообщения.
@@ -1,24 +1,29 @@
-from datetime import datetime, timedelta
+from datetime import datetime
+from functools import partial
 import requests
 import logging
-from typing import Dict, Any, Optional, TYPE_CHECKING
+from typing import Dict, Any, TYPE_CHECKING
 
-from bot.models import Bot, Message
+from bot.models import Message
+from bot.registry import BotRegistry
 from clients.abstract import SocialPlatformClient
+from clients.commands import SOURCE_KEY, SingletonCommandStore
+from clients.delivery import Delivery, SingletonDelivery
 from clients.exceptions import JivoServerError
-from common.constants import MessageDirection, ChatType, MessageContentType, BotType
+from common.constants import MessageDirection, ChatType, MessageContentType, BotType, CallbackType
 from common.entities import EventCommandToSend, EventCommandReceived
-from clients.jivosite.jivo_entities import JivoEvent, JivoIncomingWebhook
-from clients.jivosite.jivo_constants import JivoEventType, JivoMessageType, JIVO_WH_KEY, JIVO_TOKEN
-from bot.apps import SingletonAPS
+from clients.jivosite.jivo_entities import JivoButton, JivoEvent, JivoIncomingWebhook, JivoMessage
+from clients.jivosite.jivo_constants import JivoEventType, JivoMessageType, JIVO_API_URL
+from bot.constants import CODEC_STRICT
 from common.strings import JivoStrings
+from common import callbacks, codecs
+from common.schemas import get_schema
 
 if TYPE_CHECKING:
     from django.http import HttpRequest
 
 
 logger = logging.getLogger('root')
-bot_scheduler = SingletonAPS().get_aps
 
 
 class JivositeClient(SocialPlatformClient):
@@ -30,10 +35,15 @@ class JivositeClient(SocialPlatformClient):
     """
 
     headers: Dict[str, Any] = {'Content-Type': 'application/json'}
-    command_cache: Dict[str, Dict[str, Optional[str]]] = {}
-    _send_link = JivoStrings.API_LINK.value.format(
-        key=JIVO_WH_KEY, token=JIVO_TOKEN
-    )
+
+    @staticmethod
+    def _send_link(bot_id: int) -> str:
+        """Ссылка отправки событий бота; ключи берутся из записи реестра бота (BotEntry.credentials)."""
+
+        credentials = BotRegistry().get(bot_id).credentials
+        return JivoStrings.API_LINK.value.format(
+            api_url=JIVO_API_URL, key=credentials['key'], token=credentials['token']
+        )
 
     @staticmethod
     def verify_request(request: 'HttpRequest') -> bool:
@@ -43,78 +53,77 @@ class JivositeClient(SocialPlatformClient):
     def _form_message(self, payload: EventCommandToSend) -> JivoEvent:
         """Создаёт программный объект с данными исходящего сообщения, готовыми для отправки."""
 
-        event_data: Dict[str, Any] = {
-            'event': JivoEventType.BOT_MESSAGE,
-            # todo think about how to work this around
-            'id': str(payload.message_id),
-            'client_id': payload.chat_id_in_messenger,
-        }
-
-        msg_data: Dict[str, Any] = {
-            'text': payload.payload.text,
-            'timestamp': datetime.now().timestamp()
-        }
+        # объекты собираются напрямую, без load из словаря: проверка схемой выполняется только в строгом режиме
+        message = JivoMessage(
+            timestamp=int(datetime.now().timestamp()),
+            type=JivoMessageType.TEXT,
+            text=payload.payload.text,
+        )
 
         if payload.inline_buttons:
-            msg_data['title'] = payload.payload.text
-            msg_data['type'] = JivoMessageType.BUTTONS
-            msg_data['buttons'] = [
-               {
-                   'text': payload.inline_buttons[i].text,
-                   'id': i,
-               } for i in range(len(payload.inline_buttons))]
+            message.title = payload.payload.text
+            message.type = JivoMessageType.BUTTONS
+            message.buttons = [JivoButton(button.text, i) for i, button in enumerate(payload.inline_buttons)]
             assert payload.inline_buttons[0].action.payload is not None, 'Malformed payload in ECTS.'
-            # todo pretty much a hack, but a good solution kinda requires passing more data in base commands tbh
+            # кнопка вызова оператора добавляется к приветствию
             logger.debug(f'>>> inline jivo check {payload.inline_buttons[0].action.payload}')
-            if payload.inline_buttons[0].action.payload.find('greeting') > 0:
-                msg_data['buttons'].append({
-                    'text': JivoStrings.INVITE_OPERATOR.value,
-                    'id': 0,
-                })
-        else:
-            msg_data['type'] = JivoMessageType.TEXT
-        event_data['message'] = msg_data
-        event = JivoEvent.Schema().load(event_data)
+            if callbacks.decode(payload.inline_buttons[0].action.payload).type == CallbackType.GREETING:
+                message.buttons.append(JivoButton(JivoStrings.INVITE_OPERATOR.value, 0))
+
+        event = JivoEvent(
+            event=JivoEventType.BOT_MESSAGE,
+            # todo think about how to work this around
+            id=str(payload.message_id),
+            client_id=payload.chat_id_in_messenger,
+            chat_id=None,
+            message=message,
+        )
 
         logger.debug(event)
 
         if payload.inline_buttons:
-            self.command_cache[payload.chat_id_in_messenger] = {
-                btn.text: btn.action.payload for btn in payload.inline_buttons
-            }
+            commands = {btn.text: btn.action.payload for btn in payload.inline_buttons}
+            if payload.message_id:
+                commands[SOURCE_KEY] = event.id
+            SingletonCommandStore().get_store.save(payload.chat_id_in_messenger, commands)
 
         return event
 
     def _invite_agent(self, wh: JivoIncomingWebhook) -> None:
-        data = {
-            'event': 'INVITE_AGENT',
+        event = JivoEvent(
+            event=JivoEventType.INVITE_AGENT,
             # todo more magic hacks
-            'id': f'-{wh.client_id}',
-            'client_id': wh.client_id,
-            'chat_id': wh.chat_id,
-        }
-        event = JivoEvent.Schema().load(data)
-        bot_scheduler.add_job(
-            self._post_to_platform,
-            'interval',
-            seconds=5,
-            next_run_time=datetime.now(),
-            end_date=datetime.now() + timedelta(minutes=5),
-            args=[data['id'], self._send_link, event.Schema().dumps(event)],
-            id=f'jivo_-{wh.client_id}',
-            )
+            id=f'-{wh.client_id}',
+            client_id=wh.client_id,
+            chat_id=wh.chat_id,
+            message=None,
+        )
+        bot_id = BotRegistry().get_bot_id_by_type(BotType.TYPE_JIVOSITE.value)
+        delivery = Delivery(
+            platform='jivo',
+            url=self._send_link(bot_id),
+            data=codecs.dumps(event, strict=CODEC_STRICT),
+            headers=self.headers,
+            check=self._check_response,
+            bot_id=bot_id,
+        )
+        if not SingletonDelivery().get_engine.submit(delivery):
+            logger.error(f'Delivery window is full, JIVO agent invite for {wh.client_id} dropped')
 
     def parse_webhook(self, request: 'HttpRequest') -> EventCommandReceived:
         """Преобразует объект входящего вебхука в формат входящей команды бота - ECR."""
 
         logger.debug(f'For parsing: {request.body}')
-        wh = JivoIncomingWebhook.Schema().loads(request.body)
+        wh = get_schema(JivoIncomingWebhook).loads(request.body)
         logger.debug(wh)
         if wh.event in [JivoEventType.CHAT_CLOSED, JivoEventType.AGENT_JOINED]:
+            if wh.event == JivoEventType.CHAT_CLOSED:
+                # кнопки закрытого чата больше не понадобятся
+                SingletonCommandStore().get_store.evict(wh.client_id)
             return None
         # формирование объекта с данными для ECR
         ecr_data: Dict[str, Any] = {
-            'bot_id': Bot.objects.get_bot_id_by_type(BotType.TYPE_JIVOSITE.value),
+            'bot_id': BotRegistry().get_bot_id_by_type(BotType.TYPE_JIVOSITE.value),
             'chat_id_in_messenger': wh.client_id,  # important, do not change
             'content_type': MessageContentType.COMMAND,
             'payload': {
@@ -131,54 +140,50 @@ class JivositeClient(SocialPlatformClient):
             'ts_in_messenger': str(datetime.fromtimestamp(int(wh.message.timestamp))) if wh.message else None,
         }
 
-        try:
-            if self.command_cache[wh.client_id]:
-                ecr_data['payload']['command'] = self.command_cache[wh.client_id][wh.message.text]
-        except KeyError as err:
-            logger.debug(f'nothing in command_cache: {err.args}')
+        command, source = SingletonCommandStore().get_store.lookup(
+            wh.client_id, wh.message.text if wh.message else None)
+        if command is not None:
+            ecr_data['payload']['command'] = command
+            # id вебхука у каждого нажатия свой; как и в OK, нажатие кнопки идентифицируется сообщением с кнопками,
+            # поэтому повторное нажатие кнопки оплаты возвращает тот же заказ (Order.request_key)
+            if source is not None:
+                ecr_data['message_id_in_messenger'] = source
+        else:
+            logger.debug(f'nothing in command store for {wh.client_id}')
 
         if wh.message.text == JivoStrings.INVITE_OPERATOR.value:
             logger.info('Agent invited: {}'.format(wh.client_id))
             self._invite_agent(wh)
             # todo more hacks
-            ecr_data['payload']['command'] = '{"type": "invite", "id": 0}'
+            ecr_data['payload']['command'] = callbacks.make(CallbackType.INVITE_AGENT, 0)
 
-        ecr = EventCommandReceived.Schema().load(ecr_data)
+        ecr = get_schema(EventCommandReceived).load(ecr_data)
 
         logger.debug(ecr)
 
         return ecr
 
-    def _post_to_platform(self, message_id: str, send_link: str, data: str,) -> None:
-        logger.debug('Trying to send to jivo...')
-
-        try:
-            r = requests.post(send_link, headers=self.headers, data=data)
-            logger.debug(f'JIVO answered: {r.text}')
-            bot_scheduler.remove_job(f'jivo_{message_id}')
-            if 'error' in r.json():
-                err = r.json()['error']
-                logger.error(f'OK error: {err["code"]} -> {err["message"]}')
-                raise JivoServerError(err["code"], err["message"])
-            if message_id[0] != '-':
-                Message.objects.set_sent(int(message_id))
-        except (requests.Timeout, requests.ConnectionError) as e:
-            logger.error(f'JIVO unreachable{e.args}')
-
-    def send_message(self, payload: EventCommandToSend) -> None:
-        """Отправляет соответствующее используемой команде формата ECTS сообщение в Jivo."""
+    @staticmethod
+    def _check_response(response: requests.Response) -> None:
+        if 'error' in response.json():
+            err = response.json()['error']
+            logger.error(f'JIVO error: {err["code"]} -> {err["message"]}')
+            raise JivoServerError(err["code"], err["message"])
+
+    def form_delivery(self, payload: EventCommandToSend) -> Delivery:
+        """Готовит к доставке соответствующее используемой команде формата ECTS сообщение в Jivo."""
 
         msg = self._form_message(payload)
-        data = msg.Schema().dumps(msg)
+        data = codecs.dumps(msg, strict=CODEC_STRICT)
 
         logger.debug(f'Sending to JIVO: {data}')
 
-        bot_scheduler.add_job(
-            self._post_to_platform,
-            'interval',
-            seconds=5,
-            next_run_time=datetime.now(),
-            end_date=datetime.now() + timedelta(minutes=5),
-            args=[payload.message_id, self._send_link, data],
-            id=f'jivo_{payload.message_id}',
-            )
+        return Delivery(
+            platform='jivo',
+            url=self._send_link(payload.bot_id),
+            data=data,
+            headers=self.headers,
+            check=self._check_response,
+            on_delivered=partial(Message.objects.set_sent, payload.message_id) if payload.message_id else None,
+            bot_id=payload.bot_id,
+        )
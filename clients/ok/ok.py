@@ -1,26 +1,30 @@
 import requests
 import logging
-from datetime import datetime, timedelta
+from datetime import datetime
+from functools import partial
 from ipaddress import ip_network, ip_address
 from typing import Dict, Any, TYPE_CHECKING
 
 from common.builders import MessageDirector
-from bot.models import Bot, Message
+from bot.models import Message
+from bot.registry import BotRegistry
 from common.constants import MessageDirection, ChatType, MessageContentType, BotType
 from common.entities import EventCommandToSend, EventCommandReceived
-from .ok_constants import OK_TOKEN
+from .ok_constants import OK_API_URL
 from .ok_entities import OkOutgoingMessage, OkIncomingWebhook
-from bot.apps import SingletonAPS
+from bot.constants import CODEC_STRICT
 from clients.abstract import SocialPlatformClient
+from clients.delivery import Delivery
 from clients.exceptions import OkServerError
 from common.strings import OkStrings
+from common import codecs
+from common.schemas import get_schema
 
 if TYPE_CHECKING:
     from django.http import HttpRequest
 
 
 logger = logging.getLogger('root')
-bot_scheduler = SingletonAPS().get_aps
 
 
 class OkClient(SocialPlatformClient):
@@ -49,18 +53,17 @@ class OkClient(SocialPlatformClient):
     def _form_message(self, payload: EventCommandToSend) -> OkOutgoingMessage:
 
         msg = MessageDirector().create_ok_message(payload)
-        msg.Schema().validate(msg.Schema().dump(msg))
 
         logger.debug(msg)
 
         return msg
 
     def parse_webhook(self, request: 'HttpRequest') -> EventCommandReceived:
-        wh = OkIncomingWebhook.Schema().loads(request.body)
+        wh = get_schema(OkIncomingWebhook).loads(request.body)
         logger.debug(wh)
         # формирование объекта с данными для ECR
         ecr_data: Dict[str, Any] = {
-            'bot_id': Bot.objects.get_bot_id_by_type(BotType.TYPE_OK.value),
+            'bot_id': BotRegistry().get_bot_id_by_type(BotType.TYPE_OK.value),
             'chat_id_in_messenger': wh.recipient.chat_id,
             'content_type': MessageContentType.COMMAND,
             'payload': {
@@ -75,40 +78,35 @@ class OkClient(SocialPlatformClient):
             'reply_id_in_messenger': wh.message.reply_to if wh.message else None,
             'ts_in_messenger': str(datetime.fromtimestamp(wh.timestamp // 1000)),
         }
-        ecr = EventCommandReceived.Schema().load(ecr_data)
+        ecr = get_schema(EventCommandReceived).load(ecr_data)
         # logger.debug(ecr)
 
         return ecr
 
-    def _post_to_platform(self, message_id: int, send_link: str, data: str) -> None:
-        logger.debug('Trying to send to OK...')
-        try:
-            r = requests.post(send_link, headers=self.headers, data=data)
-            logger.debug(f'OK answered: {r.text}')
-            bot_scheduler.remove_job(f'ok_{message_id}')
-            if 'invocation-error' in r.headers:
-                logger.error(f'OK error: {r.headers["invocation-error"]} -> {r.json()}')
-                raise OkServerError(r.headers["invocation-error"], r.json())
-            Message.objects.set_sent(message_id)
-        except (requests.Timeout, requests.ConnectionError) as e:
-            logger.error(f'OK unreachable: {e.args}')
-
-    def send_message(self, payload: EventCommandToSend) -> None:
+    @staticmethod
+    def _check_response(response: requests.Response) -> None:
+        if 'invocation-error' in response.headers:
+            logger.error(f'OK error: {response.headers["invocation-error"]} -> {response.json()}')
+            raise OkServerError(response.headers["invocation-error"], response.json())
+
+    def form_delivery(self, payload: EventCommandToSend) -> Delivery:
         msg = self._form_message(payload)
 
+        # ключ группы берётся из записи реестра бота: учётные данные читаются при его загрузке, а не при импорте
         send_link = OkStrings.API_LINK.value.format(
-            chat_id=payload.chat_id_in_messenger, token=OK_TOKEN
+            api_url=OK_API_URL, chat_id=payload.chat_id_in_messenger,
+            token=BotRegistry().get(payload.bot_id).credentials['token'],
         )
 
-        data = msg.Schema().dumps(msg)
+        data = codecs.dumps(msg, strict=CODEC_STRICT)
         logger.debug(f'Sending to OK: {data}')
 
-        bot_scheduler.add_job(
-            self._post_to_platform,
-            'interval',
-            seconds=5,
-            next_run_time=datetime.now(),
-            end_date=datetime.now() + timedelta(minutes=5),
-            args=[payload.message_id, send_link, data],
-            id=f'ok_{payload.message_id}',
-            )
+        return Delivery(
+            platform='ok',
+            url=send_link,
+            data=data,
+            headers=self.headers,
+            check=self._check_response,
+            on_delivered=partial(Message.objects.set_sent, payload.message_id) if payload.message_id else None,
+            bot_id=payload.bot_id,
+        )
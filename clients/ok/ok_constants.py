@@ -2,7 +2,8 @@ import os
 from enum import Enum
 
 
-OK_TOKEN = os.getenv('OK_TOKEN')
+# адрес API: переопределяется для нагрузочных тестов с локальной заменой платформы (util.loadtest)
+OK_API_URL = os.getenv('OK_API_URL', 'https://api.ok.ru')
 
 
 class OkButtonType(Enum):
@@ -0,0 +1,178 @@
+"""Модуль ограничения частоты исходящих запросов к платформам.
+
+Для каждого бота на каждой платформе заводится корзина токенов: запрос к платформе расходует токен,
+токены пополняются со скоростью RATE_LIMIT_RATE в секунду до RATE_LIMIT_BURST. Всплески сообщений
+сглаживаются: движок доставки откладывает запрос, пока в корзине не появится токен.
+Сигнал платформы о превышении лимита (429, Retry-After) блокирует корзину на указанное время.
+
+Хранилище корзин выбирается настройкой RATE_LIMIT_BACKEND:
+
+- local - корзины в памяти процесса;
+- sqlite - общий для всех процессов приложения файл SQLite (RATE_LIMIT_PATH): процессы расходуют один бюджет."""
+
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Any, Callable, Dict, Optional, Tuple, TypeVar
+
+from bot.constants import RATE_LIMIT_BACKEND, RATE_LIMIT_BURST, RATE_LIMIT_PATH, RATE_LIMIT_RATE
+
+
+# состояние корзины: (токены, время пополнения, заблокирована до)
+Bucket = Tuple[float, float, float]
+T = TypeVar('T')
+
+
+class RateLimiter(ABC):
+    """Корзины токенов по ключу (платформа:бот) и счётчики пропущенных и отложенных запросов."""
+
+    def __init__(self, rate: float = RATE_LIMIT_RATE, burst: float = RATE_LIMIT_BURST) -> None:
+        self.rate = max(rate, 1e-6)
+        self.burst = max(burst, 1.0)
+        self._lock = threading.Lock()
+        self.granted = 0
+        self.throttled = 0
+        self.backoffs = 0
+
+    def _refill(self, bucket: Optional[Bucket], now: float) -> Bucket:
+        if bucket is None:
+            return self.burst, now, 0.0
+        tokens, updated, blocked_until = bucket
+        return min(self.burst, tokens + max(0.0, now - updated) * self.rate), now, blocked_until
+
+    def _take(self, bucket: Optional[Bucket], now: float) -> Tuple[Bucket, float]:
+        """Расходует токен корзины. Возвращает новое состояние и время ожидания (0 - запрос разрешён)."""
+
+        tokens, updated, blocked_until = self._refill(bucket, now)
+        if blocked_until > now:
+            return (tokens, updated, blocked_until), blocked_until - now
+        if tokens < 1:
+            return (tokens, updated, blocked_until), (1 - tokens) / self.rate
+        return (tokens - 1, updated, blocked_until), 0.0
+
+    @abstractmethod
+    def _update(self, key: str, change: Callable[[Optional[Bucket]], Tuple[Bucket, T]]) -> T:
+        """Атомарно применяет change(состояние корзины или None) -> (новое состояние, результат)."""
+        pass
+
+    @abstractmethod
+    def buckets(self) -> Dict[str, Bucket]:
+        pass
+
+    def acquire(self, key: str) -> float:
+        """Расходует токен корзины key. Возвращает 0, если запрос можно выполнять, иначе время ожидания в секундах."""
+
+        wait = self._update(key, lambda bucket: self._take(bucket, time.time()))
+        with self._lock:
+            if wait > 0:
+                self.throttled += 1
+            else:
+                self.granted += 1
+        return wait
+
+    def back_off(self, key: str, delay: float) -> None:
+        """Блокирует корзину key на delay секунд по сигналу платформы и обнуляет её токены."""
+
+        def block(bucket: Optional[Bucket]) -> Tuple[Bucket, None]:
+            now = time.time()
+            _, _, blocked_until = self._refill(bucket, now)
+            return (0.0, now, max(blocked_until, now + delay)), None
+
+        self._update(key, block)
+        with self._lock:
+            self.backoffs += 1
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.time()
+        with self._lock:
+            stats: Dict[str, Any] = {
+                'backend': type(self).__name__,
+                'rate': self.rate,
+                'burst': self.burst,
+                'granted': self.granted,
+                'throttled': self.throttled,
+                'backoffs': self.backoffs,
+            }
+        stats['buckets'] = {
+            key: {'tokens': round(tokens, 2), 'blocked_for': max(0.0, round(blocked_until - now, 2))}
+            for key, (tokens, _, blocked_until) in (
+                (key, self._refill(bucket, now)) for key, bucket in self.buckets().items()
+            )
+        }
+        return stats
+
+
+class LocalRateLimiter(RateLimiter):
+    """Корзины в памяти процесса."""
+
+    def __init__(self, rate: float = RATE_LIMIT_RATE, burst: float = RATE_LIMIT_BURST) -> None:
+        super().__init__(rate, burst)
+        self._buckets: Dict[str, Bucket] = {}
+        self._buckets_lock = threading.Lock()
+
+    def _update(self, key: str, change: Callable[[Optional[Bucket]], Tuple[Bucket, T]]) -> T:
+        with self._buckets_lock:
+            self._buckets[key], result = change(self._buckets.get(key))
+        return result
+
+    def buckets(self) -> Dict[str, Bucket]:
+        with self._buckets_lock:
+            return dict(self._buckets)
+
+
+class SQLiteRateLimiter(RateLimiter):
+    """Корзины в общем для процессов файле SQLite.
+
+    Состояние корзины читается и записывается в одной транзакции BEGIN IMMEDIATE,
+    поэтому процессы не расходуют один токен дважды."""
+
+    def __init__(self, path: str = RATE_LIMIT_PATH, rate: float = RATE_LIMIT_RATE,
+                 burst: float = RATE_LIMIT_BURST) -> None:
+        super().__init__(rate, burst)
+        self.path = path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._connection().execute(
+            'CREATE TABLE IF NOT EXISTS rate_buckets '
+            '(key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL, blocked_until REAL NOT NULL)'
+        )
+
+    def _connection(self) -> sqlite3.Connection:
+        conn: Optional[sqlite3.Connection] = getattr(self._local, 'conn', None)
+        if conn is None:
+            # транзакциями управляем явно
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def _update(self, key: str, change: Callable[[Optional[Bucket]], Tuple[Bucket, T]]) -> T:
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute(
+                'SELECT tokens, updated_at, blocked_until FROM rate_buckets WHERE key = ?', (key,)
+            ).fetchone()
+            bucket, result = change(tuple(row) if row is not None else None)
+            conn.execute(
+                'INSERT OR REPLACE INTO rate_buckets (key, tokens, updated_at, blocked_until) VALUES (?, ?, ?, ?)',
+                (key, *bucket),
+            )
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+        return result
+
+    def buckets(self) -> Dict[str, Bucket]:
+        rows = self._connection().execute('SELECT key, tokens, updated_at, blocked_until FROM rate_buckets')
+        return {key: (tokens, updated, blocked_until) for key, tokens, updated, blocked_until in rows}
+
+
+def make_limiter() -> RateLimiter:
+    """Создаёт ограничитель с хранилищем корзин, выбранным настройкой RATE_LIMIT_BACKEND."""
+
+    return SQLiteRateLimiter() if RATE_LIMIT_BACKEND == 'sqlite' else LocalRateLimiter()
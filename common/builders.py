@@ -5,7 +5,8 @@ from clients.ok.ok_constants import OkButtonIntent, OkButtonType, OkAttachmentTy
 from clients.ok.ok_entities import (OkOutgoingMessage, OkMessage, OkRecipient, OkButton, OkAttachment, OkPayload,
                                     OkButtons)
 from common.constants import MessageDirection, MessageContentType, GenericTemplateActionType
-from common.entities import Payload, EventCommandToSend, InlineButton, GenericTemplateAction, Callback
+from common import callbacks
+from common.entities import Payload, EventCommandToSend, InlineButton, GenericTemplateAction
 
 
 logger = logging.getLogger('root')
@@ -34,10 +35,7 @@ class ECTSBuilder:
         buttons = []
         for entry in button_data:
             action = GenericTemplateAction(GenericTemplateActionType.POSTBACK)
-            action.payload = Callback.Schema().dumps({
-                 'type': entry['type'],
-                 'id': entry['id'],
-            })
+            action.payload = callbacks.make(entry['type'], entry['id'], entry.get('cursor'))
             btn = InlineButton(entry['title'], action)
             buttons.append(btn)
 
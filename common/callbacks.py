@@ -0,0 +1,88 @@
+"""Модуль компактного кодека команд инлайн-кнопок (Callback).
+
+Команда кнопки передаётся платформе в GenericTemplateAction.payload, длина которого ограничена 64 символами.
+Вместо JSON ({"type": "category", "id": 12}) команда кодируется строкой вида 1cc[.курсор]:
+
+- 1 - версия формата;
+- c - однобуквенный код типа команды (CallbackType);
+- c - id в системе счисления по основанию 36;
+- .курсор - необязательный курсор страницы списка, также по основанию 36.
+
+decode разбирает и компактный формат, и JSON кнопок, отправленных до его введения,
+поэтому старые сообщения в чатах продолжают работать. Ошибки разбора поднимают ValueError."""
+
+import re
+import string
+from typing import Dict, Optional
+
+from marshmallow import ValidationError
+
+from .constants import CallbackType
+from .entities import Callback
+from .schemas import get_schema
+
+
+VERSION = '1'
+CURSOR_SEPARATOR = '.'
+# длина GenericTemplateAction.payload на платформах
+PAYLOAD_LIMIT = 64
+
+TYPE_CODES: Dict[CallbackType, str] = {
+    CallbackType.GREETING: 'g',
+    CallbackType.CATEGORY: 'c',
+    CallbackType.PRODUCT: 'p',
+    CallbackType.ORDER: 'o',
+    CallbackType.PAYPAL: 'y',
+    CallbackType.STRIPE: 's',
+    CallbackType.NOTIFY: 'n',
+    CallbackType.INVITE_AGENT: 'i',
+}
+CODE_TYPES: Dict[str, CallbackType] = {code: callback_type for callback_type, code in TYPE_CODES.items()}
+
+_DIGITS = string.digits + string.ascii_lowercase
+_COMPACT = re.compile(rf'{VERSION}([a-z])([0-9a-z]+)(?:\.([0-9a-z]+))?')
+
+
+def to_base36(value: int) -> str:
+    if value < 0:
+        raise ValueError(f'Negative callback number: {value}')
+    digits = []
+    while True:
+        value, digit = divmod(value, 36)
+        digits.append(_DIGITS[digit])
+        if not value:
+            return ''.join(reversed(digits))
+
+
+def encode(callback: Callback) -> str:
+    """Кодирует команду кнопки в компактную строку."""
+
+    payload = f'{VERSION}{TYPE_CODES[callback.type]}{to_base36(callback.id)}'
+    if callback.cursor is not None:
+        payload += f'{CURSOR_SEPARATOR}{to_base36(callback.cursor)}'
+    if len(payload) > PAYLOAD_LIMIT:
+        raise ValueError(f'Callback payload is longer than {PAYLOAD_LIMIT} characters: {payload}')
+    return payload
+
+
+def make(callback_type: CallbackType, obj_id: int, cursor: Optional[int] = None) -> str:
+    """Кодирует команду кнопки по типу, id и курсору."""
+
+    return encode(Callback(callback_type, obj_id, cursor))
+
+
+def decode(payload: str) -> Callback:
+    """Разбирает команду кнопки в компактном формате или в прежнем JSON."""
+
+    if payload[:1] == '{':
+        try:
+            callback: Callback = get_schema(Callback).loads(payload)
+        except ValidationError as err:
+            raise ValueError(f'Malformed callback payload: {payload!r}') from err
+        return callback
+    match = _COMPACT.fullmatch(payload)
+    callback_type = CODE_TYPES.get(match.group(1)) if match is not None else None
+    if match is None or callback_type is None:
+        raise ValueError(f'Unknown callback payload: {payload!r}')
+    cursor = match.group(3)
+    return Callback(callback_type, int(match.group(2), 36), int(cursor, 36) if cursor is not None else None)
@@ -0,0 +1,109 @@
+"""Модуль быстрых кодеков сущностей для пути отправки сообщений.
+
+Кодек сущности строится один раз по полям её схемы marshmallow (common.schemas) и дальше сериализует
+объекты прямым обращением к атрибутам: без валидации, хуков и создания промежуточных объектов схемы.
+Порядок ключей, значения перечислений и отбрасывание None у SkipNoneSchema повторяют dump схемы,
+поэтому dumps даёт тот же JSON, что и Entity.Schema().dumps. Нетипичные значения полей
+сериализуются самим полем схемы.
+
+Проверка схемой marshmallow остаётся доступной как строгий режим (validate, dumps(strict=True))."""
+
+import json
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple, Type
+
+import marshmallow
+import marshmallow_enum
+
+from .entities import SkipNoneSchema
+from .schemas import get_schema
+
+
+Encoder = Callable[[Any], Any]
+
+_SCALARS: Dict[Type[marshmallow.fields.Field], Tuple[type, ...]] = {
+    marshmallow.fields.String: (str,),
+    marshmallow.fields.Url: (str,),
+    marshmallow.fields.Integer: (int,),
+    marshmallow.fields.Float: (float,),
+    marshmallow.fields.Boolean: (bool,),
+}
+
+
+class Codec:
+    """План сериализации одной схемы: список (атрибут, ключ, кодировщик значения)."""
+
+    def __init__(self, schema: marshmallow.Schema) -> None:
+        self.skip_none = isinstance(schema, SkipNoneSchema)
+        self.fields: List[Tuple[str, str, Encoder]] = [
+            (field.attribute or name, field.data_key or name, _compile(field, name))
+            for name, field in schema.dump_fields.items()
+        ]
+
+    def encode(self, obj: Any) -> Dict[str, Any]:
+        data = {key: encoder(getattr(obj, attr)) for attr, key, encoder in self.fields}
+        if self.skip_none:
+            return {key: value for key, value in data.items() if value is not None}
+        return data
+
+
+def _compile(field: marshmallow.fields.Field, name: str) -> Encoder:
+    """Возвращает функцию сериализации значения поля."""
+
+    if isinstance(field, marshmallow.fields.Nested):
+        codec = Codec(field.schema)
+        return lambda value: None if value is None else codec.encode(value)
+    if isinstance(field, marshmallow.fields.List):
+        inner = _compile(field.inner, name)
+        return lambda value: None if value is None else [inner(item) for item in value]
+    if isinstance(field, marshmallow_enum.EnumField) and field.dump_by == marshmallow_enum.LoadDumpOptions.value:
+        return lambda value: None if value is None else value.value
+
+    types = _SCALARS.get(type(field), ())
+
+    def encode(value: Any) -> Any:
+        if value is None or type(value) in types:
+            return value
+        return field._serialize(value, name, None)
+
+    return encode
+
+
+_codecs: Dict[Type[Any], Codec] = {}
+_lock = threading.Lock()
+
+
+def get_codec(entity: Type[Any]) -> Codec:
+    """Возвращает кодек для класса сущности, строя его при первом обращении."""
+
+    codec = _codecs.get(entity)
+    if codec is None:
+        with _lock:
+            codec = _codecs.get(entity)
+            if codec is None:
+                codec = Codec(get_schema(entity))
+                _codecs[entity] = codec
+    return codec
+
+
+def encode(obj: Any) -> Dict[str, Any]:
+    """Сериализует объект сущности в словарь, совпадающий с результатом dump схемы."""
+
+    return get_codec(type(obj)).encode(obj)
+
+
+def validate(obj: Any, data: Optional[Dict[str, Any]] = None) -> None:
+    """Строгий режим: проверяет сериализованный объект схемой, при ошибках поднимает ValidationError."""
+
+    errors = get_schema(type(obj)).validate(encode(obj) if data is None else data)
+    if errors:
+        raise marshmallow.ValidationError(errors)
+
+
+def dumps(obj: Any, strict: bool = False) -> str:
+    """Сериализует объект сущности в JSON; при strict результат предварительно проверяется схемой."""
+
+    data = encode(obj)
+    if strict:
+        validate(obj, data)
+    return json.dumps(data)
@@ -48,6 +48,13 @@ class ContentType(Enum):
     COMMAND = 'command'
 
 
+class OutboxStatus(Choice):
+    PENDING = 1
+    SENDING = 2
+    SENT = 3
+    FAILED = 5
+
+
 class MessageDirection(Choice):
     RECEIVED = 1
     SENT = 2
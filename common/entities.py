@@ -208,7 +208,7 @@ class EventCommandToSend(LinterFix, AbstractCommand):
 #####
 
 @dataclass(order=True, base_schema=SkipNoneSchema)
-class Callback:
+class Callback(LinterFix):
     Schema: ClassVar[Type[marshmallow.Schema]] = marshmallow.Schema
 
     type: CallbackType = field(
@@ -217,3 +217,5 @@ class Callback:
         }
     )
     id: int
+    # курсор страницы списка (см. common.callbacks)
+    cursor: Optional[int] = None
@@ -0,0 +1,40 @@
+"""Модуль реестра переиспользуемых экземпляров схем marshmallow.
+
+Создание схемы (Entity.Schema()) - дорогая операция: для каждого экземпляра заново строятся и привязываются поля.
+Реестр создаёт по одной схеме на класс сущности (common.entities, clients/*/*_entities, billing/*/*_entities)
+при первом обращении и далее отдаёт её повторно. Схемы создаются без параметров (only, exclude, context),
+а load/dump/validate не меняют состояние схемы, поэтому один экземпляр можно использовать из разных потоков."""
+
+import threading
+from typing import Any, Dict, Type
+
+import marshmallow
+
+
+_schemas: Dict[Type[Any], marshmallow.Schema] = {}
+_lock = threading.Lock()
+
+
+def get_schema(entity: Type[Any]) -> marshmallow.Schema:
+    """Возвращает общий экземпляр схемы для класса сущности."""
+
+    schema = _schemas.get(entity)
+    if schema is None:
+        with _lock:
+            schema = _schemas.get(entity)
+            if schema is None:
+                schema = entity.Schema()
+                _schemas[entity] = schema
+    return schema
+
+
+def schema_of(obj: Any) -> marshmallow.Schema:
+    """Возвращает общий экземпляр схемы для объекта сущности."""
+
+    return get_schema(type(obj))
+
+
+def registered() -> Dict[str, str]:
+    """Перечень созданных схем: имя сущности -> имя класса схемы."""
+
+    return {entity.__qualname__: type(schema).__name__ for entity, schema in list(_schemas.items())}
@@ -31,15 +31,19 @@ class DialogButtons(Enum):
     ORDER_PRODUCT = config['dialog']['OrderProductButton']
     PAYPAL_OPTION = config['dialog']['PayPalOptionButton']
     STRIPE_OPTION = config['dialog']['StripeOptionButton']
+    PREVIOUS_PAGE = config['dialog']['PreviousPageButton']
+    NEXT_PAGE = config['dialog']['NextPageButton']
 
 
 class DialogPhrases(Enum):
     SESSION_GREETING = config['dialog']['SessionGreeting']
     CHOOSE_CATEGORY = config['dialog']['ChooseCategory']
     CHOOSE_PRODUCT = config['dialog']['ChooseProduct']
+    SEARCH_RESULTS = config['dialog']['SearchResults']
     ORDER_PRODUCT = config['dialog']['OrderProduct']
     ORDER_CONFIRM = config['dialog']['OrderConfirm']
     PAYMENT_LINK = config['dialog']['PaymentLink']
+    PAYMENT_PENDING = config['dialog']['PaymentPending']
 
 
 class NotifyPhrases(Enum):
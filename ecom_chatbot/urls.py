@@ -2,7 +2,7 @@ from django.contrib import admin
 from django.urls import path, include
 
 from shop.views import index_page
-from bot.views import jivo_webhook, ok_webhook, chat_view
+from bot.views import jivo_webhook, ok_webhook, chat_view, chat_messages_view, chat_stream_view, stats_view
 
 
 urlpatterns = [
@@ -11,6 +11,9 @@ urlpatterns = [
     path('ok_webhook/', ok_webhook),
     path('jivo_webhook/test', jivo_webhook),
     path('chats/<int:pk>/', chat_view),
+    path('chats/<int:pk>/messages/', chat_messages_view),
+    path('chats/<int:pk>/stream/', chat_stream_view),
     path('chats/', chat_view),
+    path('stats/', stats_view),
     path('billing/', include('billing.urls', namespace='billing')),
 ]
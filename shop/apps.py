@@ -1,5 +1,11 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class ShopConfig(AppConfig):
     name = 'shop'
+
+    def ready(self) -> None:
+        from . import signals
+        post_migrate.connect(signals.rebuild_category_paths, sender=self)
+        post_migrate.connect(signals.ensure_search_index, sender=self)
@@ -0,0 +1,255 @@
+"""Модуль неизменяемого снимка каталога магазина в памяти процесса.
+
+Снимок (категории, индексы категория -> товары и поддерево категории -> товары, проекции товаров)
+строится тремя запросами; товары, снятые с продажи (is_active=False), в снимок не попадают,
+и снимок целиком подменяется новым при изменении Category/Product (см. shop.signals), а также по истечении
+CATALOG_SNAPSHOT_TTL - чтобы подхватить изменения из других процессов.
+Шаги просмотра каталога в диалоге обслуживаются из снимка без обращений к базе;
+если снимок построить не удалось, используются менеджеры моделей."""
+
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Any, Dict, List, Mapping, Optional, Sequence, Tuple, Union
+
+from djmoney.money import Money
+
+from patterns.singleton import Singleton
+from .constants import CATALOG_PAGE_SIZE, CATALOG_SNAPSHOT_TTL
+from .managers import PATH_SEPARATOR, PRODUCT_FIELDS, row_type
+from .models import Category, Product
+
+
+logger = logging.getLogger('root')
+
+
+@dataclass(frozen=True)
+class CategoryView:
+    """Проекция категории в снимке каталога."""
+
+    id: int
+    name: str
+    parent_category_id: Optional[int]
+    path: str
+
+
+@dataclass(frozen=True)
+class ProductView:
+    """Проекция товара в снимке каталога."""
+
+    id: int
+    name: str
+    price: Money
+    image_url: Optional[str]
+    description: str
+    is_active: bool
+    categories: Tuple[int, ...]
+
+
+@dataclass(frozen=True)
+class CatalogSnapshot:
+    """Версионированный снимок каталога, доступный только для чтения.
+
+    Методы повторяют формат ответов CategoryManager и ProductManager."""
+
+    version: int
+    categories: Mapping[int, CategoryView]
+    children: Mapping[Optional[int], Tuple[int, ...]]
+    products: Mapping[int, ProductView]
+    category_products: Mapping[int, Tuple[int, ...]]
+    subtree_products: Mapping[int, Tuple[int, ...]]
+
+    def _category_dict(self, category: CategoryView) -> Dict[str, Any]:
+        return {
+            'id': category.id,
+            'name': category.name,
+            'parent_category_id': category.parent_category_id,
+            'child_category_exists': bool(self.children.get(category.id)),
+            'path': category.path,
+        }
+
+    def get_categories(self, category_id: Optional[int] = None) -> List[Dict[str, Any]]:
+        return [self._category_dict(self.categories[pk]) for pk in self.children.get(category_id, ())]
+
+    def get_category_by_id(self, category_id: Optional[int]) -> Dict[str, Any]:
+        if category_id is None or category_id not in self.categories:
+            raise Category.DoesNotExist(f'Category #{category_id} does not exist')
+        return self._category_dict(self.categories[category_id])
+
+    def get_breadcrumb(self, category_id: int) -> List[Dict[str, Any]]:
+        category = self.get_category_by_id(category_id)
+        return [
+            {'id': self.categories[int(pk)].id, 'name': self.categories[int(pk)].name}
+            for pk in category['path'].split(PATH_SEPARATOR) if pk and int(pk) in self.categories
+        ]
+
+    def get_subtree_products(self, category_id: Optional[int]) -> List[Dict[str, Any]]:
+        return [
+            {
+                'id': product.id,
+                'name': product.name,
+                'price': product.price.amount,
+                'image_url': product.image_url,
+                'description': product.description,
+                'is_active': product.is_active,
+            } for product in (self.products[pk] for pk in self.subtree_products.get(category_id, ()))
+        ] if category_id is not None else []
+
+    def get_subtree_product_page(self, category_id: Optional[int], offset: int = 0,
+                                 limit: int = CATALOG_PAGE_SIZE) -> List[Dict[str, Any]]:
+        ids = self.subtree_products.get(category_id, ()) if category_id is not None else ()
+        return [{'id': pk, 'name': self.products[pk].name} for pk in ids[offset:offset + limit]]
+
+    def get_products(self, category_id: Optional[int]) -> List[Dict[str, Any]]:
+        return [
+            {
+                'id': product.id,
+                'name': product.name,
+                'categories': category_id,
+                'price': product.price.amount,
+                'image_url': product.image_url,
+                'description': product.description,
+                'is_active': product.is_active,
+            } for product in (self.products[pk] for pk in self.category_products.get(category_id, ()))
+        ] if category_id is not None else []
+
+    def get_product_by_id(self, product_id: Optional[int], fields: Sequence[str] = PRODUCT_FIELDS) -> Any:
+        if product_id is None or product_id not in self.products:
+            raise Product.DoesNotExist(f'Product #{product_id} does not exist')
+        product = self.products[product_id]
+        fields = tuple(fields)
+        return row_type('ProductRow', fields)(*(getattr(product, field) for field in fields))
+
+
+class ManagerCatalog:
+    """Запасной вариант каталога с тем же интерфейсом, что и у снимка: запросы через менеджеры моделей."""
+
+    version = 0
+
+    def get_categories(self, category_id: Optional[int] = None) -> List[Dict[str, Any]]:
+        return Category.objects.get_categories(category_id)
+
+    def get_category_by_id(self, category_id: Optional[int]) -> Dict[str, Any]:
+        return Category.objects.get_category_by_id(category_id)
+
+    def get_breadcrumb(self, category_id: int) -> List[Dict[str, Any]]:
+        return Category.objects.get_breadcrumb(self.get_category_by_id(category_id)['path'])
+
+    def get_subtree_products(self, category_id: Optional[int]) -> List[Dict[str, Any]]:
+        return Product.objects.get_subtree_products(category_id)
+
+    def get_subtree_product_page(self, category_id: Optional[int], offset: int = 0,
+                                 limit: int = CATALOG_PAGE_SIZE) -> List[Dict[str, Any]]:
+        return Product.objects.get_subtree_product_page(category_id, offset, limit)
+
+    def get_products(self, category_id: Optional[int]) -> List[Dict[str, Any]]:
+        return Product.objects.get_products(category_id)
+
+    def get_product_by_id(self, product_id: Optional[int], fields: Sequence[str] = PRODUCT_FIELDS) -> Any:
+        return Product.objects.get_product_by_id(product_id, fields)
+
+
+Catalog = Union[CatalogSnapshot, ManagerCatalog]
+
+
+def build_snapshot(version: int) -> CatalogSnapshot:
+    """Строит снимок каталога тремя запросами: категории, товары в продаже и связи товар-категория."""
+
+    categories: Dict[int, CategoryView] = {}
+    children: Dict[Optional[int], List[int]] = {}
+    for pk, name, parent_id, path in Category.objects.order_by('sort_order', 'name', 'id').values_list(
+            'id', 'name', 'parent_category_id', 'path'):
+        categories[pk] = CategoryView(pk, name, parent_id, path)
+        children.setdefault(parent_id, []).append(pk)
+
+    links: Dict[int, List[int]] = {}
+    for product_id, category_id in Product.categories.through.objects.values_list('product_id', 'category_id'):
+        links.setdefault(product_id, []).append(category_id)
+
+    products: Dict[int, ProductView] = {}
+    category_products: Dict[int, List[int]] = {}
+    # товар попадает в поддеревья всех предков своих категорий (по путям категорий)
+    subtree_products: Dict[int, Dict[int, None]] = {}
+    rows = Product.objects.filter(is_active=True).order_by('sort_order', 'name', 'id').values_list(
+        'id', 'name', 'price', 'price_currency', 'image_url', 'description', 'is_active')
+    for pk, name, amount, currency, image_url, description, is_active in rows:
+        product_categories = tuple(sorted(links.get(pk, ())))
+        products[pk] = ProductView(pk, name, Money(amount, currency), image_url, description, is_active,
+                                   product_categories)
+        for category_id in product_categories:
+            category_products.setdefault(category_id, []).append(pk)
+            category = categories.get(category_id)
+            for ancestor in category.path.split(PATH_SEPARATOR) if category is not None else ():
+                if ancestor:
+                    subtree_products.setdefault(int(ancestor), {})[pk] = None
+
+    return CatalogSnapshot(
+        version=version,
+        categories=MappingProxyType(categories),
+        children=MappingProxyType({key: tuple(value) for key, value in children.items()}),
+        products=MappingProxyType(products),
+        category_products=MappingProxyType({key: tuple(value) for key, value in category_products.items()}),
+        subtree_products=MappingProxyType({key: tuple(value) for key, value in subtree_products.items()}),
+    )
+
+
+class CatalogStore(metaclass=Singleton):
+    """Хранит текущий снимок каталога процесса и подменяет его целиком при изменениях."""
+
+    def __init__(self) -> None:
+        self._snapshot: Optional[CatalogSnapshot] = None
+        self._built_at = 0.0
+        self._stale = True
+        self._version = 0
+        self._lock = threading.Lock()
+        self.builds = 0
+        self.fallbacks = 0
+
+    def invalidate(self) -> None:
+        """Помечает снимок устаревшим, новый будет построен при следующем обращении."""
+
+        self._stale = True
+
+    def _is_fresh(self) -> bool:
+        return not self._stale and time.monotonic() - self._built_at < CATALOG_SNAPSHOT_TTL
+
+    def snapshot(self) -> Optional[CatalogSnapshot]:
+        """Возвращает актуальный снимок каталога, при необходимости перестраивая его."""
+
+        if self._snapshot is not None and self._is_fresh():
+            return self._snapshot
+        with self._lock:
+            if self._snapshot is None or not self._is_fresh():
+                # флаг сбрасывается до построения: изменение во время построения снова пометит снимок устаревшим
+                self._stale = False
+                try:
+                    self._snapshot = build_snapshot(self._version + 1)
+                    self._version += 1
+                    self._built_at = time.monotonic()
+                    self.builds += 1
+                except Exception as e:
+                    logger.exception(f'Catalog snapshot build failed: {e.args}')
+                    self._stale = True
+                    self._snapshot = None
+        return self._snapshot
+
+    def current(self) -> Catalog:
+        """Возвращает снимок каталога или, если его нет, каталог на основе менеджеров моделей."""
+
+        snapshot = self.snapshot()
+        if snapshot is None:
+            self.fallbacks += 1
+            return ManagerCatalog()
+        return snapshot
+
+    def stats(self) -> Dict[str, Any]:
+        snapshot = self._snapshot
+        return {
+            'version': snapshot.version if snapshot else None,
+            'categories': len(snapshot.categories) if snapshot else 0,
+            'products': len(snapshot.products) if snapshot else 0,
+            'builds': self.builds,
+            'fallbacks': self.fallbacks,
+        }
@@ -0,0 +1,16 @@
+"""Модуль с настройками магазина, задаваемыми через переменные окружения."""
+
+import os
+
+
+# Снимок каталога в памяти перестраивается не реже, чем раз в CATALOG_SNAPSHOT_TTL секунд
+CATALOG_SNAPSHOT_TTL = float(os.getenv('CATALOG_SNAPSHOT_TTL', '60'))
+# Количество подкатегорий и товаров на странице списка категории в диалоге (без кнопок перехода по страницам)
+CATALOG_PAGE_SIZE = int(os.getenv('CATALOG_PAGE_SIZE', '8'))
+# Произвольный текст пользователя не короче SEARCH_MIN_LENGTH символов ищется среди товаров
+SEARCH_MIN_LENGTH = int(os.getenv('SEARCH_MIN_LENGTH', '3'))
+# Количество строк файла каталога, загружаемых одной транзакцией (manage.py import_catalog)
+CATALOG_IMPORT_CHUNK = int(os.getenv('CATALOG_IMPORT_CHUNK', '500'))
+# Повторное нажатие кнопки оплаты или повтор вебхука в течение ORDER_IDEMPOTENCY_WINDOW секунд
+# возвращает уже созданный заказ
+ORDER_IDEMPOTENCY_WINDOW = float(os.getenv('ORDER_IDEMPOTENCY_WINDOW', '600'))
@@ -0,0 +1,264 @@
+"""Модуль потоковой загрузки каталога магазина из файла CSV или JSON Lines.
+
+Каждая строка файла - категория или товар (поле type: category или product, по умолчанию product).
+Записи сопоставляются с базой по внешнему артикулу (поле sku):
+    category: sku, name, parent (артикул родительской категории), sort_order, is_active
+    product: sku, name, price, currency, description, image_url, sort_order, is_active,
+             categories (артикулы категорий через '|', в JSON Lines также списком)
+Категория должна встретиться в файле раньше товаров, которые на неё ссылаются (или быть загружена ранее);
+родительская категория может идти и после дочерней.
+
+Файл читается построчно и загружается пачками по CATALOG_IMPORT_CHUNK строк. Пачка - одна транзакция:
+новые записи добавляются bulk_create, существующие обновляются по id одним executemany, связи товаров
+с категориями заменяются массовой вставкой в промежуточную таблицу. В памяти, кроме текущей пачки, хранится только
+соответствие артикулов категорий их id, поэтому расход памяти не зависит от размера файла.
+
+Товары с артикулом, которых не оказалось в файле, после загрузки снимаются с продажи (is_active=False):
+они определяются по времени обновления раньше начала загрузки. Массовые операции не вызывают сигналы моделей,
+поэтому пути категорий, индекс поиска и снимок каталога обновляются один раз в конце загрузки."""
+
+import csv
+import json
+import logging
+import os
+import time
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from django.db import connection, reset_queries, transaction
+from django.db.models import Model
+from django.utils import timezone
+from djmoney.money import Money
+
+from .catalog import CatalogStore
+from .constants import CATALOG_IMPORT_CHUNK
+from .models import Category, Product
+from .search import ProductSearch
+
+
+logger = logging.getLogger('root')
+
+CATEGORY = 'category'
+PRODUCT = 'product'
+# расширение файла -> формат
+FORMATS = {'csv': 'csv', 'jsonl': 'jsonl', 'ndjson': 'jsonl'}
+# разделитель артикулов категорий товара в CSV
+CATEGORY_SEPARATOR = '|'
+DEFAULT_CURRENCY = 'RUB'
+TRUE_VALUES = frozenset(('1', 'true', 'yes', 'y', 'да'))
+FALSE_VALUES = frozenset(('0', 'false', 'no', 'n', 'нет'))
+CATEGORY_UPDATE_FIELDS = ('name', 'parent_category', 'is_active', 'sort_order', 'updated_at')
+PRODUCT_UPDATE_FIELDS = ('name', 'price', 'price_currency', 'image_url', 'description', 'is_active', 'sort_order',
+                         'updated_at')
+
+Row = Optional[Dict[str, Any]]
+
+
+def read_rows(path: str, file_format: Optional[str] = None) -> Iterator[Row]:
+    """Построчно читает файл каталога. Формат определяется по расширению, если не указан явно.
+
+    Для строк JSON Lines, которые не удалось разобрать, возвращает None."""
+
+    file_format = FORMATS.get((file_format or os.path.splitext(path)[1].lstrip('.')).lower())
+    if file_format is None:
+        raise ValueError(f'Unknown catalog format of {path}, expected one of: {", ".join(FORMATS)}')
+    with open(path, 'r', newline='', encoding='utf-8-sig') as f:
+        if file_format == 'csv':
+            yield from csv.DictReader(f)
+            return
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                row = None
+            yield row if isinstance(row, dict) else None
+
+
+def _text(row: Dict[str, Any], key: str) -> str:
+    value = row.get(key)
+    return '' if value is None else str(value).strip()
+
+
+def _flag(row: Dict[str, Any], key: str, default: bool = True) -> bool:
+    value = _text(row, key).lower()
+    if not value:
+        return default
+    if value in TRUE_VALUES or value in FALSE_VALUES:
+        return value in TRUE_VALUES
+    raise ValueError(f'{key}: {value!r} is not a boolean')
+
+
+def _number(row: Dict[str, Any], key: str, default: int = 1) -> int:
+    value = _text(row, key)
+    return int(value) if value else default
+
+
+def _price(row: Dict[str, Any]) -> Money:
+    value = _text(row, 'price') or '0'
+    try:
+        amount = Decimal(value)
+    except InvalidOperation:
+        raise ValueError(f'price: {value!r} is not a number')
+    return Money(amount, _text(row, 'currency') or DEFAULT_CURRENCY)
+
+
+def update_rows(objs: List[Model], fields: Tuple[str, ...]) -> None:
+    """Обновляет поля fields записей objs по их id одним параметризованным UPDATE (executemany).
+
+    bulk_update строит для каждого поля выражение CASE с ветвью на каждую запись, и на пачке в сотни записей
+    сборка этих выражений в Python занимает большую часть времени загрузки."""
+
+    if not objs:
+        return
+    meta = objs[0]._meta
+    quote = connection.ops.quote_name
+    model_fields = [meta.get_field(field) for field in fields]
+    sql = (f'UPDATE {quote(meta.db_table)} SET {", ".join(f"{quote(field.column)} = %s" for field in model_fields)} '
+           f'WHERE {quote(meta.pk.column)} = %s')
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, [
+            [field.get_db_prep_save(getattr(obj, field.attname), connection) for field in model_fields] + [obj.pk]
+            for obj in objs
+        ])
+
+
+def _category_skus(row: Dict[str, Any]) -> List[str]:
+    value = row.get('categories')
+    skus = value if isinstance(value, list) else _text(row, 'categories').split(CATEGORY_SEPARATOR)
+    return list(dict.fromkeys(str(sku).strip() for sku in skus if str(sku).strip()))
+
+
+class CatalogImport:
+    """Загрузка каталога из последовательности строк (см. read_rows) пачками по chunk строк."""
+
+    def __init__(self, chunk: int = CATALOG_IMPORT_CHUNK, deactivate_missing: bool = True) -> None:
+        self.chunk = max(1, chunk)
+        self.deactivate_missing = deactivate_missing
+        # артикул -> id всех категорий с артикулом
+        self.categories: Dict[str, int] = {}
+        # категории, родительская которых ещё не загружена: артикул -> артикул родительской
+        self.orphans: Dict[str, str] = {}
+        self.counts = dict.fromkeys(('rows', 'skipped', 'categories_created', 'categories_updated',
+                                     'products_created', 'products_updated', 'links', 'unknown_categories',
+                                     'deactivated'), 0)
+
+    def run(self, rows: Iterable[Row]) -> Dict[str, Any]:
+        """Загружает строки и возвращает счётчики загрузки, время и скорость (строк в секунду)."""
+
+        started_at = timezone.now()
+        started = time.perf_counter()
+        self.categories = dict(Category.objects.filter(sku__isnull=False).values_list('sku', 'id'))
+        iterator = iter(rows)
+        chunk = list(islice(iterator, self.chunk))
+        while chunk:
+            with transaction.atomic():
+                self._load(chunk)
+            # при DEBUG=True connection.queries хранит текст тысяч последних запросов массовой вставки
+            reset_queries()
+            logger.debug(f'Catalog import: {self.counts["rows"]} rows loaded')
+            chunk = list(islice(iterator, self.chunk))
+
+        with transaction.atomic():
+            for sku, parent in self.orphans.items():
+                logger.warning(f'Catalog import: parent category {parent!r} of category {sku!r} not found')
+            if self.deactivate_missing:
+                self.counts['deactivated'] = Product.objects.filter(
+                    sku__isnull=False, is_active=True, updated_at__lt=started_at,
+                ).update(is_active=False)
+            Category.objects.rebuild_paths()
+        ProductSearch().ensure_index(rebuild=True)
+        CatalogStore().invalidate()
+
+        seconds = time.perf_counter() - started
+        result: Dict[str, Any] = dict(self.counts, seconds=round(seconds, 3),
+                                      rows_per_sec=round(self.counts['rows'] / seconds, 1) if seconds else 0.0)
+        logger.info(f'Catalog import finished: {result}')
+        return result
+
+    def _load(self, rows: List[Row]) -> None:
+        # повторный артикул в пачке: действует последняя строка
+        categories: Dict[str, Tuple[Category, str]] = {}
+        products: Dict[str, Tuple[Product, List[str]]] = {}
+        for row in rows:
+            self.counts['rows'] += 1
+            try:
+                if row is None:
+                    raise ValueError('not a JSON object')
+                kind = _text(row, 'type').lower() or PRODUCT
+                sku, name = _text(row, 'sku'), _text(row, 'name')
+                if not sku or not name:
+                    raise ValueError('sku and name are required')
+                if kind == CATEGORY:
+                    categories[sku] = (Category(sku=sku, name=name, is_active=_flag(row, 'is_active'),
+                                                sort_order=_number(row, 'sort_order')), _text(row, 'parent'))
+                elif kind == PRODUCT:
+                    products[sku] = (Product(sku=sku, name=name, price=_price(row),
+                                             image_url=_text(row, 'image_url') or None,
+                                             description=_text(row, 'description'),
+                                             is_active=_flag(row, 'is_active'),
+                                             sort_order=_number(row, 'sort_order')), _category_skus(row))
+                else:
+                    raise ValueError(f'unknown type {kind!r}')
+            except ValueError as err:
+                self.counts['skipped'] += 1
+                logger.warning(f'Catalog import: row {self.counts["rows"]} skipped: {err}')
+        if categories:
+            self._upsert_categories(categories)
+        if products:
+            self._upsert_products(products)
+
+    def _upsert_categories(self, rows: Dict[str, Tuple[Category, str]]) -> None:
+        now = timezone.now()
+        created, updated = [], []
+        for sku, (category, parent) in rows.items():
+            category.parent_category_id = self.categories.get(parent) if parent else None
+            self.orphans.pop(sku, None)
+            if parent and category.parent_category_id is None:
+                self.orphans[sku] = parent
+            if sku in self.categories:
+                category.pk, category.updated_at = self.categories[sku], now
+                updated.append(category)
+            else:
+                created.append(category)
+        Category.objects.bulk_create(created)
+        update_rows(updated, CATEGORY_UPDATE_FIELDS)
+        self.categories.update(Category.objects.filter(sku__in=[c.sku for c in created]).values_list('sku', 'id'))
+        self.counts['categories_created'] += len(created)
+        self.counts['categories_updated'] += len(updated)
+
+        # родительские категории, загруженные в этой пачке или позже дочерних
+        adopted = [Category(pk=self.categories[sku], parent_category_id=self.categories[parent])
+                   for sku, parent in self.orphans.items() if parent in self.categories]
+        update_rows(adopted, ('parent_category',))
+        self.orphans = {sku: parent for sku, parent in self.orphans.items() if parent not in self.categories}
+
+    def _upsert_products(self, rows: Dict[str, Tuple[Product, List[str]]]) -> None:
+        now = timezone.now()
+        ids = dict(Product.objects.filter(sku__in=list(rows)).values_list('sku', 'id'))
+        created, updated = [], []
+        for sku, (product, _) in rows.items():
+            if sku in ids:
+                product.pk, product.updated_at = ids[sku], now
+                updated.append(product)
+            else:
+                created.append(product)
+        Product.objects.bulk_create(created)
+        update_rows(updated, PRODUCT_UPDATE_FIELDS)
+        through = Product.categories.through
+        through.objects.filter(product_id__in=[product.pk for product in updated]).delete()
+        ids.update(Product.objects.filter(sku__in=[p.sku for p in created]).values_list('sku', 'id'))
+        self.counts['products_created'] += len(created)
+        self.counts['products_updated'] += len(updated)
+
+        links = []
+        for sku, (_, category_skus) in rows.items():
+            for category_sku in category_skus:
+                if category_sku in self.categories:
+                    links.append(through(product_id=ids[sku], category_id=self.categories[category_sku]))
+                else:
+                    self.counts['unknown_categories'] += 1
+        through.objects.bulk_create(links)
+        self.counts['links'] += len(links)
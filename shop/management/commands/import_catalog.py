@@ -0,0 +1,36 @@
+"""Команда загрузки каталога магазина из файла CSV или JSON Lines (см. shop.importer).
+
+usage: python manage.py import_catalog <файл> [--format csv|jsonl] [--chunk N] [--keep-missing]"""
+
+from typing import Any
+
+from django.core.management.base import BaseCommand, CommandError, CommandParser
+
+from shop.constants import CATALOG_IMPORT_CHUNK
+from shop.importer import FORMATS, CatalogImport, read_rows
+
+
+class Command(BaseCommand):
+    help = 'Streams categories and products from a CSV or JSON Lines file, upserting them by SKU in chunks.'
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument('path', help='catalog file')
+        parser.add_argument('--format', choices=sorted(FORMATS), help='file format, by default the file extension')
+        parser.add_argument('--chunk', type=int, default=CATALOG_IMPORT_CHUNK,
+                            help='number of rows loaded in one transaction')
+        parser.add_argument('--keep-missing', action='store_true',
+                            help='do not deactivate products with a SKU that are absent from the file')
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        try:
+            rows = read_rows(options['path'], options['format'])
+            result = CatalogImport(options['chunk'], not options['keep_missing']).run(rows)
+        except (OSError, ValueError) as err:
+            raise CommandError(str(err))
+        self.stdout.write(
+            f'Imported {result["rows"]} rows in {result["seconds"]} s ({result["rows_per_sec"]} rows/s): '
+            f'categories {result["categories_created"]} created, {result["categories_updated"]} updated; '
+            f'products {result["products_created"]} created, {result["products_updated"]} updated, '
+            f'{result["deactivated"]} deactivated; {result["links"]} category links; '
+            f'{result["skipped"]} rows skipped, {result["unknown_categories"]} unknown category SKUs'
+        )
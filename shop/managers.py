@@ -2,60 +2,234 @@
 
 Методы модуля предназначены для совершения операций между ботом и базой данных магазина."""
 
-from typing import Optional, List, Dict, Any, TYPE_CHECKING
+from collections import namedtuple
+from functools import lru_cache
+from datetime import timedelta
+from typing import Optional, List, Dict, Any, Sequence, Tuple, Type, TYPE_CHECKING
 
 from django.utils import timezone
-from django.db import models
-from django.forms.models import model_to_dict
+from django.db import IntegrityError, models, transaction
+from django.db.models.functions import Concat, Substr
 from django.db.models.query import QuerySet
+from djmoney.models.fields import MoneyField
+from djmoney.money import Money
+from djmoney.utils import get_currency_field_name
 
 from bot.models import Chat
 from common.constants import OrderStatus
+from .constants import CATALOG_PAGE_SIZE, ORDER_IDEMPOTENCY_WINDOW
 
 if TYPE_CHECKING:
-    from .models import Order
+    from .models import Category, Order
+
+
+CATEGORY_FIELDS = ('id', 'name', 'parent_category_id', 'child_category_exists', 'path')
+PRODUCT_FIELDS = ('id', 'name', 'categories', 'price', 'image_url', 'description', 'is_active')
+PATH_SEPARATOR = '/'
+# заказы в этих статусах ещё ожидают оплаты: повторное нажатие кнопки возвращает их же
+OPEN_ORDER_STATUSES = (OrderStatus.NEW.value, OrderStatus.PENDING_PAYMENT.value)
+# символ, больший любого символа пути: пути поддерева лежат в диапазоне [path, path + PATH_END)
+PATH_END = '~'
+
+
+def subtree(path: Any) -> Dict[str, Any]:
+    """Условие фильтра категорий поддерева с корнем по пути path (строка или выражение).
+
+    Диапазон вместо startswith: LIKE в SQLite не использует индекс."""
+
+    return {
+        'path__gte': path,
+        'path__lt': Concat(path, models.Value(PATH_END), output_field=models.CharField())
+        if isinstance(path, models.Expression) else path + PATH_END,
+    }
+
+
+@lru_cache(maxsize=None)
+def row_type(typename: str, fields: Tuple[str, ...]) -> Type[Tuple[Any, ...]]:
+    """Возвращает класс неизменяемой строки-проекции с полями fields (namedtuple: __slots__ пуст, без __dict__).
+
+    На каждую проекцию создаётся один класс, строки с одинаковыми полями сравнимы между собой."""
+
+    row: Type[Tuple[Any, ...]] = namedtuple(typename, fields)  # type: ignore
+    return row
+
+
+def project(queryset: QuerySet, fields: Tuple[str, ...]) -> List[Any]:
+    """Выбирает из queryset только столбцы fields и возвращает строки-проекции (см. row_type).
+
+    Денежное поле выбирается вместе со столбцом валюты и собирается в Money."""
+
+    columns = list(fields)
+    money = {}
+    for field in fields:
+        model_field = queryset.model._meta.get_field(field)
+        if isinstance(model_field, MoneyField):
+            money[field] = len(columns)
+            columns.append(get_currency_field_name(field, model_field))
+    row = row_type(f'{queryset.model.__name__}Row', fields)
+    return [
+        row(*(Money(value, values[money[field]]) if field in money and value is not None else value
+              for field, value in zip(fields, values)))
+        for values in queryset.values_list(*columns)
+    ]
 
 
 class CategoryManager(models.Manager):
+    def _with_children_flag(self) -> QuerySet:
+        return self.annotate(
+            child_category_exists=models.Exists(self.filter(parent_category_id=models.OuterRef('pk'))),
+        )
+
     def get_categories(self, category_id: Optional[int] = None) -> List[Dict[str, Any]]:
         """Возвращает список категорий в формате словаря.
 
         Возможно указание родительской категории для выдачи подкатегорий."""
 
-        categories_queryset = self.filter(parent_category_id=category_id)
-        categories = [{'id': c.id, 'name': c.name, 'parent_category_id': c.parent_category_id,
-                       'child_category_exists': c.child_categories.exists()} for c in categories_queryset]
-        # ToDo: optimize existence check
+        categories = list(self._with_children_flag().filter(parent_category_id=category_id).values(*CATEGORY_FIELDS))
         return categories
 
     def get_category_by_id(self, category_id: Optional[int]) -> Dict[str, Any]:
-        category = self.filter(pk=category_id).first()
-        result = {'id': category.id, 'name': category.name, 'parent_category_id': category.parent_category_id,
-                  'child_category_exists': category.child_categories.exists()}
-
+        result: Dict[str, Any] = self._with_children_flag().values(*CATEGORY_FIELDS).get(pk=category_id)
         return result
 
+    def get_breadcrumb(self, path: str) -> List[Dict[str, Any]]:
+        """Возвращает цепочку категорий от корня до категории с путём path (поле path из get_category_by_id)."""
+
+        ids = [int(pk) for pk in path.split(PATH_SEPARATOR) if pk]
+        return list(self.filter(pk__in=ids).order_by('depth').values('id', 'name'))
+
+    def is_in_subtree(self, category_id: int, path: str) -> bool:
+        """Проверяет, входит ли категория в поддерево с корнем по пути path (включая сам корень)."""
+
+        return bool(path) and self.filter(pk=category_id, **subtree(path)).exists()
+
+    def place(self, category: 'Category') -> None:
+        """Записывает путь и глубину сохранённой категории. Если категория перенесена в другую родительскую,
+        пути её поддерева обновляются одним запросом."""
+
+        rows = {
+            pk: (path, depth) for pk, path, depth in
+            self.filter(pk__in=(category.pk, category.parent_category_id)).values_list('id', 'path', 'depth')
+        }
+        old_path, old_depth = rows[category.pk]
+        parent_path, parent_depth = rows.get(category.parent_category_id, ('', -1))
+        path, depth = f'{parent_path}{category.pk}{PATH_SEPARATOR}', parent_depth + 1
+        if (path, depth) == (old_path, old_depth):
+            return
+        if not old_path:
+            self.filter(pk=category.pk).update(path=path, depth=depth)
+        else:
+            self.filter(**subtree(old_path)).update(
+                path=Concat(models.Value(path), Substr('path', len(old_path) + 1), output_field=models.CharField()),
+                depth=models.F('depth') + (depth - old_depth),
+            )
+        category.path, category.depth = path, depth
+
+    def detach_subtree(self, category: 'Category') -> None:
+        """Делает корневыми подкатегории удалённой категории (parent_category обнуляется on_delete=SET_NULL)
+        и укорачивает пути её поддерева."""
+
+        if category.path:
+            self.filter(**subtree(category.path)).exclude(pk=category.pk).update(
+                path=Substr('path', len(category.path) + 1),
+                depth=models.F('depth') - (category.depth + 1),
+            )
+
+    def rebuild_paths(self) -> int:
+        """Пересчитывает пути и глубины всех категорий по parent_category.
+
+        Нужен для категорий, записанных в обход сигналов (миграция существующей базы).
+        Возвращает количество исправленных категорий."""
+
+        categories = {category.pk: category for category in self.only('id', 'parent_category_id', 'path', 'depth')}
+        paths: Dict[int, str] = {}
+
+        def resolve(pk: int) -> str:
+            chain = []
+            current: Optional[int] = pk
+            while current is not None and current in categories and current not in paths and current not in chain:
+                chain.append(current)
+                current = categories[current].parent_category_id
+            path = paths.get(current, '') if current is not None else ''
+            for node in reversed(chain):
+                path = paths[node] = f'{path}{node}{PATH_SEPARATOR}'
+            return paths[pk]
+
+        changed = []
+        for pk, category in categories.items():
+            path = resolve(pk)
+            depth = path.count(PATH_SEPARATOR) - 1
+            if (category.path, category.depth) != (path, depth):
+                category.path, category.depth = path, depth
+                changed.append(category)
+        self.bulk_update(changed, ('path', 'depth'), batch_size=500)
+        return len(changed)
+
 
 class ProductManager(models.Manager):
     def get_products(self, category_id: Optional[int]) -> List[Dict[str, Any]]:
         """Возвращает список товаров из категории."""
 
-        products = list(self.filter(categories__id=category_id).values('id', 'name', 'categories', 'price',
-                                                                       'image_url', 'description', 'is_active'))
+        products = list(self.filter(categories__id=category_id, is_active=True).values(
+            'id', 'name', 'categories', 'price', 'image_url', 'description', 'is_active'))
         return products
 
-    def get_product_by_id(self, product_id: Optional[int]) -> Dict[str, Any]:
-        product = model_to_dict(self.get(id=product_id), fields=(('id', 'name', 'categories', 'price',
-                                                                  'image_url', 'description', 'is_active')))
-        return product
+    def _subtree(self, category_id: Optional[int]) -> QuerySet:
+        from .models import Category
+
+        path = models.Subquery(Category.objects.filter(pk=category_id).values('path'))
+        links = self.model.categories.through.objects.filter(
+            category_id__in=Category.objects.filter(**subtree(path)).values('id'),
+        )
+        return self.filter(pk__in=links.values('product_id'), is_active=True).order_by('sort_order', 'name', 'id')
 
-    def get_products_by_query(self, query_string: str) -> List[Dict[str, Any]]:
-        """Возвращает список товаров, отфильтрованных поиском по подстроке наименования."""
+    def get_subtree_products(self, category_id: Optional[int]) -> List[Dict[str, Any]]:
+        """Возвращает товары категории и всех её подкатегорий одним запросом, в порядке сортировки."""
 
-        products = list(self.filter(name__icontains=query_string).values('id', 'name', 'price', 'image_url',
-                                                                         'description', 'is_active'))
+        products = list(self._subtree(category_id).values(
+            'id', 'name', 'price', 'image_url', 'description', 'is_active'))
         return products
 
+    def get_subtree_product_page(self, category_id: Optional[int], offset: int = 0,
+                                 limit: int = CATALOG_PAGE_SIZE) -> List[Dict[str, Any]]:
+        """Возвращает страницу товаров поддерева категории для кнопок списка: только id и наименование.
+
+        Смещение и размер страницы передаются в запрос (OFFSET/LIMIT)."""
+
+        return list(self._subtree(category_id).values('id', 'name')[offset:offset + limit])
+
+    def get_product_by_id(self, product_id: Optional[int], fields: Sequence[str] = PRODUCT_FIELDS) -> Any:
+        """Возвращает товар строкой-проекцией (см. row_type) только с полями fields, в их порядке.
+
+        Столбцы выбираются одним запросом; categories (кортеж id категорий по возрастанию) - отдельным запросом,
+        только если это поле запрошено. Если товара нет или он снят с продажи, вызывает Product.DoesNotExist."""
+
+        fields = tuple(fields)
+        columns = tuple(field for field in fields if field != 'categories')
+        rows = project(self.filter(pk=product_id, is_active=True), columns or ('id',))
+        if not rows:
+            raise self.model.DoesNotExist(f'Product #{product_id} does not exist')
+        if columns == fields:
+            return rows[0]
+        values = rows[0]._asdict() if columns else {}
+        values['categories'] = tuple(self.model.categories.through.objects.filter(product_id=product_id)
+                                     .order_by('category_id').values_list('category_id', flat=True))
+        return row_type(f'{self.model.__name__}Row', fields)(*(values[field] for field in fields))
+
+    def get_products_by_query(self, query_string: str, offset: int = 0,
+                              limit: int = CATALOG_PAGE_SIZE) -> List[Dict[str, Any]]:
+        """Возвращает страницу товаров в продаже, найденных полнотекстовым поиском (shop.search),
+        в порядке релевантности."""
+
+        from .search import ProductSearch
+
+        ids = ProductSearch().search(query_string, offset, limit)
+        if not ids:
+            return []
+        products = {product['id']: product for product in self.filter(pk__in=ids).values(
+            'id', 'name', 'price', 'image_url', 'description', 'is_active')}
+        return [products[pk] for pk in ids if pk in products]
+
 
 class OrderManager(models.Manager):
     def get_order(self, order_id: int) -> QuerySet:
@@ -66,17 +240,45 @@ class OrderManager(models.Manager):
                    chat_id_in_messenger: str,
                    bot_id: int,
                    product_id: Optional[int],
-                   description: Optional[str] = '') -> 'Order':
+                   description: Optional[str] = '',
+                   request_key: Optional[str] = None) -> Tuple['Order', bool]:
+
+        """Создаёт заказ и возвращает его с признаком создания.
 
-        """Создаёт и возвращает заказ на основе требуемых параметров."""
+        request_key - id сообщения с нажатой кнопкой в мессенджере. Повторное нажатие или повтор вебхука
+        в течение ORDER_IDEMPOTENCY_WINDOW секунд возвращают неоплаченный заказ того же чата и товара
+        с этим ключом (признак создания False). Одновременные дубликаты отсекает уникальный индекс
+        (chat, product, request_key). У просроченного заказа ключ снимается, и создаётся новый.
+
+        Чтения выполняются до транзакции записи: в SQLite транзакция, начатая чтением, не может дождаться
+        блокировки на запись и сразу завершается ошибкой database is locked."""
 
         from .models import Product
 
-        product = Product.objects.get_product_by_id(product_id)
-        chat = Chat.objects.get(bot_id=bot_id, id_in_messenger=chat_id_in_messenger)
-        order = self.create(chat=chat, product_id=product_id, total=product['price'], description=description)
+        chat_id = Chat.objects.get_chat_id(bot_id, chat_id_in_messenger)
+        request_key = request_key or None
+        expired: Optional[int] = None
+        if request_key is not None:
+            order = self.filter(chat_id=chat_id, product_id=product_id, request_key=request_key).first()
+            if order is not None:
+                if order.status in OPEN_ORDER_STATUSES and \
+                        order.created_at >= timezone.now() - timedelta(seconds=ORDER_IDEMPOTENCY_WINDOW):
+                    return order, False
+                expired = order.pk
+        product = Product.objects.get_product_by_id(product_id, ('price',))
+        try:
+            with transaction.atomic():
+                if expired is not None:
+                    self.filter(pk=expired).update(request_key=None)
+                order = self.create(chat_id=chat_id, product_id=product_id, total=product.price,
+                                    description=description, request_key=request_key)
+        except IntegrityError:
+            if request_key is None:
+                raise
+            # заказ с тем же ключом создан параллельным обработчиком
+            return self.get(chat_id=chat_id, product_id=product_id, request_key=request_key), False
 
-        return order
+        return order, True
 
     def update_order(self, order_id: int, status: int) -> None:
         """Обновляет статус заказа на завершённый или отменённый."""
@@ -0,0 +1,16 @@
+# Generated by Django 3.1.2 on 2026-10-17 03:15
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.DeleteModel(
+            name='Shop',
+        ),
+    ]
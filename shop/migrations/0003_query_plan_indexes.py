@@ -0,0 +1,21 @@
+# Generated by Django 3.1.2 on 2026-10-17 03:15
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0002_sync_models'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='category',
+            index_together={('parent_category', 'sort_order', 'name')},
+        ),
+        migrations.AlterIndexTogether(
+            name='product',
+            index_together={('sort_order', 'name')},
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 3.1.2 on 2026-10-17 03:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0005_sku'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='request_key',
+            field=models.CharField(blank=True, editable=False, max_length=64, null=True, verbose_name='Request key'),
+        ),
+        migrations.AddConstraint(
+            model_name='order',
+            constraint=models.UniqueConstraint(fields=('chat', 'product', 'request_key'), name='shop_order_request_key'),
+        ),
+    ]
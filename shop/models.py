@@ -1,3 +1,4 @@
+from django.core.exceptions import ValidationError
 from django.db import models
 from djmoney.models.fields import MoneyField
 
@@ -6,12 +7,14 @@ from common.constants import OrderStatus
 from .managers import CategoryManager, ProductManager, OrderManager
 
 
-# todo parent-child category interactions unused
 class Category(TrackableUpdateCreateModel):
     """Модель для описания категории товара.
 
     Содержит поля имени, индекса родительской категории,
     а также активности и порядка сортировки.
+    Поле path - материализованный путь от корня дерева категорий: id предков и самой категории через '/',
+    например '5/24/22/'. Путь и глубина поддерживаются обработчиками сигналов (shop.signals).
+    Поле sku - внешний артикул, по которому категория сопоставляется при загрузке каталога (shop.importer).
     """
 
     parent_category = models.ForeignKey(
@@ -27,6 +30,9 @@ class Category(TrackableUpdateCreateModel):
     name = models.CharField('Name', max_length=100)
     is_active = models.BooleanField('Active', default=True)
     sort_order = models.PositiveIntegerField('Sort order', default=1)
+    sku = models.CharField('SKU', max_length=64, unique=True, null=True, blank=True)
+    path = models.CharField('Path', max_length=255, default='', editable=False, db_index=True)
+    depth = models.PositiveSmallIntegerField('Depth', default=0, editable=False)
     objects = CategoryManager()
 
     def __str__(self) -> str:
@@ -36,11 +42,20 @@ class Category(TrackableUpdateCreateModel):
         else:
             return self.name
 
+    def clean(self) -> None:
+        if self.pk is not None and self.parent_category_id is not None and \
+                Category.objects.is_in_subtree(self.parent_category_id, self.path):
+            raise ValidationError({'parent_category': 'Category cannot be moved into its own subtree'})
+
     class Meta:
         verbose_name = 'Category'
         verbose_name_plural = 'Categories'
         app_label = 'shop'
         ordering = ['sort_order', 'name']
+        # подкатегории выбираются в порядке сортировки (CategoryManager.get_categories)
+        index_together = (
+            ('parent_category', 'sort_order', 'name'),
+        )
 
 
 class Product(TrackableUpdateCreateModel):
@@ -48,6 +63,7 @@ class Product(TrackableUpdateCreateModel):
 
     Содержит поля наименования, цены, описания, категории, ссылки на изображение
     а также активности и порядка сортировки.
+    Поле sku - внешний артикул, по которому товар сопоставляется при загрузке каталога (shop.importer).
     """
 
     categories = models.ManyToManyField(
@@ -57,6 +73,7 @@ class Product(TrackableUpdateCreateModel):
         related_name='categories',
     )
     name = models.CharField('Name', max_length=100, db_index=True)
+    sku = models.CharField('SKU', max_length=64, unique=True, null=True, blank=True)
     price = MoneyField('Price', max_digits=10, decimal_places=2, blank=True, default=0.0, default_currency='RUB')
     image_url = models.URLField('Image', max_length=2047, blank=True, null=True)
     description = models.TextField('Description', blank=True, default='')
@@ -75,6 +92,10 @@ class Product(TrackableUpdateCreateModel):
         verbose_name_plural = 'Products'
         app_label = 'shop'
         ordering = ['sort_order', 'name']
+        # снимок каталога читает товары в порядке сортировки (shop.catalog.build_snapshot)
+        index_together = (
+            ('sort_order', 'name'),
+        )
 
 
 class Order(TrackableUpdateCreateModel):
@@ -82,6 +103,8 @@ class Order(TrackableUpdateCreateModel):
 
     Содержит поля соответствующего чата (пользователя), продукта, суммы, статуса и комментариев,
     а также времени оплаты или отмены заказа.
+    Поле request_key - id сообщения мессенджера с нажатой кнопкой оплаты: повторное нажатие возвращает
+    тот же заказ (см. OrderManager.make_order).
     """
 
     chat = models.ForeignKey(
@@ -99,6 +122,7 @@ class Order(TrackableUpdateCreateModel):
     status = models.IntegerField('Status', choices=OrderStatus.choices(), default=OrderStatus.NEW.value)
     paid_date = models.DateTimeField('Paid date', null=True, blank=True)
     cancel_date = models.DateTimeField('Cancel date', null=True, blank=True)
+    request_key = models.CharField('Request key', max_length=64, null=True, blank=True, editable=False)
     objects = OrderManager()
 
     class Meta:
@@ -106,3 +130,7 @@ class Order(TrackableUpdateCreateModel):
         verbose_name_plural = 'Orders'
         app_label = 'shop'
         ordering = ['-created_at']
+        # один заказ на нажатие кнопки: одновременные дубликаты отсекаются на вставке
+        constraints = (
+            models.UniqueConstraint(fields=('chat', 'product', 'request_key'), name='shop_order_request_key'),
+        )
@@ -0,0 +1,171 @@
+"""Модуль полнотекстового поиска товаров.
+
+Наименования и описания товаров индексируются в виртуальной таблице SQLite FTS5 (rowid - id товара).
+Индекс обновляется обработчиками сигналов Product (shop.signals) в той же транзакции, что и сам товар,
+а после миграций создаётся и, если расходится с таблицей товаров, перестраивается.
+
+Каждое слово запроса ищется как префикс слова наименования или описания, все слова должны найтись.
+В индексе есть и товары, снятые с продажи: они отсекаются при поиске по таблице товаров.
+Результаты упорядочены по bm25, совпадение в наименовании весит больше, чем в описании;
+ранжируются не более RANK_CANDIDATES первых совпадений, поэтому время запроса ограничено и для частых слов.
+Если FTS5 недоступен (другая СУБД или сборка SQLite без FTS5), используется поиск подстроки в наименовании."""
+
+import logging
+import re
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from django.db import DatabaseError, connection
+
+from patterns.singleton import Singleton
+from .constants import CATALOG_PAGE_SIZE, SEARCH_MIN_LENGTH
+from .models import Product
+
+
+logger = logging.getLogger('root')
+
+FTS_TABLE = 'shop_product_fts'
+# веса столбцов name и description в bm25
+NAME_WEIGHT = 10.0
+DESCRIPTION_WEIGHT = 1.0
+# слов запроса учитывается не больше MAX_TERMS
+MAX_TERMS = 8
+# по релевантности упорядочиваются первые RANK_CANDIDATES совпадений: ранжирование всех совпадений
+# короткого частого слова (десятки тысяч строк) стоит больше, чем поиск подстроки по всей таблице
+RANK_CANDIDATES = 2000
+_WORD = re.compile(r'\w+')
+
+
+def match_expression(text: str) -> Optional[str]:
+    """Строит выражение FTS5 MATCH: слова запроса в кавычках как префиксы. None, если слов нет."""
+
+    words = _WORD.findall(text.lower())[:MAX_TERMS]
+    return ' '.join(f'"{word}"*' for word in words) or None
+
+
+class ProductSearch(metaclass=Singleton):
+    """Поиск товаров процесса: индекс FTS5 и счётчики запросов."""
+
+    def __init__(self) -> None:
+        # None - доступность FTS5 ещё не проверялась
+        self.available: Optional[bool] = None
+        self._lock = threading.Lock()
+        self.searches = 0
+        self.fallbacks = 0
+        self.search_time = 0.0
+        self.writes = 0
+        self.rebuilds = 0
+
+    def _fts(self) -> bool:
+        return connection.vendor == 'sqlite' and self.available is not False
+
+    def _disable(self, err: DatabaseError) -> None:
+        self.available = False
+        logger.warning(f'Product full-text index unavailable, falling back to substring search: {err.args}')
+
+    def ensure_index(self, rebuild: bool = False) -> bool:
+        """Создаёт индекс, если его нет, и перестраивает, если число записей в нём не совпадает с числом товаров
+        или указан rebuild. Возвращает доступность индекса."""
+
+        if connection.vendor != 'sqlite':
+            self.available = False
+            return False
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f'CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5('
+                    f"name, description, tokenize = 'unicode61 remove_diacritics 2')"
+                )
+                cursor.execute(f'SELECT (SELECT COUNT(*) FROM {FTS_TABLE}), (SELECT COUNT(*) FROM shop_product)')
+                indexed, products = cursor.fetchone()
+        except DatabaseError as err:
+            self._disable(err)
+            return False
+        self.available = True
+        if rebuild or indexed != products:
+            self.rebuild()
+        return True
+
+    def rebuild(self) -> int:
+        """Заполняет индекс заново по таблице товаров. Возвращает количество проиндексированных товаров."""
+
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE}')
+            cursor.execute(f'INSERT INTO {FTS_TABLE} (rowid, name, description) '
+                           f'SELECT id, name, description FROM shop_product')
+            cursor.execute(f'SELECT COUNT(*) FROM {FTS_TABLE}')
+            count: int = cursor.fetchone()[0]
+        with self._lock:
+            self.rebuilds += 1
+        logger.info(f'Product full-text index rebuilt: {count} products')
+        return count
+
+    def index(self, product: Product) -> None:
+        """Записывает в индекс наименование и описание товара."""
+
+        self._write(product.pk, (product.name, product.description))
+
+    def remove(self, product_id: int) -> None:
+        self._write(product_id, None)
+
+    def _write(self, product_id: int, fields: Optional[Tuple[str, str]]) -> None:
+        if not self._fts():
+            return
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [product_id])
+                if fields is not None:
+                    cursor.execute(f'INSERT INTO {FTS_TABLE} (rowid, name, description) VALUES (%s, %s, %s)',
+                                   [product_id, *fields])
+        except DatabaseError as err:
+            self._disable(err)
+            return
+        with self._lock:
+            self.writes += 1
+
+    def search(self, text: str, offset: int = 0, limit: int = CATALOG_PAGE_SIZE) -> List[int]:
+        """Возвращает id товаров в продаже, найденных по тексту, в порядке релевантности: limit штук, начиная с offset.
+
+        Запросы короче SEARCH_MIN_LENGTH символов не выполняются."""
+
+        expression = match_expression(text)
+        if expression is None or len(text.strip()) < SEARCH_MIN_LENGTH:
+            return []
+        started = time.perf_counter()
+        ids: Optional[List[int]] = None
+        if self._fts():
+            try:
+                with connection.cursor() as cursor:
+                    cursor.execute(
+                        f'SELECT rowid FROM (SELECT {FTS_TABLE}.rowid AS rowid, '
+                        f'bm25({FTS_TABLE}, {NAME_WEIGHT}, {DESCRIPTION_WEIGHT}) AS score '
+                        f'FROM {FTS_TABLE} JOIN shop_product ON shop_product.id = {FTS_TABLE}.rowid '
+                        f'WHERE {FTS_TABLE} MATCH %s AND shop_product.is_active LIMIT %s) '
+                        f'ORDER BY score, rowid LIMIT %s OFFSET %s',
+                        [expression, max(RANK_CANDIDATES, offset + limit), limit, offset],
+                    )
+                    ids = [row[0] for row in cursor.fetchall()]
+                self.available = True
+            except DatabaseError as err:
+                self._disable(err)
+        fallback = ids is None
+        if ids is None:
+            ids = list(Product.objects.filter(name__icontains=text.strip(), is_active=True)
+                       .order_by('sort_order', 'name', 'id').values_list('id', flat=True)[offset:offset + limit])
+        with self._lock:
+            self.searches += 1
+            self.fallbacks += fallback
+            self.search_time += time.perf_counter() - started
+        return ids
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'available': self.available,
+                'searches': self.searches,
+                'fallbacks': self.fallbacks,
+                'avg_ms': round(self.search_time * 1000 / self.searches, 3) if self.searches else 0.0,
+                'writes': self.writes,
+                'rebuilds': self.rebuilds,
+            }
@@ -0,0 +1,61 @@
+"""Модуль обработчиков сигналов моделей магазина."""
+
+from typing import Any
+
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .catalog import CatalogStore
+from .models import Category, Product
+from .search import ProductSearch
+
+
+@receiver(pre_save, sender=Category)  # type: ignore
+def check_category_parent(sender: Any, instance: Category, raw: bool = False, **kwargs: Any) -> None:
+    if not raw and instance.pk is not None and instance.parent_category_id is not None and \
+            Category.objects.is_in_subtree(instance.parent_category_id, instance.path):
+        raise ValueError(f'Category #{instance.pk} cannot be moved into its own subtree')
+
+
+@receiver(post_save, sender=Category)  # type: ignore
+def place_category(sender: Any, instance: Category, raw: bool = False, **kwargs: Any) -> None:
+    # при загрузке фикстур пути берутся из данных
+    if not raw:
+        Category.objects.place(instance)
+
+
+@receiver(post_delete, sender=Category)  # type: ignore
+def detach_category_subtree(sender: Any, instance: Category, **kwargs: Any) -> None:
+    Category.objects.detach_subtree(instance)
+
+
+def rebuild_category_paths(sender: Any, **kwargs: Any) -> None:
+    """Заполняет пути категорий после миграций (например, после добавления поля path в существующую базу)."""
+
+    Category.objects.rebuild_paths()
+
+
+@receiver(post_save, sender=Product)  # type: ignore
+def index_product(sender: Any, instance: Product, **kwargs: Any) -> None:
+    # товары из фикстур тоже индексируются: запись индекса не зависит от других строк
+    ProductSearch().index(instance)
+
+
+@receiver(post_delete, sender=Product)  # type: ignore
+def unindex_product(sender: Any, instance: Product, **kwargs: Any) -> None:
+    ProductSearch().remove(instance.pk)
+
+
+def ensure_search_index(sender: Any, **kwargs: Any) -> None:
+    """Создаёт индекс поиска товаров после миграций и перестраивает его, если он отстал от таблицы товаров."""
+
+    ProductSearch().ensure_index()
+
+
+@receiver(post_save, sender=Category)  # type: ignore
+@receiver(post_delete, sender=Category)  # type: ignore
+@receiver(post_save, sender=Product)  # type: ignore
+@receiver(post_delete, sender=Product)  # type: ignore
+@receiver(m2m_changed, sender=Product.categories.through)  # type: ignore
+def invalidate_catalog(sender: Any, **kwargs: Any) -> None:
+    CatalogStore().invalidate()
@@ -0,0 +1,45 @@
+from contextlib import contextmanager
+from typing import Callable, ContextManager, Iterator
+
+import pytest
+
+from django.core.management import call_command
+
+from bot.identity import IdentityCache
+from bot.querylog import QueryLog, QueryProfile, profile
+from bot.registry import BotRegistry
+from bot.screens import ScreenCache
+from shop.catalog import CatalogStore
+
+
+@pytest.fixture(scope='session')
+def django_db_setup(django_db_setup, django_db_blocker) -> None:  # type: ignore
+    with django_db_blocker.unblock():
+        call_command('loaddata', 'tests/test_data.json')
+
+
+@pytest.fixture(autouse=True)
+def clear_process_caches() -> None:
+    # кэши живут дольше транзакции теста, а данные теста откатываются
+    IdentityCache().clear()
+    BotRegistry().invalidate()
+    CatalogStore().invalidate()
+    ScreenCache().clear()
+    QueryLog().clear()
+
+
+@pytest.fixture
+def query_budget() -> Callable[..., ContextManager[QueryProfile]]:
+    """Проверка бюджета запросов к базе: with query_budget(10, dialog=3): ...
+
+    Блок падает, если запросов больше total или больше указанного для этапа (см. bot.querylog)."""
+
+    @contextmanager
+    def budget(total: int, **stages: int) -> Iterator[QueryProfile]:
+        with profile('test', record=False) as current:
+            yield current
+        assert current.queries <= total, f'Query budget {total} exceeded: {current}'
+        for name, limit in stages.items():
+            assert current.stage_queries(name) <= limit, f'Stage {name} budget {limit} exceeded: {current}'
+
+    return budget
@@ -0,0 +1,77 @@
+from datetime import timedelta
+from pathlib import Path
+
+import pytest
+from django.test import Client
+from django.utils import timezone
+
+from bot.archive import FIELDS, MessageArchive
+from bot.models import Message, OutboxMessage
+from bot.pagination import encode_cursor
+from common.constants import MessageDirection, OutboxStatus
+
+
+@pytest.fixture
+def archive(db: None, tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> MessageArchive:
+    monkeypatch.setattr(MessageArchive.__init__, '__defaults__', (str(tmp_path),))
+    # сообщения фикстуры старые: в тестах в архив попадают только явно состаренные
+    Message.objects.update(created_at=timezone.now())
+    return MessageArchive()
+
+
+@pytest.mark.django_db
+def test_old_messages_move_to_archive_and_read_through(archive: MessageArchive) -> None:
+    history = [message.pk for message in Message.objects.filter(chat_id=1).order_by('id')]
+    old = history[:4]
+    Message.objects.filter(pk__in=old[:2]).update(created_at=timezone.now() - timedelta(days=400))
+    Message.objects.filter(pk__in=old[2:]).update(created_at=timezone.now() - timedelta(days=370))
+    pending = Message.objects.get(pk=old[3])
+    OutboxMessage.objects.create(message=pending, bot_id=1, payload='{}', status=OutboxStatus.PENDING.value)
+
+    assert archive.archive(timezone.now() - timedelta(days=365), chunk=2) == 3
+    assert not Message.objects.filter(pk__in=old[:3]).exists()
+    assert Message.objects.filter(pk=old[3]).exists()
+    assert archive.stats()['messages'] == 3
+    assert archive.stats()['months'] == 2
+
+    # порядок и содержимое истории не изменились
+    assert [message.pk for message in Message.objects.get_chat_messages(1)] == history
+    before = Message.objects.get(pk=history[4])
+    assert [message.pk for message in Message.objects.get_chat_messages(
+        1, before=(before.created_at, before.pk), limit=3)] == history[1:4]
+    restored = archive.read_chat(1, limit=1)[0]
+    assert (restored.pk, restored.created_at.tzinfo is not None) == (old[2], True)
+
+
+@pytest.mark.django_db
+def test_interrupted_archivation_is_not_duplicated(archive: MessageArchive) -> None:
+    first = Message.objects.filter(chat_id=2).order_by('id').first()
+    Message.objects.filter(pk=first.pk).update(created_at=timezone.now() - timedelta(days=400))
+    # фрагмент записан, но сообщение не удалено из базы
+    archive._write(archive._connect(), list(Message.objects.filter(pk=first.pk).values(*FIELDS)))
+    assert archive.archive(timezone.now() - timedelta(days=365)) == 1
+    assert [message.pk for message in archive.read_chat(2)] == [first.pk]
+
+
+@pytest.mark.django_db
+def test_chat_view_pages_back_into_archive(archive: MessageArchive) -> None:
+    history = [message.pk for message in Message.objects.filter(chat_id=1).order_by('id')]
+    Message.objects.filter(pk=history[0]).update(created_at=timezone.now() - timedelta(days=400))
+    archive.archive(timezone.now() - timedelta(days=365))
+    before = Message.objects.get(pk=history[1])
+    response = Client().get('/chats/1/', {'before': encode_cursor(before.created_at, before.pk)})
+    assert [message['number'] for message in response.context['message_list']] == history[:1]
+
+
+@pytest.mark.django_db
+def test_history_is_ordered_by_creation_time() -> None:
+    # сообщение, записанное в базу позже ответа (write-behind), получает больший id, но остаётся перед ответом
+    question = Message(bot_id=1, chat_id=1, text='Вопрос', direction=MessageDirection.RECEIVED.value)
+    answer = Message(bot_id=1, chat_id=1, text='Ответ', direction=MessageDirection.SENT.value)
+    answer.save()
+    question.save()
+    assert question.pk > answer.pk
+    history = Message.objects.get_chat_messages(1, limit=2)
+    assert [message.text for message in history] == ['Вопрос', 'Ответ']
+    earlier = Message.objects.get_chat_messages(1, before=(answer.created_at, answer.pk), limit=1)
+    assert [message.text for message in earlier] == ['Вопрос']
@@ -0,0 +1,26 @@
+import pytest
+
+from common import callbacks
+from common.constants import CallbackType
+from common.entities import Callback
+
+
+def test_compact_round_trip() -> None:
+    assert callbacks.make(CallbackType.CATEGORY, 12) == '1cc'
+    assert callbacks.make(CallbackType.PRODUCT, 123456, cursor=71) == '1p2n9c.1z'
+    for callback in (Callback(callback_type, 10 ** 9, None) for callback_type in CallbackType):
+        assert callbacks.decode(callbacks.encode(callback)) == callback
+    assert callbacks.decode('1p2n9c.1z') == Callback(CallbackType.PRODUCT, 123456, 71)
+
+
+def test_legacy_json_payloads_are_decoded() -> None:
+    assert callbacks.decode('{"type": "category", "id": 12}') == Callback(CallbackType.CATEGORY, 12)
+    assert callbacks.decode('{"id": 0, "type": "greeting"}') == Callback(CallbackType.GREETING, 0)
+
+
+@pytest.mark.parametrize('payload', (
+    '', '2cc', '1xc', '1c', '1c-5', '1c 5', '1c5.', '{"type": "unknown", "id": 1}', '{',
+))
+def test_malformed_payloads_raise_value_error(payload: str) -> None:
+    with pytest.raises(ValueError):
+        callbacks.decode(payload)
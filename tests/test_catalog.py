@@ -0,0 +1,181 @@
+import json
+from typing import Any, List, Optional, Tuple
+
+import pytest
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from bot.dialog import Dialog
+from common import callbacks
+from common.constants import CallbackType
+from common.entities import EventCommandReceived
+from shop.catalog import CatalogStore, ManagerCatalog
+from shop.constants import CATALOG_PAGE_SIZE
+from shop.models import Category, Product
+
+
+with open('tests/dialog_content.json', 'r') as f:
+    lines = json.loads(f.readline())
+
+
+@pytest.mark.django_db
+def test_snapshot_matches_managers() -> None:
+    snapshot = CatalogStore().snapshot()
+    assert snapshot is not None
+    managers = ManagerCatalog()
+    assert snapshot.get_categories() == managers.get_categories()
+    for category_id in Category.objects.values_list('id', flat=True):
+        assert snapshot.get_categories(category_id) == managers.get_categories(category_id)
+        assert snapshot.get_category_by_id(category_id) == managers.get_category_by_id(category_id)
+        assert snapshot.get_products(category_id) == managers.get_products(category_id)
+        assert snapshot.get_subtree_products(category_id) == managers.get_subtree_products(category_id)
+        assert snapshot.get_breadcrumb(category_id) == managers.get_breadcrumb(category_id)
+    for product_id in Product.objects.values_list('id', flat=True):
+        assert snapshot.get_product_by_id(product_id) == managers.get_product_by_id(product_id)
+        assert snapshot.get_product_by_id(product_id, ('price', 'name')) == \
+            managers.get_product_by_id(product_id, ('price', 'name'))
+
+
+@pytest.mark.django_db
+def test_product_projection() -> None:
+    product = Product.objects.get(pk=19)
+    with CaptureQueriesContext(connection) as queries:
+        row = Product.objects.get_product_by_id(19, ('name', 'price'))
+    assert len(queries) == 1
+    assert 'description' not in queries[0]['sql'] and 'shop_product_categories' not in queries[0]['sql']
+    assert row == (product.name, product.price) and row.price == product.price
+    assert not hasattr(row, '__dict__') and type(row) is type(Product.objects.get_product_by_id(21, ('name', 'price')))
+    with pytest.raises(AttributeError):
+        row.name = 'changed'
+
+    with CaptureQueriesContext(connection) as queries:
+        row = Product.objects.get_product_by_id(19, ('categories', 'id'))
+    assert len(queries) == 2
+    assert row == (tuple(sorted(c.pk for c in product.categories.all())), 19)
+    with pytest.raises(Product.DoesNotExist):
+        Product.objects.get_product_by_id(0, ('price',))
+
+
+@pytest.mark.django_db
+def test_browsing_without_queries_and_invalidation() -> None:
+    event = EventCommandReceived.Schema().loads(lines['product_input'])
+    dialog = Dialog()
+    dialog.callback = callbacks.decode(event.payload.command)
+    dialog.form_product_list(event)
+    with CaptureQueriesContext(connection) as ctx:
+        result = dialog.form_product_list(event)
+    assert not ctx.captured_queries
+
+    version = CatalogStore().snapshot().version
+    product = Product.objects.get(name=next(
+        button.text for button in result.inline_buttons
+        if callbacks.decode(button.action.payload).type == CallbackType.PRODUCT
+    ))
+    product.name = 'Renamed product'
+    product.save()
+    assert CatalogStore().snapshot().version == version + 1
+    assert product.name in [button.text for button in dialog.form_product_list(event).inline_buttons]
+
+
+@pytest.mark.django_db
+def test_paths_follow_moves_and_deletes() -> None:
+    middle = Category.objects.create(name='Middle', parent_category_id=5)
+    leaf = Category.objects.create(name='Leaf', parent_category=middle)
+    assert (leaf.path, leaf.depth) == (f'5/{middle.pk}/{leaf.pk}/', 2)
+
+    middle.parent_category_id = 6
+    middle.save()
+    leaf.refresh_from_db()
+    assert (leaf.path, leaf.depth) == (f'6/{middle.pk}/{leaf.pk}/', 2)
+    root = Category.objects.get(pk=6)
+    root.parent_category = leaf
+    with pytest.raises(ValueError):
+        root.save()
+
+    middle.delete()
+    leaf.refresh_from_db()
+    assert (leaf.parent_category_id, leaf.path, leaf.depth) == (None, f'{leaf.pk}/', 0)
+    assert Category.objects.rebuild_paths() == 0
+
+    Category.objects.filter(pk=leaf.pk).update(path='', depth=0)
+    assert Category.objects.rebuild_paths() == 1
+    assert Category.objects.get(pk=leaf.pk).path == f'{leaf.pk}/'
+
+
+@pytest.mark.django_db
+def test_tree_queries_are_single_at_any_depth() -> None:
+    category = Category.objects.get_category_by_id(22)
+    with CaptureQueriesContext(connection) as ctx:
+        Category.objects.get_category_by_id(22)
+        Category.objects.get_categories(24)
+        breadcrumb = Category.objects.get_breadcrumb(category['path'])
+        products = Product.objects.get_subtree_products(5)
+    assert len(ctx.captured_queries) == 4
+    assert [item['id'] for item in breadcrumb] == [5, 24, 22]
+    assert set(Product.objects.filter(categories__in=(5, 24, 25, 22, 23, 26, 27, 19, 20, 21)).values_list(
+        'id', flat=True)) == {product['id'] for product in products}
+
+
+@pytest.mark.django_db
+def test_nested_category_screen() -> None:
+    event = EventCommandReceived.Schema().loads(lines['product_input'])
+    dialog = Dialog()
+    dialog.callback = callbacks.decode(event.payload.command)
+    dialog.callback.id = 24
+    result = dialog.form_product_list(event)
+    assert result.payload.text.endswith('"Видеокарты -> AMD"')
+    assert [callbacks.decode(button.action.payload).id for button in result.inline_buttons[:4]] == [22, 26, 27, 23]
+
+
+def walk_pages(category_id: int, queries: int) -> Tuple[List[Tuple[CallbackType, int]], List[Optional[int]]]:
+    """Листает список категории кнопками "Далее", возвращает кнопки всех страниц и курсоры страниц."""
+
+    event = EventCommandReceived.Schema().loads(lines['product_input'])
+    seen: List[Tuple[CallbackType, int]] = []
+    pages = []
+    command: Optional[str] = callbacks.make(CallbackType.CATEGORY, category_id)
+    while command is not None:
+        dialog = Dialog()
+        dialog.callback = callbacks.decode(command)
+        with CaptureQueriesContext(connection) as ctx:
+            result = dialog.form_product_list(event)
+        assert len(ctx.captured_queries) == queries
+        buttons = [callbacks.decode(button.action.payload) for button in result.inline_buttons]
+        items = [(button.type, button.id) for button in buttons if button.id != category_id]
+        offset = dialog.callback.cursor or 0
+        previous = [button.cursor for button in buttons if button.id == category_id and (button.cursor or 0) < offset]
+        following = [button for button in buttons if button.id == category_id and (button.cursor or 0) > offset]
+        assert 0 < len(items) <= CATALOG_PAGE_SIZE
+        assert previous == ([(offset - CATALOG_PAGE_SIZE) or None] if offset else [])
+        seen.extend(items)
+        pages.append(dialog.callback.cursor)
+        command = callbacks.encode(following[0]) if following else None
+    return seen, pages
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('fallback', [False, True])
+def test_product_list_pages(fallback: bool, monkeypatch: Any) -> None:
+    if fallback:
+        monkeypatch.setattr(CatalogStore, 'snapshot', lambda self: None)
+    CatalogStore().current()
+    # запасной каталог: категория и путь, подкатегории, страница товаров
+    seen, pages = walk_pages(5, 4 if fallback else 0)
+
+    expected = [(CallbackType.CATEGORY, pk) for pk in (24, 25)] + [
+        (CallbackType.PRODUCT, product['id']) for product in Product.objects.get_subtree_products(5)]
+    assert seen == expected
+    assert pages == [None] + list(range(CATALOG_PAGE_SIZE, len(expected), CATALOG_PAGE_SIZE))
+
+
+@pytest.mark.django_db
+def test_subcategories_alone_fill_several_pages() -> None:
+    root = Category.objects.create(name='Архив')
+    for i in range(2 * CATALOG_PAGE_SIZE + 4):
+        Category.objects.create(name=f'Раздел {i:02}', parent_category=root)
+    CatalogStore().current()
+    seen, pages = walk_pages(root.pk, 0)
+
+    assert seen == [(CallbackType.CATEGORY, category['id']) for category in Category.objects.get_categories(root.pk)]
+    assert len(seen) == 2 * CATALOG_PAGE_SIZE + 4 and pages == [None, CATALOG_PAGE_SIZE, 2 * CATALOG_PAGE_SIZE]
@@ -0,0 +1,72 @@
+from datetime import timedelta
+from typing import Any, List
+
+import pytest
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from bot.models import Bot, BotUser, Chat
+from bot.pagination import decode_cursor, encode_cursor
+
+
+@pytest.fixture
+def chats() -> List[Chat]:
+    bot = Bot.objects.get(pk=1)
+    now = timezone.now()
+    created = []
+    for i in range(7):
+        user = BotUser.objects.create(bot=bot, messenger_user_id=f'user:page{i}', name=f'Page {i}')
+        created.append(Chat.objects.create(
+            bot=bot, type=1, bot_user=user, id_in_messenger=f'chat:page{i}',
+            # у двух чатов одинаковое время, у последнего сообщений нет
+            last_message_time=now - timedelta(minutes=min(i, 3)) if i < 6 else None,
+        ))
+    return created
+
+
+def walk(client: Client, size: int) -> List[Any]:
+    seen, after = [], ''
+    while True:
+        data = client.get('/chats/', {'format': 'json', 'size': size, 'after': after}).json()
+        seen.extend(chat['number'] for chat in data['chats'])
+        if data['next'] is None:
+            return seen
+        after = data['next']
+
+
+@pytest.mark.django_db
+def test_pages_cover_all_chats_in_order(chats: List[Chat]) -> None:
+    all_chats = list(Chat.objects.all())
+    timed = sorted((c for c in all_chats if c.last_message_time), key=lambda c: (c.last_message_time, c.pk))
+    untimed = sorted(c.pk for c in all_chats if c.last_message_time is None)
+    expected = [c.pk for c in reversed(timed)] + untimed[::-1]
+    for size in (1, 2, 3, len(expected)):
+        assert walk(Client(), size) == expected
+
+
+@pytest.mark.django_db
+def test_pages_are_index_scans_with_joined_users(chats: List[Chat]) -> None:
+    with CaptureQueriesContext(connection) as queries:
+        page = Chat.objects.page(decode_cursor(encode_cursor(chats[2].last_message_time, chats[2].pk)), 3)
+        names = [chat.bot_user.name for chat in page]
+    assert len(queries) == 1
+    # после чата 2 идут чаты 5, 4, 3 с одинаковым временем сообщения - по убыванию id
+    assert names == ['Page 5', 'Page 4', 'Page 3']
+
+    with CaptureQueriesContext(connection) as queries:
+        assert [chat.pk for chat in Chat.objects.page((chats[3].last_message_time, chats[3].pk), 50)][-1] == chats[6].pk
+    assert len(queries) == 2
+    for query in queries.captured_queries:
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {query["sql"]}')
+            plan = ' '.join(row[-1] for row in cursor.fetchall())
+        assert 'TEMP B-TREE' not in plan
+
+
+@pytest.mark.django_db
+def test_bad_cursor_is_rejected() -> None:
+    assert Client().get('/chats/', {'after': '!!!'}).status_code == 400
+    assert Client().get('/chats/', {'size': 'many'}).status_code == 400
+    assert Client().get('/chats/', {'size': 2}).status_code == 200
@@ -0,0 +1,43 @@
+import json
+
+import pytest
+from marshmallow import ValidationError
+
+from clients.jivosite.jivo_entities import JivoEvent
+from clients.jivosite.jivosite import JivositeClient
+from common import codecs
+from common.builders import MessageDirector
+from common.entities import EventCommandToSend
+from common.schemas import get_schema, schema_of
+
+
+with open('tests/dialog_content.json', 'r') as f:
+    lines = json.loads(f.readline())
+
+answers = [get_schema(EventCommandToSend).loads(value) for key, value in lines.items() if key.endswith('_answer')]
+
+
+@pytest.mark.parametrize('ects', answers)
+def test_codecs_match_schemas(ects: EventCommandToSend) -> None:
+    ects.message_id = 42
+    ok_message = MessageDirector().create_ok_message(ects)
+    jivo_event = JivositeClient()._form_message(ects)
+
+    for obj in (ects, ok_message, jivo_event):
+        assert codecs.encode(obj) == schema_of(obj).dump(obj)
+        assert codecs.dumps(obj, strict=True) == schema_of(obj).dumps(obj)
+
+    # прежний путь Jivo: словарь -> load -> dumps
+    legacy = get_schema(JivoEvent).load(get_schema(JivoEvent).dump(jivo_event))
+    assert legacy == jivo_event
+    assert get_schema(JivoEvent).dumps(legacy) == codecs.dumps(jivo_event)
+
+
+def test_strict_mode_validates() -> None:
+    ects = MessageDirector().create_ects(1, 'chat:C000000000001', 'text')
+    ects.message_id = 1
+    event = JivositeClient()._form_message(ects)
+    event.message.text = None  # type: ignore
+    codecs.dumps(event)
+    with pytest.raises(ValidationError):
+        codecs.dumps(event, strict=True)
@@ -0,0 +1,61 @@
+import time
+from pathlib import Path
+
+import pytest
+
+from clients.commands import SOURCE_KEY, CommandStore, LocalCommandStore, SQLiteCommandStore
+
+
+COMMANDS = {'Видеокарты': '{"type": "category", "id": 5}', 'Процессоры': '{"type": "category", "id": 4}'}
+
+
+def stores(tmp_path: Path) -> tuple:
+    return LocalCommandStore(maxsize=2, ttl=60), SQLiteCommandStore(str(tmp_path / 'commands.sqlite3'), ttl=60)
+
+
+@pytest.mark.parametrize('index', (0, 1))
+def test_resolve_and_evict_on_chat_close(tmp_path: Path, index: int) -> None:
+    store: CommandStore = stores(tmp_path)[index]
+    store.save('chat:1', COMMANDS)
+    assert store.resolve('chat:1', 'Видеокарты') == COMMANDS['Видеокарты']
+    assert store.resolve('chat:1', 'Корпуса') is None
+    assert store.resolve('chat:2', 'Видеокарты') is None
+
+    store.evict('chat:1')
+    assert store.resolve('chat:1', 'Видеокарты') is None
+    stats = store.stats()
+    assert (stats['hits'], stats['misses'], stats['chats']) == (1, 3, 0)
+
+
+@pytest.mark.parametrize('index', (0, 1))
+def test_lookup_returns_source_message(tmp_path: Path, index: int) -> None:
+    store: CommandStore = stores(tmp_path)[index]
+    store.save('chat:1', dict(COMMANDS, **{SOURCE_KEY: '77'}))
+    store.save('chat:2', COMMANDS)
+    assert store.lookup('chat:1', 'Видеокарты') == (COMMANDS['Видеокарты'], '77')
+    assert store.lookup('chat:1', SOURCE_KEY) == (None, None) and store.lookup('chat:1', 'Корпуса') == (None, None)
+    assert store.lookup('chat:2', 'Видеокарты') == (COMMANDS['Видеокарты'], None)
+
+
+def test_local_store_is_bounded_and_expires() -> None:
+    store = LocalCommandStore(maxsize=2, ttl=0.05)
+    for chat in ('chat:1', 'chat:2', 'chat:3'):
+        store.save(chat, COMMANDS)
+    assert store.resolve('chat:1', 'Процессоры') is None
+    assert store.stats()['evictions'] == 1
+    assert store.stats()['memory_bytes'] > 0
+    time.sleep(0.06)
+    assert store.resolve('chat:3', 'Процессоры') is None
+
+
+def test_sqlite_store_is_shared_between_instances(tmp_path: Path) -> None:
+    path = str(tmp_path / 'commands.sqlite3')
+    # разные инстансы - как разные процессы приложения с общим файлом
+    SQLiteCommandStore(path).save('chat:1', COMMANDS)
+    other = SQLiteCommandStore(path)
+    assert other.resolve('chat:1', 'Процессоры') == COMMANDS['Процессоры']
+
+    expired = SQLiteCommandStore(path, ttl=-1)
+    expired.save('chat:2', COMMANDS)
+    assert other.resolve('chat:2', 'Процессоры') is None
+    assert other.stats()['file_bytes'] > 0
@@ -0,0 +1,79 @@
+import threading
+from typing import Any, List, Optional
+
+import requests
+
+from clients.delivery import Delivery, DeliveryEngine
+from clients.ratelimit import LocalRateLimiter
+
+
+class FakeResponse:
+    def __init__(self, status_code: int, headers: Optional[dict] = None) -> None:
+        self.status_code = status_code
+        self.text = ''
+        self.headers: dict = headers or {}
+
+
+class FakeSession:
+    """Отвечает по очереди заданными исходами: исключением или кодом ответа."""
+
+    def __init__(self, outcomes: List[Any]) -> None:
+        self.outcomes = outcomes
+        self.calls: List[Any] = []
+
+    def post(self, url: str, data: str, headers: dict, timeout: Any) -> FakeResponse:
+        self.calls.append(timeout)
+        outcome = self.outcomes.pop(0) if self.outcomes else 200
+        if isinstance(outcome, Exception):
+            raise outcome
+        if isinstance(outcome, FakeResponse):
+            return outcome
+        return FakeResponse(outcome)
+
+
+def test_delivery_retries_with_backoff_until_delivered() -> None:
+    session = FakeSession([requests.ConnectionError('refused'), 503, 200])
+    engine = DeliveryEngine(workers=2, connect_timeout=1, read_timeout=2, backoff_base=0.01, backoff_cap=0.02,
+                            session_factory=lambda pool_size: session)
+    delivered = threading.Event()
+    engine.start()
+    try:
+        assert engine.submit(Delivery('ok', 'https://example.com', '{}', {}, check=lambda r: None,
+                                      on_delivered=delivered.set))
+        assert delivered.wait(5)
+    finally:
+        engine.stop(1)
+    stats = engine.stats()
+    assert (stats['delivered'], stats['retried'], stats['in_flight']) == (1, 2, 0)
+    assert session.calls == [(1, 2)] * 3
+
+
+def test_delivery_window_and_rejected_messages() -> None:
+    def reject(response: Any) -> None:
+        raise ValueError('rejected by platform')
+
+    engine = DeliveryEngine(workers=1, max_in_flight=1, session_factory=lambda pool_size: FakeSession([]))
+    assert engine.submit(Delivery('jivo', 'https://example.com', '{}', {}, check=reject))
+    assert not engine.submit(Delivery('jivo', 'https://example.com', '{}', {}, check=reject))
+    engine.start()
+    engine.stop(1)
+    stats = engine.stats()
+    assert (stats['failed'], stats['rejected'], stats['in_flight']) == (1, 1, 0)
+
+
+def test_delivery_honours_rate_limit_and_platform_back_off() -> None:
+    session = FakeSession([FakeResponse(429, {'Retry-After': '0.2'})])
+    limiter = LocalRateLimiter(rate=50, burst=1)
+    engine = DeliveryEngine(workers=1, backoff_base=0.01, session_factory=lambda pool_size: session, limiter=limiter)
+    engine.start()
+    try:
+        for _ in range(2):
+            assert engine.submit(Delivery('ok', 'https://example.com', '{}', {}, check=lambda r: None, bot_id=1))
+        assert engine.wait_idle(5)
+    finally:
+        engine.stop(1)
+    stats = engine.stats()
+    assert (stats['delivered'], stats['retried']) == (2, 1)
+    assert stats['throttled'] >= 2
+    assert stats['rate_limit']['backoffs'] == 1
+    assert list(stats['rate_limit']['buckets']) == ['ok:1']
@@ -2,8 +2,7 @@ import pytest
 
 import json
 
-from django.core.management import call_command
-
+from common import callbacks
 from common.entities import EventCommandReceived, EventCommandToSend, Callback
 from bot.dialog import Dialog
 
@@ -13,57 +12,60 @@ with open('tests/dialog_content.json', 'r') as f:
     lines = json.loads(string)
 
 
+def answer(name: str) -> EventCommandToSend:
+    """Ожидаемый ответ: кнопки записанных ответов содержат команды в прежнем JSON, бот отправляет компактные."""
+
+    expected = EventCommandToSend.Schema().loads(lines[name])
+    for button in expected.inline_buttons or []:
+        button.action.payload = callbacks.encode(callbacks.decode(button.action.payload))
+    return expected
+
+
 greet_cases = (
     (
         EventCommandReceived.Schema().loads(lines['greet_input']),
-        EventCommandToSend.Schema().loads(lines['greet_answer']),
+        answer('greet_answer'),
     ),
 )
 
 category_cases = (
     (
         EventCommandReceived.Schema().loads(lines['category_input']),
-        EventCommandToSend.Schema().loads(lines['category_answer']),
+        answer('category_answer'),
     ),
 )
 
 product_cases = (
     (
         EventCommandReceived.Schema().loads(lines['product_input']),
-        EventCommandToSend.Schema().loads(lines['product_answer']),
+        answer('product_answer'),
     ),
 )
 
 desc_cases = (
     (
         EventCommandReceived.Schema().loads(lines['desc_input']),
-        EventCommandToSend.Schema().loads(lines['desc_answer']),
+        answer('desc_answer'),
     ),
 )
 
 confirm_cases = (
     (
         EventCommandReceived.Schema().loads(lines['confirm_input']),
-        EventCommandToSend.Schema().loads(lines['confirm_answer']),
+        answer('confirm_answer'),
     ),
 )
 
 order_cases = (
     (
         EventCommandReceived.Schema().loads(lines['order_input']),
-        EventCommandToSend.Schema().loads(lines['order_answer']),
+        answer('order_answer'),
     ),
 )
 
 
-@pytest.fixture(scope='session')
-def django_db_setup(django_db_setup, django_db_blocker) -> None:  # type: ignore
-    with django_db_blocker.unblock():
-        call_command('loaddata', 'tests/test_data.json')
-
-
 def load(data: str) -> Callback:
-    return Callback.Schema().loads(data)
+    return callbacks.decode(data)
 
 
 @pytest.mark.parametrize(['input_', 'expected'], greet_cases)
@@ -92,7 +94,7 @@ def test_form_category_list(input_: EventCommandReceived, expected: EventCommand
 def test_form_product_list(input_: EventCommandReceived, expected: EventCommandToSend) -> None:
 
     dialog = Dialog()
-    dialog.callback = Callback.Schema().loads(input_.payload.command)
+    dialog.callback = callbacks.decode(input_.payload.command)
     result = dialog.form_product_list(input_)
     assert result == expected
     assert len(result.inline_buttons) == len(expected.inline_buttons)
@@ -105,7 +107,7 @@ def test_form_product_list(input_: EventCommandReceived, expected: EventCommandT
 def test_form_product_desc(input_: EventCommandReceived, expected: EventCommandToSend) -> None:
 
     dialog = Dialog()
-    dialog.callback = Callback.Schema().loads(input_.payload.command)
+    dialog.callback = callbacks.decode(input_.payload.command)
     result = dialog.form_product_desc(input_)
     assert result == expected
     assert len(result.inline_buttons) == len(expected.inline_buttons)
@@ -118,7 +120,7 @@ def test_form_product_desc(input_: EventCommandReceived, expected: EventCommandT
 def test_form_order_confirmation(input_: EventCommandReceived, expected: EventCommandToSend) -> None:
 
     dialog = Dialog()
-    dialog.callback = Callback.Schema().loads(input_.payload.command)
+    dialog.callback = callbacks.decode(input_.payload.command)
     result = dialog.form_order_confirmation(input_)
     assert result == expected
     assert len(result.inline_buttons) == len(expected.inline_buttons)
@@ -131,7 +133,7 @@ def test_form_order_confirmation(input_: EventCommandReceived, expected: EventCo
 # def test_make_order(input_: EventCommandReceived, expected: EventCommandToSend):
 #
 #     dialog = Dialog()
-#     dialog.callback = Callback.Schema().loads(input_.payload.command)
+#     dialog.callback = callbacks.decode(input_.payload.command)
 #     result = dialog.make_order(input_)
 #     assert result.payload.text.find(
 #         'https://b98b84b2aa73.ngrok.io/billing/stripe_redirect/cs_test_') >= 0
@@ -0,0 +1,134 @@
+import json
+import os
+from io import StringIO
+from typing import Any, List, Optional, Tuple
+
+import pytest
+
+from django.core.management import CommandError, call_command
+from djmoney.money import Money
+
+from bot.dialog import Dialog
+from common import callbacks
+from common.constants import CallbackType
+from common.entities import EventCommandReceived
+from shop.catalog import CatalogStore
+from shop.importer import CatalogImport, read_rows
+from shop.models import Category, Order, Product
+from shop.search import ProductSearch
+
+
+CSV = '''type,sku,name,parent,price,currency,categories,is_active,sort_order
+category,C-GPU,Видеокарты,C-PARTS,,,,,2
+category,C-PARTS,Комплектующие,,,,,,1
+category,C-OLD,Раритеты,C-PARTS,,,,нет,
+product,P-1,Видеокарта Matrox G200,,1500.50,,C-GPU|C-OLD,,
+product,P-2,Процессор Cyrix 6x86,,900,USD,C-OLD|C-NONE,,
+product,,Без артикула,,1,,,,
+product,P-3,Кулер,,не число,,,,
+'''
+
+
+with open('tests/dialog_content.json', 'r') as f:
+    lines = json.loads(f.readline())
+
+
+def write(tmp_path: Any, name: str, content: str) -> str:
+    path = os.path.join(str(tmp_path), name)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(content)
+    return path
+
+
+def categories_of(sku: str) -> List[str]:
+    return sorted(Product.objects.get(sku=sku).categories.values_list('sku', flat=True))
+
+
+def reply(command: Optional[str] = None, text: Optional[str] = None) -> Tuple[str, List[str]]:
+    """Ответ диалога на кнопку или текст: текст сообщения и команды его кнопок."""
+
+    event = EventCommandReceived.Schema().loads(lines['product_input'])
+    event.payload.command, event.payload.text = command, text
+    result = Dialog().reply(event)
+    assert result is not None
+    return result.payload.text, [button.action.payload for button in result.inline_buttons or ()]
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('chunk', [1, 2, 100])
+def test_csv_import(tmp_path: Any, chunk: int) -> None:
+    product = Product.objects.create(name='Товар из админки')
+    result = CatalogImport(chunk).run(read_rows(write(tmp_path, 'catalog.csv', CSV)))
+
+    assert result['rows'] == 7 and result['skipped'] == 2
+    assert (result['categories_created'], result['products_created']) == (3, 2)
+    assert result['links'] == 3 and result['unknown_categories'] == 1
+    parts = Category.objects.get(sku='C-PARTS')
+    # родительская категория встретилась позже дочерней
+    assert Category.objects.get(sku='C-GPU').path == f'{parts.pk}/{Category.objects.get(sku="C-GPU").pk}/'
+    assert not Category.objects.get(sku='C-OLD').is_active
+    matrox = Product.objects.get(sku='P-1')
+    assert matrox.price == Money('1500.50', 'RUB') and matrox.is_active
+    assert Product.objects.get(sku='P-2').price == Money(900, 'USD')
+    assert categories_of('P-1') == ['C-GPU', 'C-OLD'] and categories_of('P-2') == ['C-OLD']
+    assert ProductSearch().search('matrox') == [matrox.pk]
+    assert matrox.pk in CatalogStore().current().get_subtree_products(parts.pk)[0].values()
+    # товары без артикула не снимаются с продажи
+    assert Product.objects.get(pk=product.pk).is_active
+
+
+@pytest.mark.django_db
+def test_jsonl_upsert_and_deactivation(tmp_path: Any) -> None:
+    CatalogImport().run(read_rows(write(tmp_path, 'catalog.csv', CSV)))
+    ids = dict(Product.objects.filter(sku__isnull=False).values_list('sku', 'id'))
+    rows = [
+        {'type': 'category', 'sku': 'C-GPU', 'name': 'Графические ускорители'},
+        {'sku': 'P-1', 'name': 'Видеокарта Matrox G400', 'price': 2000, 'categories': ['C-GPU']},
+        {'sku': 'P-4', 'name': 'Звуковая карта', 'price': '700', 'categories': []},
+    ]
+    content = '\n'.join(json.dumps(row, ensure_ascii=False) for row in rows) + '\n[1, 2]\n{oops\n'
+    out = StringIO()
+    call_command('import_catalog', write(tmp_path, 'catalog.jsonl', content), '--chunk', '2', stdout=out)
+
+    assert '5 rows' in out.getvalue() and '2 rows skipped' in out.getvalue()
+    gpu = Category.objects.get(sku='C-GPU')
+    assert gpu.name == 'Графические ускорители' and gpu.parent_category_id is None and gpu.path == f'{gpu.pk}/'
+    matrox = Product.objects.get(sku='P-1')
+    assert matrox.pk == ids['P-1'] and matrox.name == 'Видеокарта Matrox G400' and matrox.price == Money(2000, 'RUB')
+    assert categories_of('P-1') == ['C-GPU']
+    assert not Product.objects.get(sku='P-2').is_active and Product.objects.get(sku='P-4').is_active
+    assert ProductSearch().search('g400') == [matrox.pk] and ProductSearch().search('g200') == []
+
+
+@pytest.mark.django_db
+def test_keep_missing_and_errors(tmp_path: Any) -> None:
+    CatalogImport().run(read_rows(write(tmp_path, 'catalog.csv', CSV)))
+    call_command('import_catalog', write(tmp_path, 'one.jsonl', '{"sku": "P-1", "name": "Matrox"}\n'),
+                 '--keep-missing', stdout=StringIO())
+    assert Product.objects.get(sku='P-2').is_active
+
+    with pytest.raises(CommandError):
+        call_command('import_catalog', write(tmp_path, 'catalog.xml', '<catalog/>'))
+    with pytest.raises(CommandError):
+        call_command('import_catalog', os.path.join(str(tmp_path), 'missing.csv'))
+
+
+@pytest.mark.django_db
+def test_removed_sku_disappears_from_dialog(tmp_path: Any) -> None:
+    CatalogImport().run(read_rows(write(tmp_path, 'catalog.csv', CSV)))
+    old, cyrix = Category.objects.get(sku='C-OLD').pk, Product.objects.get(sku='P-2').pk
+    category = callbacks.make(CallbackType.CATEGORY, old)
+    product = callbacks.make(CallbackType.PRODUCT, cyrix)
+    assert product in reply(category)[1] and product in reply(text='cyrix')[1]
+    assert 'Cyrix' in reply(product)[0]
+
+    # в новой выгрузке артикула P-2 нет
+    CatalogImport().run(read_rows(write(tmp_path, 'catalog.csv', CSV.replace('product,P-2,', 'product,,'))))
+    assert not Product.objects.get(pk=cyrix).is_active
+    assert product not in reply(category)[1] and callbacks.make(CallbackType.PRODUCT, Product.objects.get(
+        sku='P-1').pk) in reply(category)[1]
+    assert product not in reply(text='cyrix')[1]
+    # кнопка товара из старого сообщения возвращает к приветствию, заказать его нельзя
+    greeting = reply()
+    assert reply(product) == greeting and reply(callbacks.make(CallbackType.STRIPE, cyrix)) == greeting
+    assert not Order.objects.filter(product_id=cyrix).exists()
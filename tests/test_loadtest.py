@@ -0,0 +1,40 @@
+"""Нагрузочный тест util.loadtest: короткий прогон в отдельном процессе на временной базе."""
+
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+from util.loadtest import percentile
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_percentile() -> None:
+    values = [float(value) for value in range(1, 101)]
+    assert percentile(values, 0.5) == 51.0
+    assert percentile(values, 0.99) == 100.0
+    assert percentile([], 0.5) == 0.0
+
+
+@pytest.mark.parametrize('webhook_async', ['0', '1'])
+def test_conversations_reach_payment(webhook_async: str) -> None:
+    # ответы уходят через отправитель outbox в процессе приложения, в остальных тестах он выключен (pytest.ini)
+    env = dict(os.environ, WEBHOOK_ASYNC=webhook_async, OUTBOX_IN_PROCESS='1',
+               DJANGO_SETTINGS_MODULE='tests.test_settings')
+    result = subprocess.run(
+        [sys.executable, '-m', 'util.loadtest', '--conversations', '6', '--concurrency', '3', '--json'],
+        cwd=ROOT, env=env, stdout=subprocess.PIPE, timeout=120, check=True,
+    )
+    report = json.loads(result.stdout)
+
+    assert report['outcomes'] == {'completed': 6, 'timeout': 0, 'too_long': 0}
+    assert report['http_errors'] == 0
+    assert report['webhooks'] >= 6 * 3
+    assert report['db_queries']['per_webhook'] > 0
+    assert report['stubs']['ok']['requests'] > 0 and report['stubs']['jivo']['requests'] > 0
+    assert report['stubs']['paypal']['requests'] + report['stubs']['stripe']['requests'] > 0
+    assert all(stats['errors'] == 0 for stats in report['stubs'].values())
@@ -0,0 +1,85 @@
+import threading
+import time
+
+import pytest
+from django.test import Client
+
+from bot.feed import MessageFeed
+from bot.models import Message
+from bot.pagination import encode_cursor
+from bot.persistence import MessageWriteBuffer, SingletonWriteBuffer
+from common.constants import ChatType, MessageContentType, MessageDirection
+
+
+def test_watch_is_woken_by_publish() -> None:
+    feed = MessageFeed()
+    with feed.watch(101) as watch:
+        assert feed.stats()['watches'] >= 1
+        threading.Timer(0.05, feed.publish, args=((101,),)).start()
+        started = time.monotonic()
+        assert watch.wait(5)
+        assert time.monotonic() - started < 1
+        # оповещения других чатов не будят
+        feed.publish((102,))
+        assert not watch.wait(0.05)
+    assert 101 not in feed._watches
+
+
+@pytest.mark.django_db
+def test_messages_after_cursor_in_pages() -> None:
+    client = Client()
+    all_ids = list(Message.objects.filter(chat_id=1).order_by('created_at', 'id').values_list('id', flat=True))
+    seen, params = [], {'limit': 2}
+    while True:
+        data = client.get('/chats/1/messages/', params).json()
+        if not data['messages']:
+            break
+        assert len(data['messages']) <= 2
+        seen.extend(message['number'] for message in data['messages'])
+        params['after'] = data['cursor']
+    assert seen == all_ids
+    assert client.get('/chats/1/messages/', {'after': 'x'}).status_code == 400
+
+
+@pytest.mark.django_db
+def test_long_poll_waits_only_when_nothing_new() -> None:
+    client = Client()
+    started = time.monotonic()
+    assert client.get('/chats/1/messages/', {'wait': 5}).json()['messages']
+    assert time.monotonic() - started < 1
+
+    last = Message.objects.filter(chat_id=1).latest('created_at', 'id')
+    cursor = encode_cursor(last.created_at, last.pk)
+    started = time.monotonic()
+    data = client.get('/chats/1/messages/', {'after': cursor, 'wait': 0.2}).json()
+    assert data == {'messages': [], 'cursor': cursor}
+    assert time.monotonic() - started >= 0.2
+
+
+@pytest.mark.django_db
+def test_saved_message_wakes_watchers(monkeypatch: pytest.MonkeyPatch) -> None:
+    # транзакция теста не фиксируется, поэтому обработчики on_commit выполняются сразу
+    monkeypatch.setattr('bot.managers.transaction.on_commit', lambda func: func())
+    with MessageFeed().watch(1) as watch:
+        Message.objects.save_message(1, 'chat:C000000000001', ChatType.PRIVATE, MessageDirection.SENT,
+                                     MessageContentType.TEXT, 'user:000000000001', 'Pavel', 'Новое сообщение')
+        assert watch.wait(0)
+
+
+@pytest.mark.django_db
+def test_write_behind_question_precedes_reply(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr('bot.managers.MESSAGE_WRITE_BEHIND', True)
+    # буфер без фонового потока: сообщения записываются только явным сбросом
+    monkeypatch.setattr(SingletonWriteBuffer(), '_buffer', MessageWriteBuffer(interval=60))
+    last = Message.objects.filter(chat_id=1).latest('created_at', 'id')
+    args = (1, 'chat:C000000000001', ChatType.PRIVATE)
+    user = (MessageContentType.TEXT, 'user:000000000001', 'Pavel')
+    question = Message.objects.save_message(*args, MessageDirection.RECEIVED, *user, 'Вопрос')
+    assert question.pk is None
+    Message.objects.save_message(*args, MessageDirection.SENT, *user, 'Ответ')
+
+    history = Message.objects.get_chat_messages(1, limit=2)
+    assert [message.text for message in history] == ['Вопрос', 'Ответ']
+    data = Client().get('/chats/1/messages/', {'after': encode_cursor(last.created_at, last.pk)}).json()
+    assert [message['content'] for message in data['messages']] == ['Вопрос', 'Ответ']
+    assert SingletonWriteBuffer().get_buffer.stats()['pending_messages'] == 0
@@ -0,0 +1,177 @@
+import json
+from datetime import timedelta
+from typing import Any, Dict, List
+
+import pytest
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from billing.abstract import PaymentSystemClient
+from billing.common import PaymentClientFactory
+from billing.models import Checkout
+from bot.dialog import Dialog
+from bot.models import Chat, Message
+from bot.screens import build_screen
+from clients.jivosite.jivosite import JivositeClient
+from common import callbacks
+from common.constants import CallbackType, ChatType, OrderStatus, PaymentSystem
+from common.entities import EventCommandReceived
+from common.strings import DialogPhrases
+from shop.constants import ORDER_IDEMPOTENCY_WINDOW
+from shop.models import Order
+
+
+CHAT = 'chat:C000000000001'
+
+with open('tests/dialog_content.json', 'r') as f:
+    lines = json.loads(f.readline())
+
+
+class StubClient(PaymentSystemClient):
+    """Платёжная система без сети: чекаут выписывается только в базе."""
+
+    system = PaymentSystem.STRIPE
+    sessions: List[int] = []
+
+    def check_out(self, order_id: int, product_id: int) -> str:
+        self.sessions.append(order_id)
+        tracking_id = f'cs_test_{len(self.sessions)}'
+        Checkout.objects.make_checkout(self.system, tracking_id, order_id)
+        return self.approve_link(tracking_id)
+
+    def approve_link(self, tracking_id: str) -> str:
+        return f'https://pay.example.com/{tracking_id}'
+
+    def verify(self, request: Any) -> bool:
+        return True
+
+    def capture(self, wh_data: Dict[str, Any]) -> None:
+        pass
+
+    def fulfill(self, data: Dict[str, Any]) -> None:
+        pass
+
+
+def data_queries(queries: CaptureQueriesContext) -> List[str]:
+    return [query['sql'] for query in queries if not query['sql'].startswith(('BEGIN', 'SAVEPOINT', 'RELEASE'))]
+
+
+def pay_button(message_id: str) -> EventCommandReceived:
+    event = EventCommandReceived.Schema().loads(lines['product_input'])
+    event.bot_id, event.chat_id_in_messenger, event.message_id_in_messenger = 1, CHAT, message_id
+    event.payload.command = callbacks.make(CallbackType.STRIPE, 19)
+    return event
+
+
+@pytest.mark.django_db
+def test_make_order_is_idempotent_per_message() -> None:
+    Chat.objects.get_chat_id(1, CHAT)
+    with CaptureQueriesContext(connection) as queries:
+        order, created = Order.objects.make_order(CHAT, 1, 19, request_key='mid.1')
+    # поиск по ключу, цена товара и вставка; id чата - из кэша
+    assert created and len(data_queries(queries)) == 3
+    with CaptureQueriesContext(connection) as queries:
+        assert Order.objects.make_order(CHAT, 1, 19, request_key='mid.1') == (order, False)
+    assert len(data_queries(queries)) == 1
+
+    assert Order.objects.make_order(CHAT, 1, 21, request_key='mid.1')[1]
+    assert Order.objects.make_order(CHAT, 1, 19, request_key='mid.2')[1]
+    assert Order.objects.make_order(CHAT, 1, 19)[1] and Order.objects.make_order(CHAT, 1, 19)[1]
+    assert Order.objects.filter(request_key='mid.1').count() == 2
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('change', [
+    {'created_at': timezone.now() - timedelta(seconds=ORDER_IDEMPOTENCY_WINDOW + 1)},
+    {'status': OrderStatus.COMPLETE.value},
+])
+def test_expired_or_paid_order_is_not_reused(change: Dict[str, Any]) -> None:
+    order, _ = Order.objects.make_order(CHAT, 1, 19, request_key='mid.1')
+    Order.objects.filter(pk=order.pk).update(**change)
+    repeated, created = Order.objects.make_order(CHAT, 1, 19, request_key='mid.1')
+    assert created and repeated.pk != order.pk
+    assert Order.objects.get(pk=order.pk).request_key is None
+
+
+@pytest.mark.django_db
+def test_double_tap_reuses_checkout(monkeypatch: Any) -> None:
+    monkeypatch.setattr(PaymentClientFactory, 'types', {'stripe': StubClient})
+    monkeypatch.setattr(StubClient, 'sessions', [])
+    first = Dialog().reply(pay_button('mid.tap')).payload.text
+    assert Dialog().reply(pay_button('mid.tap')).payload.text == first
+    assert 'cs_test_1' in first and len(StubClient.sessions) == 1
+    assert Checkout.objects.filter(order_id=StubClient.sessions[0]).count() == 1
+
+    assert 'cs_test_2' in Dialog().reply(pay_button('mid.other')).payload.text
+
+
+@pytest.mark.django_db
+def test_tap_during_check_out_waits_for_it(monkeypatch: Any) -> None:
+    monkeypatch.setattr(StubClient, 'sessions', [])
+    order, _ = Order.objects.make_order(CHAT, 1, 19, request_key='mid.tap')
+    # первое нажатие уже обращается к платёжной системе
+    assert Checkout.objects.claim_checkout(order.pk, PaymentSystem.STRIPE)
+    assert not Checkout.objects.claim_checkout(order.pk, PaymentSystem.STRIPE)
+    assert Checkout.objects.get_tracking_id(order.pk, PaymentSystem.STRIPE) is None
+
+    def first_tap_done(seconds: float) -> None:
+        Checkout.objects.make_checkout(PaymentSystem.STRIPE, 'cs_first', order.pk)
+
+    monkeypatch.setattr('billing.abstract.time.sleep', first_tap_done)
+    assert StubClient().resume_check_out(order.pk, 19).endswith('cs_first')
+    assert StubClient.sessions == [] and Checkout.objects.filter(order=order).count() == 1
+
+
+@pytest.mark.django_db
+def test_stalled_check_out_is_retried(monkeypatch: Any) -> None:
+    monkeypatch.setattr(PaymentClientFactory, 'types', {'stripe': StubClient})
+    monkeypatch.setattr(StubClient, 'sessions', [])
+    monkeypatch.setattr('billing.abstract.CHECKOUT_PENDING_TIMEOUT', 0)
+    order, _ = Order.objects.make_order(CHAT, 1, 19, request_key='mid.tap')
+    Checkout.objects.claim_checkout(order.pk, PaymentSystem.STRIPE)
+    assert Dialog().reply(pay_button('mid.tap')).payload.text == DialogPhrases.PAYMENT_PENDING.value
+    assert StubClient.sessions == []
+
+    # первое нажатие так и не дождалось ответа платёжной системы
+    Checkout.objects.filter(order=order).update(created_at=timezone.now() - timedelta(minutes=1))
+    assert 'cs_test_1' in Dialog().reply(pay_button('mid.tap')).payload.text
+    assert Checkout.objects.filter(order=order).values_list('tracking_id', flat=True).get() == 'cs_test_1'
+
+
+@pytest.mark.django_db
+def test_failed_check_out_releases_claim(monkeypatch: Any) -> None:
+    def fail(self: StubClient, order_id: int, product_id: int) -> str:
+        raise ConnectionError('payment system is down')
+
+    monkeypatch.setattr(StubClient, 'check_out', fail)
+    order, _ = Order.objects.make_order(CHAT, 1, 19, request_key='mid.tap')
+    with pytest.raises(ConnectionError):
+        StubClient().resume_check_out(order.pk, 19)
+    assert not Checkout.objects.filter(order=order).exists()
+
+
+@pytest.mark.django_db
+def test_jivo_double_tap_reuses_order(monkeypatch: Any, rf: Any) -> None:
+    monkeypatch.setattr(PaymentClientFactory, 'types', {'stripe': StubClient})
+    monkeypatch.setattr(StubClient, 'sessions', [])
+    client = 'jivo:double-tap'
+    confirmation = build_screen('Оплатить?', [{'title': 'Stripe', 'id': 19, 'type': CallbackType.STRIPE}]).stamp(
+        2, client)
+    confirmation.message_id = 77
+    JivositeClient()._form_message(confirmation)
+
+    def tap(webhook_id: str) -> EventCommandReceived:
+        # Jivo присылает только текст кнопки, id вебхука у каждого нажатия свой
+        body = json.dumps({'id': webhook_id, 'client_id': client, 'chat_id': '5', 'site_id': None, 'sender': None,
+                           'event': 'CLIENT_MESSAGE',
+                           'message': {'type': 'TEXT', 'text': 'Stripe', 'timestamp': 1600000000}})
+        return JivositeClient().parse_webhook(rf.post('/jivo/', body, content_type='application/json'))
+
+    first, second = tap('wh-1'), tap('wh-2')
+    assert first.message_id_in_messenger == second.message_id_in_messenger == '77'
+    Message.objects.save_message(2, client, ChatType.PRIVATE, first.payload.direction, first.content_type,
+                                 first.user_id_in_messenger, first.user_name_in_messenger, 'Stripe')
+    assert Dialog().reply(first).payload.text == Dialog().reply(second).payload.text
+    assert len(StubClient.sessions) == 1
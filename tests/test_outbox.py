@@ -0,0 +1,102 @@
+import json
+from datetime import timedelta
+from typing import List
+
+import pytest
+from django.apps import apps
+from django.utils import timezone
+
+from bot.handlers import message_handler
+from bot.models import Message, OutboxMessage
+from bot.outbox import OutboxRelay, SingletonOutbox
+from clients.delivery import Delivery
+from common.constants import MessageStatus, OutboxStatus
+from common.entities import EventCommandReceived
+
+
+with open('tests/dialog_content.json', 'r') as f:
+    lines = json.loads(f.readline())
+
+
+def event(name: str) -> EventCommandReceived:
+    # чат фикстуры принадлежит другому пользователю, поэтому команды приходят в отдельный чат
+    received = EventCommandReceived.Schema().loads(lines[name])
+    received.chat_id_in_messenger = 'chat:C0000000outbox'
+    return received
+
+
+class FakeEngine:
+    def __init__(self, accept: bool = True) -> None:
+        self.accept = accept
+        self.deliveries: List[Delivery] = []
+
+    def submit(self, delivery: Delivery) -> bool:
+        self.deliveries.append(delivery)
+        return self.accept
+
+
+@pytest.mark.django_db
+def test_reply_is_written_to_outbox_and_drained() -> None:
+    result = message_handler(event('product_input'))
+    row = OutboxMessage.objects.get(message_id=result.message_id)
+    assert row.status == OutboxStatus.PENDING.value
+
+    engine = FakeEngine()
+    relay = OutboxRelay(engine=engine)  # type: ignore
+    assert relay.drain_once() == 1
+    assert relay.drain_once() == 0
+    assert len(engine.deliveries) == 1
+    assert engine.deliveries[0].platform == 'ok'
+
+    engine.deliveries[0].on_delivered()  # type: ignore
+    row.refresh_from_db()
+    assert (row.status, row.lease_token, row.attempts) == (OutboxStatus.SENT.value, None, 1)
+    assert Message.objects.get(pk=result.message_id).status == MessageStatus.SENT.value
+
+
+@pytest.mark.django_db
+def test_claims_are_exclusive_and_leases_expire() -> None:
+    result = message_handler(event('desc_input'))
+    token, rows = OutboxMessage.objects.claim(10, lease=60)
+    assert [row.message_id for row in rows] == [result.message_id]
+    assert OutboxMessage.objects.claim(10, lease=60)[1] == []
+
+    # аренда истекла: запись захватывает другой отправитель, поздний ответ первого игнорируется
+    OutboxMessage.objects.filter(pk=rows[0].pk).update(lease_expires_at=timezone.now() - timedelta(seconds=1))
+    new_token, reclaimed = OutboxMessage.objects.claim(10, lease=60)
+    assert [row.pk for row in reclaimed] == [rows[0].pk]
+    OutboxMessage.objects.mark_sent(rows[0].pk, token, result.message_id)
+    assert OutboxMessage.objects.get(pk=rows[0].pk).status == OutboxStatus.SENDING.value
+
+    OutboxMessage.objects.mark_failed(rows[0].pk, new_token, result.message_id, 'rejected: test')
+    row = OutboxMessage.objects.get(pk=rows[0].pk)
+    assert (row.status, row.attempts, row.last_error) == (OutboxStatus.FAILED.value, 2, 'rejected: test')
+    assert Message.objects.get(pk=result.message_id).status == MessageStatus.FAILED.value
+
+
+@pytest.mark.django_db
+def test_full_delivery_window_releases_claim() -> None:
+    message_handler(event('desc_input'))
+    relay = OutboxRelay(engine=FakeEngine(accept=False))  # type: ignore
+    assert relay.drain_once() == 1
+    row = OutboxMessage.objects.get()
+    assert (row.status, row.lease_token) == (OutboxStatus.PENDING.value, None)
+    assert row.available_at > timezone.now()
+    assert relay.stats()['released'] == 1
+
+
+def test_relay_starts_with_the_app(monkeypatch: pytest.MonkeyPatch) -> None:
+    started: List[OutboxRelay] = []
+    monkeypatch.setattr(OutboxRelay, 'start', lambda relay: started.append(relay))
+    monkeypatch.setattr('bot.constants.OUTBOX_IN_PROCESS', True)
+    monkeypatch.setattr('bot.outbox.OUTBOX_IN_PROCESS', True)
+    monkeypatch.setattr(SingletonOutbox(), '_relay', None)
+
+    # команды manage.py, кроме runserver, отправитель не запускают
+    monkeypatch.setattr('sys.argv', ['manage.py', 'migrate'])
+    apps.get_app_config('bot').ready()
+    assert SingletonOutbox()._relay is None
+
+    monkeypatch.setattr('sys.argv', ['gunicorn', 'ecom_chatbot.wsgi'])
+    apps.get_app_config('bot').ready()
+    assert started == [SingletonOutbox()._relay]
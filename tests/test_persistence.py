@@ -0,0 +1,65 @@
+import pytest
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from bot.identity import IdentityCache
+from bot.models import BotUser, Chat, Message
+from bot.persistence import MessageWriteBuffer
+from common.constants import ChatType, MessageContentType, MessageDirection, MessageStatus
+
+
+@pytest.mark.django_db
+def test_write_buffer_flushes_in_batches() -> None:
+    chat = Chat.objects.get(pk=1)
+    buffer = MessageWriteBuffer(batch_size=50, interval=60)
+    times = []
+    for i in range(20):
+        message = Message(bot_id=chat.bot_id, chat=chat, bot_user_id=chat.bot_user_id, text=f'msg {i}',
+                          direction=MessageDirection.RECEIVED.value, status=MessageStatus.DELIVERED.value)
+        buffer.add_message(message)
+        buffer.touch_chat(chat.pk, message.created_at, message.text)
+        times.append(message.created_at)
+    before = Message.objects.filter(chat=chat).count()
+
+    with CaptureQueriesContext(connection) as ctx:
+        assert buffer.flush() == 20
+    writes = [q for q in ctx.captured_queries if q['sql'].startswith(('INSERT', 'UPDATE'))]
+    assert len(writes) == 2
+
+    assert Message.objects.filter(chat=chat).count() == before + 20
+    # время создания сохраняется на момент постановки в буфер, а не записи
+    assert list(Message.objects.filter(chat=chat, text__startswith='msg ').order_by('created_at')
+                .values_list('created_at', flat=True)) == times
+    chat.refresh_from_db()
+    assert chat.last_message_text == 'msg 19'
+    assert chat.last_message_time == times[-1]
+    assert buffer.stats()['pending_messages'] == 0
+
+
+@pytest.mark.django_db
+def test_save_message_single_insert() -> None:
+    with CaptureQueriesContext(connection) as ctx:
+        message = Message.objects.save_message(1, 'chat:C000000000001', ChatType.PRIVATE, MessageDirection.RECEIVED,
+                                               MessageContentType.TEXT, 'user:000000000001', 'Pavel', 'hello')
+    assert message.pk is not None
+    assert message.status == MessageStatus.DELIVERED.value
+    assert len([q for q in ctx.captured_queries if q['sql'].startswith('INSERT')]) == 1
+    assert Chat.objects.get(pk=message.chat_id).last_message_time <= timezone.now()
+
+
+@pytest.mark.django_db
+def test_identity_cache_skips_lookups() -> None:
+    args = (1, 'chat:C000000000001', ChatType.PRIVATE, MessageDirection.RECEIVED, MessageContentType.TEXT,
+            'user:000000000001', 'Pavel', 'hello')
+    Message.objects.save_message(*args)
+    hits = IdentityCache().stats()['chats']['hits']
+    with CaptureQueriesContext(connection) as ctx:
+        Message.objects.save_message(*args)
+    assert [q['sql'].split()[0] for q in ctx.captured_queries] == ['INSERT', 'UPDATE']
+    assert IdentityCache().stats()['chats']['hits'] == hits + 1
+
+    BotUser.objects.get(pk=1).delete()
+    assert IdentityCache().chats.get((1, 'chat:C000000000001')) is None
+    assert IdentityCache().users.get((1, 'user:000000000001')) is None
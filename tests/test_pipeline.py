@@ -0,0 +1,113 @@
+import threading
+import time
+from typing import Any, Dict, List, Tuple
+
+from django.test import Client
+
+from bot.pipeline import SingletonPipeline, WebhookPipeline
+from common.constants import ChatType, MessageContentType
+from common.entities import EventCommandReceived, Payload
+
+
+def make_event(chat: str, text: str) -> EventCommandReceived:
+    return EventCommandReceived(
+        bot_id=1,
+        chat_id_in_messenger=chat,
+        content_type=MessageContentType.TEXT,
+        payload=Payload(text=text),
+        chat_type=ChatType.PRIVATE,
+        user_id_in_messenger=chat,
+    )
+
+
+def test_pipeline_keeps_chat_order() -> None:
+    seen: Dict[str, List[str]] = {}
+    lock = threading.Lock()
+
+    def processor(bot_type: int, event: EventCommandReceived) -> None:
+        time.sleep(0.001)
+        with lock:
+            seen.setdefault(event.chat_id_in_messenger, []).append(event.payload.text)
+
+    pipeline = WebhookPipeline(processor, workers=4, maxsize=800)
+    pipeline.start()
+    for i in range(50):
+        for chat in ('a', 'b', 'c'):
+            assert pipeline.submit(11, make_event(chat, str(i)))
+    pipeline.join()
+    pipeline.stop()
+
+    for chat in ('a', 'b', 'c'):
+        assert seen[chat] == [str(i) for i in range(50)]
+    stats = pipeline.stats()
+    assert stats['processed'] == 150
+    assert stats['depth'] == 0
+    assert stats['wait_max'] >= stats['wait_avg'] >= 0
+
+
+def test_pipeline_rejects_when_full_and_survives_errors() -> None:
+    release = threading.Event()
+    handled: List[Tuple[int, str]] = []
+
+    def processor(bot_type: int, event: EventCommandReceived) -> None:
+        release.wait(5)
+        if event.payload.text == 'boom':
+            raise RuntimeError('boom')
+        handled.append((bot_type, event.payload.text))
+
+    pipeline = WebhookPipeline(processor, workers=1, maxsize=2)
+    pipeline.start()
+    assert pipeline.submit(10, make_event('a', 'boom'))
+    # первое задание уже взято воркером, в очереди остаётся место на два
+    time.sleep(0.05)
+    assert pipeline.submit(10, make_event('a', '1'))
+    assert pipeline.submit(10, make_event('a', '2'))
+    assert not pipeline.submit(10, make_event('a', '3'))
+    release.set()
+    pipeline.join()
+    pipeline.stop()
+
+    assert handled == [(10, '1'), (10, '2')]
+    stats = pipeline.stats()
+    assert (stats['processed'], stats['failed'], stats['rejected']) == (2, 1, 1)
+
+
+def test_submit_waits_for_room() -> None:
+    release = threading.Event()
+    pipeline = WebhookPipeline(lambda bot_type, event: release.wait(5), workers=1, maxsize=1)
+    pipeline.start()
+    assert pipeline.submit(10, make_event('a', '1'))
+    time.sleep(0.05)
+    assert pipeline.submit(10, make_event('a', '2'))
+    assert not pipeline.submit(10, make_event('a', '3'), timeout=0.05)
+    # место освобождается, пока вебхук ждёт
+    threading.Timer(0.05, release.set).start()
+    assert pipeline.submit(10, make_event('a', '3'), timeout=5)
+    pipeline.join()
+    pipeline.stop()
+    assert pipeline.stats()['rejected'] == 1
+
+
+def test_full_queue_answers_503(monkeypatch: Any) -> None:
+    class Parser:
+        def verify_request(self, request: Any) -> bool:
+            return True
+
+        def parse_webhook(self, request: Any) -> EventCommandReceived:
+            return make_event('a', 'text')
+
+    class FullPipeline:
+        def submit(self, bot_type: int, event: EventCommandReceived, timeout: float = 0.0) -> bool:
+            return False
+
+    handled: List[EventCommandReceived] = []
+    monkeypatch.setattr('bot.views.WEBHOOK_ASYNC', True)
+    monkeypatch.setattr('bot.views.WEBHOOK_QUEUE_TIMEOUT', 1.5)
+    monkeypatch.setattr('bot.views.PlatformClientFactory.create', lambda bot_type: Parser())
+    monkeypatch.setattr('bot.views.process_event', lambda bot_type, event: handled.append(event))
+    monkeypatch.setattr(SingletonPipeline, 'get_pipeline', FullPipeline())
+    for path in ('/ok_webhook/', '/jivo_webhook/test'):
+        response = Client().post(path, '{}', content_type='application/json')
+        assert response.status_code == 503 and response['Retry-After'] == '2'
+    # команда не обрабатывается в обход очереди чата
+    assert handled == []
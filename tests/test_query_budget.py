@@ -0,0 +1,95 @@
+import json
+from typing import Callable, ContextManager
+
+import pytest
+from django.db import connection
+from django.http import HttpRequest, HttpResponse
+from django.test import Client
+
+from bot.handlers import message_handler
+from bot.models import Bot
+from bot.querylog import NO_STAGE, QueryLog, QueryProfile, QueryProfileMiddleware, profile, stage
+from common.entities import EventCommandReceived
+
+
+Budget = Callable[..., ContextManager[QueryProfile]]
+
+with open('tests/dialog_content.json', 'r') as f:
+    lines = json.loads(f.readline())
+
+
+def event(name: str) -> EventCommandReceived:
+    # чат фикстуры принадлежит другому пользователю, поэтому команды приходят в отдельный чат
+    received = EventCommandReceived.Schema().loads(lines[name])
+    received.chat_id_in_messenger = 'chat:C00000000budget'
+    return received
+
+
+@pytest.mark.django_db
+def test_category_callback_stays_within_budget(query_budget: Budget) -> None:
+    # первое сообщение чата создаёт пользователя и чат и строит снимок каталога,
+    # поэтому бюджет проверяется на повторном: только запись входящего и исходящего сообщений и outbox
+    message_handler(event('category_input'))
+    with query_budget(7, persist=7, dialog=0, handler=0) as current:
+        message_handler(event('category_input'))
+    assert current.queries == sum(stats.queries for stats in current.stages.values())
+    assert NO_STAGE not in current.stages
+
+
+@pytest.mark.django_db
+def test_budget_helper_fails_when_exceeded(query_budget: Budget) -> None:
+    with pytest.raises(AssertionError, match='budget 1 exceeded'):
+        with query_budget(1):
+            list(Bot.objects.all())
+            list(Bot.objects.all())
+    with pytest.raises(AssertionError, match='Stage parse budget 0 exceeded'):
+        with query_budget(5, parse=0):
+            with stage('parse'):
+                list(Bot.objects.all())
+
+
+@pytest.mark.django_db
+def test_queries_go_to_innermost_stage_and_nested_profiles() -> None:
+    with profile('outer') as outer:
+        with stage('handler'):
+            list(Bot.objects.all())
+            with stage('dialog'), profile('inner', record=False) as inner:
+                list(Bot.objects.all())
+                list(Bot.objects.filter(pk=1))
+        list(Bot.objects.all())
+    assert (outer.queries, inner.queries) == (4, 2)
+    assert {name: stats.queries for name, stats in outer.stages.items()} == {'handler': 1, 'dialog': 2, NO_STAGE: 1}
+    assert outer.slowest_sql is not None
+    # обёртка снимается после выхода из внешнего профиля
+    assert connection.execute_wrappers == []
+    assert [recorded.label for recorded in QueryLog().recent()] == ['outer']
+
+
+@pytest.mark.django_db
+def test_middleware_records_request_by_route() -> None:
+    def view(request: HttpRequest) -> HttpResponse:
+        list(Bot.objects.all())
+        return HttpResponse('OK')
+
+    request = HttpRequest()
+    request.method, request.path = 'GET', '/direct/'
+    QueryProfileMiddleware(view)(request)
+    assert QueryLog().stats()['by_label']['GET /direct/']['queries_max'] == 1
+
+    Client().get('/chats/')
+    stats = QueryLog().stats()
+    assert stats['by_label']['GET chats/']['count'] == 1
+    assert stats['recorded'] == 2
+
+
+def test_stage_outside_profile_is_noop() -> None:
+    with stage('send'):
+        pass
+    assert QueryLog().stats()['recorded'] == 0
+
+
+def test_report_is_json_serializable() -> None:
+    current = QueryProfile('report')
+    current.record('persist', 'SELECT 1', 0.002)
+    report = current.report()
+    assert json.loads(json.dumps(report))['stages'] == {'persist': {'queries': 1, 'sql_ms': 2.0}}
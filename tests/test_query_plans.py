@@ -0,0 +1,171 @@
+"""Планы запросов методов менеджеров.
+
+Каждый публичный метод менеджеров bot, shop и billing выполняется на данных фикстуры, для всех его SELECT,
+UPDATE и DELETE снимается EXPLAIN QUERY PLAN. Тест падает, если запрос читает таблицу целиком (SCAN),
+а не ищет по индексу (SEARCH), и если у нового метода менеджера нет сценария в CASES."""
+
+import inspect
+import re
+from datetime import timedelta
+from typing import Any, Callable, Dict, List
+
+import pytest
+from django.db import connection, models
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+import billing.managers
+import bot.managers
+import shop.managers
+from billing.models import Checkout
+from bot.models import Bot, BotUser, Chat, Message, OutboxMessage
+from common.constants import (ChatType, MessageContentType, MessageDirection, OrderStatus, PaymentSystem)
+from common.entities import EventCommandToSend, Payload
+from shop.models import Category, Order, Product
+
+
+MODULES = (bot.managers, shop.managers, billing.managers)
+# поиск по индексу виртуальной таблицы FTS5 (SCAN ... VIRTUAL TABLE INDEX) полным просмотром не считается
+SCAN = re.compile(r'^SCAN (?:TABLE )?(\w+)\b(?! VIRTUAL TABLE INDEX)')
+
+# методы, которым полный просмотр таблицы необходим
+FULL_SCAN_ALLOWED = {
+    # пересчёт путей обходит все категории
+    'CategoryManager.rebuild_paths',
+}
+
+# методы, строки которых должны идти в порядке индекса, без сортировки результата (USE TEMP B-TREE)
+INDEX_ORDERED = {
+    'MessageManager.get_chat_messages': 'bot_message_chat_id_created_at',
+    'MessageManager.get_chat_messages_after': 'bot_message_chat_id_created_at',
+}
+
+
+@pytest.fixture
+def rows(monkeypatch: Any) -> Dict[str, Any]:
+    """Данные для сценариев: чат с временем сообщения, захваченная запись outbox и чекаут."""
+
+    monkeypatch.setattr('bot.managers.transaction.on_commit', lambda func: func())
+    chat = Chat.objects.get(pk=1)
+    chat.last_message_time = timezone.now()
+    chat.save()
+    payload = Payload()
+    payload.direction = MessageDirection.SENT
+    payload.text = 'plan'
+    OutboxMessage.objects.enqueue(EventCommandToSend(1, 'chat:C0000000plans', MessageContentType.TEXT, payload))
+    _, (outbox,) = OutboxMessage.objects.claim(1, lease=60)
+    Checkout.objects.create(order_id=2, system=PaymentSystem.PAYPAL.value, tracking_id='PLAN-TRACK',
+                            capture_id='PLAN-CAPTURE', status='CREATED')
+    return {'chat': chat, 'outbox': outbox, 'command': EventCommandToSend(
+        1, 'chat:C0000000plans', MessageContentType.TEXT, payload)}
+
+
+CASES: Dict[str, Callable[[Dict[str, Any]], Any]] = {
+    'BotManager.get_bot_id_by_type': lambda rows: Bot.objects.get_bot_id_by_type(rows['chat'].bot.bot_type),
+    'BotManager.get_bot_type_by_id': lambda rows: Bot.objects.get_bot_type_by_id(1),
+    'BotUserManager.get_or_create_user': lambda rows: BotUser.objects.get_or_create_user(1, 'user:plans', 'Plan'),
+    'BotUserManager.resolve_user_id': lambda rows: BotUser.objects.resolve_user_id(1, 'user:plans', 'Plan'),
+    'ChatManager.get_or_create_chat': lambda rows: Chat.objects.get_or_create_chat(
+        1, 'chat:C000000000001', ChatType.PRIVATE, rows['chat'].bot_user),
+    'ChatManager.resolve_chat_id': lambda rows: Chat.objects.resolve_chat_id(
+        1, 'chat:C000000000001', ChatType.PRIVATE, 1),
+    'ChatManager.get_chat_id': lambda rows: Chat.objects.get_chat_id(1, 'chat:C000000000001'),
+    'ChatManager.page': lambda rows: Chat.objects.page((rows['chat'].last_message_time, rows['chat'].pk), 50),
+    'MessageManager.save_message': lambda rows: Message.objects.save_message(
+        1, 'chat:C000000000001', ChatType.PRIVATE, MessageDirection.SENT, MessageContentType.TEXT,
+        'user:000000000001', 'Pavel', 'plan'),
+    'MessageManager.set_sent': lambda rows: Message.objects.set_sent(1),
+    'MessageManager.set_failed': lambda rows: Message.objects.set_failed(1),
+    'MessageManager.get_chat_messages': lambda rows: Message.objects.get_chat_messages(
+        1, (timezone.now(), 2 ** 31), 5),
+    'MessageManager.get_chat_messages_after': lambda rows: Message.objects.get_chat_messages_after(
+        1, (timezone.now() - timedelta(days=1), 0), 5),
+    'OutboxMessageManager.enqueue': lambda rows: OutboxMessage.objects.enqueue(rows['command']),
+    'OutboxMessageManager.claim': lambda rows: OutboxMessage.objects.claim(10, lease=60),
+    'OutboxMessageManager.mark_sent': lambda rows: OutboxMessage.objects.mark_sent(
+        rows['outbox'].pk, rows['outbox'].lease_token, rows['outbox'].message_id),
+    'OutboxMessageManager.mark_failed': lambda rows: OutboxMessage.objects.mark_failed(
+        rows['outbox'].pk, rows['outbox'].lease_token, rows['outbox'].message_id, 'plan'),
+    'OutboxMessageManager.release': lambda rows: OutboxMessage.objects.release(
+        rows['outbox'].pk, rows['outbox'].lease_token, 1.0),
+    'CategoryManager.get_categories': lambda rows: Category.objects.get_categories(4),
+    'CategoryManager.get_category_by_id': lambda rows: Category.objects.get_category_by_id(4),
+    'CategoryManager.get_breadcrumb': lambda rows: Category.objects.get_breadcrumb('5/24/22/'),
+    'CategoryManager.is_in_subtree': lambda rows: Category.objects.is_in_subtree(22, '5/'),
+    'CategoryManager.place': lambda rows: Category.objects.place(Category(pk=24, parent_category_id=6)),
+    'CategoryManager.detach_subtree': lambda rows: Category.objects.detach_subtree(
+        Category(pk=5, path='5/', depth=0)),
+    'CategoryManager.rebuild_paths': lambda rows: Category.objects.rebuild_paths(),
+    'ProductManager.get_products': lambda rows: Product.objects.get_products(4),
+    'ProductManager.get_subtree_products': lambda rows: Product.objects.get_subtree_products(5),
+    'ProductManager.get_subtree_product_page': lambda rows: Product.objects.get_subtree_product_page(5, 8, 8),
+    'ProductManager.get_product_by_id': lambda rows: Product.objects.get_product_by_id(19),
+    'ProductManager.get_products_by_query': lambda rows: Product.objects.get_products_by_query('видеокарта'),
+    'OrderManager.get_order': lambda rows: list(Order.objects.get_order(2)),
+    'OrderManager.make_order': lambda rows: Order.objects.make_order('chat:C000000000001', 1, 19,
+                                                                     request_key='mid.plan'),
+    'OrderManager.update_order': lambda rows: Order.objects.update_order(2, OrderStatus.CANCELED.value),
+    'CheckoutManager.make_checkout': lambda rows: Checkout.objects.make_checkout(
+        PaymentSystem.PAYPAL, 'PLAN-TRACK-2', 2, 'CREATED'),
+    'CheckoutManager.claim_checkout': lambda rows: Checkout.objects.claim_checkout(2, PaymentSystem.STRIPE),
+    'CheckoutManager.release_checkout': lambda rows: Checkout.objects.release_checkout(2, PaymentSystem.STRIPE),
+    'CheckoutManager.get_checkout': lambda rows: list(Checkout.objects.get_checkout('PLAN-TRACK')),
+    'CheckoutManager.get_tracking_id': lambda rows: Checkout.objects.get_tracking_id(2, PaymentSystem.PAYPAL),
+    'CheckoutManager.get_checkout_by_capture': lambda rows: list(
+        Checkout.objects.get_checkout_by_capture('PLAN-CAPTURE')),
+    'CheckoutManager.update_checkout': lambda rows: Checkout.objects.update_checkout('PLAN-TRACK', 'APPROVED'),
+    'CheckoutManager.update_capture': lambda rows: Checkout.objects.update_capture('PLAN-TRACK', 'PLAN-CAPTURE'),
+    'CheckoutManager.fulfill_checkout': lambda rows: Checkout.objects.fulfill_checkout('PLAN-CAPTURE'),
+}
+
+
+def manager_methods() -> List[str]:
+    methods = []
+    for module in MODULES:
+        for name, manager in inspect.getmembers(module, inspect.isclass):
+            if issubclass(manager, models.Manager) and manager.__module__ == module.__name__:
+                methods.extend(
+                    f'{name}.{method}' for method, value in vars(manager).items()
+                    if inspect.isfunction(value) and not method.startswith('_')
+                )
+    return methods
+
+
+def query_plan(sql: str) -> List[str]:
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+        return [row[-1] for row in cursor.fetchall()]
+
+
+def full_scans(sql: str) -> List[str]:
+    return [detail for detail in query_plan(sql) if SCAN.match(detail)]
+
+
+def test_every_manager_method_has_a_case() -> None:
+    assert sorted(manager_methods()) == sorted(CASES)
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('method', sorted(CASES))
+def test_manager_queries_use_indexes(method: str, rows: Dict[str, Any]) -> None:
+    with CaptureQueriesContext(connection) as queries:
+        CASES[method](rows)
+    statements = [query['sql'] for query in queries.captured_queries
+                  if query['sql'].split(' ', 1)[0] in ('SELECT', 'UPDATE', 'DELETE')]
+    scans = {sql: full_scans(sql) for sql in statements}
+    if method in FULL_SCAN_ALLOWED:
+        assert any(scans.values())
+    else:
+        assert {sql: scan for sql, scan in scans.items() if scan} == {}
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('method', sorted(INDEX_ORDERED))
+def test_manager_queries_read_in_index_order(method: str, rows: Dict[str, Any]) -> None:
+    with CaptureQueriesContext(connection) as queries:
+        CASES[method](rows)
+    plans = [query_plan(query['sql']) for query in queries.captured_queries if query['sql'].startswith('SELECT')]
+    assert plans
+    for plan in plans:
+        assert any(INDEX_ORDERED[method] in detail for detail in plan), plan
+        assert not any('TEMP B-TREE' in detail for detail in plan), plan
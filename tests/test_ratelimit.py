@@ -0,0 +1,36 @@
+import time
+from pathlib import Path
+
+from clients.ratelimit import LocalRateLimiter, SQLiteRateLimiter
+
+
+def test_bucket_smooths_bursts() -> None:
+    limiter = LocalRateLimiter(rate=10, burst=2)
+    assert limiter.acquire('ok:1') == 0
+    assert limiter.acquire('ok:1') == 0
+    wait = limiter.acquire('ok:1')
+    assert 0 < wait <= 0.1
+    # корзины ботов независимы
+    assert limiter.acquire('ok:2') == 0
+    time.sleep(wait)
+    assert limiter.acquire('ok:1') == 0
+    assert (limiter.granted, limiter.throttled) == (4, 1)
+
+
+def test_back_off_blocks_bucket() -> None:
+    limiter = LocalRateLimiter(rate=100, burst=10)
+    limiter.back_off('jivo:1', 5)
+    assert limiter.acquire('jivo:1') > 4
+    assert limiter.stats()['buckets']['jivo:1']['blocked_for'] > 4
+
+
+def test_sqlite_buckets_are_shared(tmp_path: Path) -> None:
+    path = str(tmp_path / 'ratelimit.sqlite3')
+    # разные инстансы - как разные процессы приложения, расходующие общий бюджет
+    first, second = SQLiteRateLimiter(path, rate=0.1, burst=2), SQLiteRateLimiter(path, rate=0.1, burst=2)
+    assert first.acquire('ok:1') == 0
+    assert second.acquire('ok:1') == 0
+    assert first.acquire('ok:1') > 0
+    second.back_off('ok:2', 30)
+    assert first.acquire('ok:2') > 29
+    assert set(first.stats()['buckets']) == {'ok:1', 'ok:2'}
@@ -0,0 +1,61 @@
+from typing import Any
+
+import pytest
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from bot.models import Bot
+from bot.registry import BotRegistry
+from clients.jivosite.jivosite import JivositeClient
+from clients.ok.ok import OkClient
+from common.constants import BotType, MessageContentType, MessageDirection
+from common.entities import EventCommandToSend, Payload
+
+
+@pytest.mark.django_db
+def test_registry_lookups_without_queries() -> None:
+    registry = BotRegistry()
+    registry.get_bot_id_by_type(BotType.TYPE_OK.value)
+    with CaptureQueriesContext(connection) as ctx:
+        assert registry.get_bot_id_by_type(BotType.TYPE_OK.value) == 1
+        assert registry.get_bot_type_by_id(2) == BotType.TYPE_JIVOSITE.value
+        assert registry.get(1).name == 'OK_bot_01'
+    assert not ctx.captured_queries
+    assert Bot.objects.get_bot_type_by_id(2) == BotType.TYPE_JIVOSITE.value
+
+
+@pytest.mark.django_db
+def test_registry_refreshes_on_save() -> None:
+    registry = BotRegistry()
+    bot = Bot.objects.get(pk=1)
+    bot.name = 'Renamed'
+    bot.save()
+    assert registry.get(1).name == 'Renamed'
+    bot.delete()
+    with pytest.raises(Bot.DoesNotExist):
+        registry.get_bot_id_by_type(BotType.TYPE_OK.value)
+
+
+@pytest.mark.django_db
+def test_credentials_are_read_on_load(monkeypatch: Any) -> None:
+    ok_bot = BotRegistry().get_bot_id_by_type(BotType.TYPE_OK.value)
+    monkeypatch.setenv('OK_TOKEN', 'token-after-import')
+    BotRegistry().invalidate()
+    assert BotRegistry().get(ok_bot).credentials == {'token': 'token-after-import'}
+
+
+@pytest.mark.django_db
+def test_clients_send_with_registry_credentials(monkeypatch: Any) -> None:
+    monkeypatch.setenv('OK_TOKEN', 'ok-token')
+    monkeypatch.setenv('JIVO_WH_KEY', 'jivo-key')
+    monkeypatch.setenv('JIVO_TOKEN', 'jivo-token')
+    BotRegistry().invalidate()
+    payload = Payload()
+    payload.direction = MessageDirection.SENT
+    payload.text = 'hello'
+
+    ok = OkClient().form_delivery(EventCommandToSend(1, 'chat:C000000000001', MessageContentType.TEXT, payload))
+    assert ok.url.endswith('/graph/me/messages/chat:C000000000001?access_token=ok-token')
+    jivo = JivositeClient().form_delivery(EventCommandToSend(2, 'client-1', MessageContentType.TEXT, payload))
+    assert jivo.url.endswith('/webhooks/jivo-key/jivo-token')
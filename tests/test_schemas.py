@@ -0,0 +1,21 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from common.constants import CallbackType
+from common.entities import Callback
+from common.schemas import get_schema, registered, schema_of
+
+
+def test_schema_instances_are_shared() -> None:
+    schema = get_schema(Callback)
+    assert get_schema(Callback) is schema
+    assert schema_of(Callback(CallbackType.PRODUCT, 1)) is schema
+    assert 'Callback' in registered()
+
+
+def test_shared_schema_across_threads() -> None:
+    def roundtrip(i: int) -> Callback:
+        return get_schema(Callback).loads(get_schema(Callback).dumps(Callback(CallbackType.PRODUCT, i)))
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        results = list(pool.map(roundtrip, range(200)))
+    assert [callback.id for callback in results] == list(range(200))
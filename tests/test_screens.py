@@ -0,0 +1,73 @@
+import json
+import threading
+from typing import List
+
+import pytest
+
+from bot.dialog import Dialog
+from bot.screens import Screen, ScreenCache, build_screen
+from common import callbacks
+from common.builders import MessageDirector
+from common.entities import EventCommandReceived, EventCommandToSend
+from shop.models import Product
+
+
+with open('tests/dialog_content.json', 'r') as f:
+    lines = json.loads(f.readline())
+
+
+@pytest.mark.django_db
+def test_cached_screen_stamps_chat_fields() -> None:
+    event = EventCommandReceived.Schema().loads(lines['product_input'])
+    expected = EventCommandToSend.Schema().loads(lines['product_answer'])
+    before = ScreenCache().stats()
+    assert Dialog().reply(event) == expected
+
+    other = EventCommandReceived.Schema().loads(lines['product_input'])
+    other.bot_id, other.chat_id_in_messenger = 2, 'chat:other'
+    answer = Dialog().reply(other)
+    direct = MessageDirector().create_ects(2, 'chat:other', expected.payload.text, [
+        dict(vars(callbacks.decode(button.action.payload)), title=button.text)
+        for button in expected.inline_buttons
+    ])
+    assert answer == direct
+    assert [b.action.payload for b in answer.inline_buttons] == [b.action.payload for b in direct.inline_buttons]
+
+    after = ScreenCache().stats()
+    assert (after['hits'] - before['hits'], after['misses'] - before['misses']) == (1, 1)
+    assert 0 < after['hit_ratio'] <= 1
+
+
+@pytest.mark.django_db
+def test_screen_cache_invalidated_by_catalog_change() -> None:
+    event = EventCommandReceived.Schema().loads(lines['desc_input'])
+    Dialog().reply(event)
+    invalidations = ScreenCache().stats()['invalidations']
+    Product.objects.filter(pk=21).update(name='Renamed product')
+    Product.objects.get(pk=21).save()
+    assert 'Renamed product' in Dialog().reply(event).payload.text
+    assert ScreenCache().stats()['invalidations'] == invalidations + 1
+
+
+def test_version_switch_clears_once() -> None:
+    cache = ScreenCache()
+    screen = build_screen('text')
+    builds: List[int] = []
+
+    def build() -> Screen:
+        builds.append(1)
+        return screen
+
+    invalidations = cache.stats()['invalidations']
+    threads = [threading.Thread(target=cache.get, args=('key', 2, build)) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert cache.stats()['invalidations'] == invalidations + 1
+
+    # запрос со старым снимком строит экран без кэша и не сбрасывает экраны новой версии
+    builds.clear()
+    assert cache.get('key', 1, build) is screen and len(builds) == 1
+    assert cache.get('key', 2, build) is screen and len(builds) == 1
+    assert cache.stats()['invalidations'] == invalidations + 1
@@ -0,0 +1,75 @@
+import json
+from typing import Any
+
+import pytest
+
+from bot.dialog import Dialog
+from common import callbacks
+from common.constants import CallbackType
+from common.entities import EventCommandReceived
+from shop.models import Product
+from shop.search import ProductSearch, match_expression
+
+
+with open('tests/dialog_content.json', 'r') as f:
+    lines = json.loads(f.readline())
+
+
+def free_text(text: str) -> EventCommandReceived:
+    event = EventCommandReceived.Schema().loads(lines['greet_input'])
+    event.payload.text = text
+    return event
+
+
+def test_match_expression() -> None:
+    assert match_expression('Видеокарта  GIGABYTE, 2GB!') == '"видеокарта"* "gigabyte"* "2gb"*'
+    assert match_expression('"; DROP --') == '"drop"*'
+    assert match_expression(' !? ') is None
+
+
+@pytest.mark.django_db
+def test_search_is_ranked_and_paged() -> None:
+    found = Product.objects.get_products_by_query('видеокарта gigabyte', 0, 100)
+    assert found and all('видеокарта' in p['name'].lower() and 'gigabyte' in p['name'].lower() for p in found)
+
+    described = Product.objects.create(name='Кабель питания', description='Подходит для видеокарта GIGABYTE')
+    ids = ProductSearch().search('видеокарта gigabyte', 0, 100)
+    # совпадение в наименовании весит больше, чем в описании
+    assert ids[-1] == described.pk and ids[:-1] == [p['id'] for p in found]
+    assert ProductSearch().search('видеокарта gigabyte', 0, 3) + ProductSearch().search('видеокарта gigabyte', 3, 3) \
+        == ids[:6]
+    # префиксы слов
+    assert ProductSearch().search('видео gigab', 0, 100) == ids
+
+
+@pytest.mark.django_db
+def test_index_follows_product_changes() -> None:
+    product = Product.objects.create(name='Термопаста Arctic MX-4', description='')
+    assert ProductSearch().search('термопаста', 0, 10) == [product.pk]
+    product.name = 'Термоинтерфейс Arctic MX-4'
+    product.save()
+    assert ProductSearch().search('термопаста', 0, 10) == []
+    assert ProductSearch().search('термоинтерфейс arctic', 0, 10) == [product.pk]
+    product.delete()
+    assert ProductSearch().search('arctic', 0, 10) == []
+
+
+@pytest.mark.django_db
+def test_substring_fallback(monkeypatch: Any) -> None:
+    monkeypatch.setattr(ProductSearch(), 'available', False)
+    fallbacks = ProductSearch().stats()['fallbacks']
+    found = Product.objects.get_products_by_query('GIGABYTE', 0, 100)
+    assert found and all('GIGABYTE' in p['name'] for p in found)
+    assert ProductSearch().stats()['fallbacks'] == fallbacks + 1
+
+
+@pytest.mark.django_db
+def test_dialog_answers_free_text_with_search() -> None:
+    result = Dialog().reply(free_text('видеокарта msi'))
+    assert 'видеокарта msi' in result.payload.text
+    products = [callbacks.decode(button.action.payload) for button in result.inline_buttons]
+    assert products and {callback.type for callback in products} == {CallbackType.PRODUCT}
+    assert [callback.id for callback in products] == ProductSearch().search('видеокарта msi')
+
+    greeting = Dialog().reply(free_text('2')).payload.text
+    assert Dialog().reply(free_text('ничегонеттакого')).payload.text == greeting
@@ -0,0 +1,35 @@
+"""Микробенчмарк разбора и кодирования команд инлайн-кнопок (Callback).
+
+Сравнивает прежний JSON через схему marshmallow, разбор JSON кодеком common.callbacks (кнопки старых сообщений)
+и компактный формат common.callbacks. Также выводит длину payload кнопки в каждом формате.
+usage: python -m util.bench_callbacks [<количество команд>]"""
+
+import sys
+import timeit
+
+from common import callbacks
+from common.constants import CallbackType
+from common.entities import Callback
+from common.schemas import get_schema
+
+
+def main(commands: int) -> None:
+    callback = Callback(CallbackType.PRODUCT, 123456)
+    legacy = get_schema(Callback).dumps(callback)
+    compact = callbacks.encode(callback)
+
+    cases = (
+        ('schema loads', lambda: get_schema(Callback).loads(legacy)),
+        ('decode legacy JSON', lambda: callbacks.decode(legacy)),
+        ('decode compact', lambda: callbacks.decode(compact)),
+        ('schema dumps', lambda: get_schema(Callback).dumps(callback)),
+        ('encode compact', lambda: callbacks.encode(callback)),
+    )
+    for name, case in cases:
+        elapsed = timeit.timeit(case, number=commands)
+        print(f'{name:>18}: {elapsed / commands * 1e6:7.2f} us/command ({commands} commands)')
+    print(f'payload length: JSON {len(legacy)}, compact {len(compact)} (limit {callbacks.PAYLOAD_LIMIT})')
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
@@ -0,0 +1,46 @@
+"""Микробенчмарк накладных расходов на схемы marshmallow при обработке одного сообщения.
+
+Повторяет сериализацию, выполняемую для одного ответа бота: разбор Callback из команды,
+дамп Callback для каждой из 10 кнопок, проверку ECTS в хендлере и дамп исходящего сообщения OK.
+Сравнивает создание схемы на каждый вызов (Entity.Schema()) и общие экземпляры из common.schemas.
+usage: python -m util.bench_schemas [<количество сообщений>]"""
+
+import sys
+import timeit
+from typing import Any, Callable, Dict, List, Type
+
+from common.builders import MessageDirector
+from common.constants import CallbackType
+from common.entities import Callback, EventCommandToSend
+from common.schemas import get_schema
+
+
+BUTTONS = 10
+
+
+def per_call(entity: Type[Any]) -> Any:
+    return entity.Schema()
+
+
+def message_flow(schema: Callable[[Type[Any]], Any], ects: EventCommandToSend, ok_message: Any) -> None:
+    callback = schema(Callback).loads('{"type": "category", "id": 5}')
+    for i in range(BUTTONS):
+        schema(Callback).dumps({'type': CallbackType.PRODUCT, 'id': callback.id + i})
+    schema(EventCommandToSend).validate(schema(EventCommandToSend).dump(ects))
+    schema(type(ok_message)).dumps(ok_message)
+
+
+def main(messages: int) -> None:
+    button_data: List[Dict[str, Any]] = [
+        {'title': f'Product {i}', 'id': i, 'type': CallbackType.PRODUCT} for i in range(BUTTONS)
+    ]
+    ects = MessageDirector().create_ects(1, 'chat:C000000000001', 'Choose product', button_data)
+    ok_message = MessageDirector().create_ok_message(ects)
+
+    for name, schema in (('Schema() per call', per_call), ('schema registry', get_schema)):
+        elapsed = timeit.timeit(lambda: message_flow(schema, ects, ok_message), number=messages)
+        print(f'{name:>18}: {elapsed / messages * 1e6:9.1f} us/message ({messages} messages)')
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000)
@@ -0,0 +1,86 @@
+"""Бенчмарк поиска товаров: индекс FTS5 (shop.search) против поиска подстроки icontains.
+
+Во временной базе создаётся заданное количество товаров со случайными наименованиями и описаниями
+из словаря комплектующих, строится индекс, затем одни и те же запросы выполняются обоими способами.
+icontains - прежний ProductManager.get_products_by_query: все найденные товары без ранжирования и страниц;
+FTS5 - страница из CATALOG_PAGE_SIZE товаров по релевантности. Рабочая база не затрагивается.
+usage: python -m util.bench_search [<количество товаров>] [<количество запросов>]"""
+
+import os
+import random
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Dict, List, Tuple
+
+
+BRANDS = ('ASUS', 'GIGABYTE', 'MSI', 'Palit', 'Sapphire', 'ASRock', 'Kingston', 'Samsung', 'Crucial', 'Corsair',
+          'Seagate', 'Toshiba', 'Zalman', 'Deepcool', 'Noctua', 'AMD', 'Intel', 'be quiet!', 'Thermaltake', 'Chieftec')
+KINDS = ('Видеокарта', 'Процессор', 'Материнская плата', 'Оперативная память', 'Жёсткий диск', 'SSD накопитель',
+         'Блок питания', 'Корпус', 'Кулер', 'Вентилятор')
+WORDS = ('игровой', 'тихий', 'компактный', 'быстрый', 'надёжный', 'подсветка', 'RGB', 'разгон', 'гарантия',
+         'охлаждение', 'память', 'порт', 'слот', 'формат', 'мощность', 'частота', 'кэш', 'ядро', 'поток', 'шина')
+QUERIES = ('видеокарта', 'gigabyte', 'видеокарта msi', 'блок питания', 'процессор intel', 'ssd samsung',
+           'тихий кулер', 'rgb корпус', 'материнская asrock', 'память kingston', 'разгон', 'подсв')
+
+
+def product_rows(count: int, rng: random.Random) -> List[Dict[str, Any]]:
+    rows = []
+    for i in range(count):
+        name = f'{rng.choice(KINDS)} {rng.choice(BRANDS)} {rng.choice("ABCDEFGHKMRTX")}{rng.randrange(100, 9999)}'
+        description = ' '.join(rng.choice(WORDS) for _ in range(rng.randrange(10, 40)))
+        rows.append({'name': name, 'description': description, 'sort_order': i % 10})
+    return rows
+
+
+def measure(case: Callable[[str], int], queries: List[str]) -> Tuple[float, float]:
+    """Возвращает среднее время запроса в мс и среднее количество найденных товаров."""
+
+    found = 0
+    started = time.perf_counter()
+    for query in queries:
+        found += case(query)
+    return (time.perf_counter() - started) * 1000 / len(queries), found / len(queries)
+
+
+def main(products: int, queries: int) -> None:
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ecom_chatbot.settings')
+    import django
+    django.setup()
+
+    from django.conf import settings
+    from django.test.utils import setup_databases, teardown_databases
+    from shop.models import Product
+    from shop.search import ProductSearch
+
+    settings.DEBUG = False
+    settings.DATABASES['default']['TEST']['NAME'] = os.path.join(tempfile.mkdtemp(prefix='bench-search-'), 'db.sqlite3')
+    old_config = setup_databases(verbosity=0, interactive=False)
+    try:
+        rng = random.Random(0)
+        started = time.perf_counter()
+        Product.objects.bulk_create((Product(**row) for row in product_rows(products, rng)), batch_size=1000)
+        print(f'{products} products inserted in {time.perf_counter() - started:.1f} s')
+        started = time.perf_counter()
+        ProductSearch().rebuild()
+        print(f'full-text index built in {time.perf_counter() - started:.1f} s')
+
+        sample = [rng.choice(QUERIES) for _ in range(queries)]
+        icontains = measure(lambda query: len(Product.objects.filter(name__icontains=query).values(
+            'id', 'name', 'price', 'image_url', 'description', 'is_active')), sample)
+        icontains_page = measure(lambda query: len(Product.objects.filter(name__icontains=query).order_by(
+            'sort_order', 'name', 'id').values('id', 'name')[:8]), sample)
+        fts = measure(lambda query: len(Product.objects.get_products_by_query(query)), sample)
+        # LIKE в SQLite не учитывает регистр только для ASCII: icontains не находит 'видеокарта' в 'Видеокарта'
+        for name, (elapsed, found) in (('icontains, all rows', icontains), ('icontains, first page', icontains_page),
+                                       ('FTS5, ranked page', fts)):
+            print(f'{name:>24}: {elapsed:8.2f} ms/query, {found:8.1f} products/query ({queries} queries)')
+        for query in QUERIES[:4]:
+            names = [product['name'] for product in Product.objects.get_products_by_query(query, 0, 3)]
+            print(f'  {query!r}: {names}')
+    finally:
+        teardown_databases(old_config, verbosity=0)
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000, int(sys.argv[2]) if len(sys.argv) > 2 else 50)
@@ -0,0 +1,479 @@
+"""Нагрузочный тест обработки вебхуков от приёма до отправки ответа.
+
+Виртуальные пользователи OK и JivoSite проходят диалог приветствие -> категория -> товар -> заказ -> оплата:
+каждый отправляет вебхук в WSGI-приложение (ecom_chatbot.wsgi) в процессе теста, ждёт ответа бота
+и нажимает одну из его кнопок. API платформ (отправка сообщений) и платёжных систем PayPal и Stripe
+заменяются локальными HTTP-серверами-заглушками, адреса которых передаются приложению переменными
+OK_API_URL, JIVO_API_URL, PAYPAL_API_URL и STRIPE_API_URL. Тест работает с временной базой данных
+(схема по миграциям проекта и данные из фикстуры), рабочая база не затрагивается.
+
+Отчёт: задержка обработки вебхука и задержка ответа (от вебхука до запроса к заглушке платформы)
+p50/p95/p99, вебхуков в секунду, запросов к базе на вебхук (по профилям bot.querylog, с разбивкой по этапам)
+и запросов к заглушкам в секунду. Режимы приложения задаются его обычными переменными окружения
+(WEBHOOK_ASYNC, MESSAGE_WRITE_BEHIND и др.); ограничение частоты отправки по умолчанию отключено.
+
+usage: python -m util.loadtest [--conversations N] [--concurrency N] [--platforms ok,jivo] [--stub-latency MS]
+                               [--reply-timeout S] [--fixture PATH] [--seed N] [--json]"""
+
+import argparse
+import json
+import os
+import queue
+import random
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+
+# адрес из пула OK (OkIpPool): вью вебхука OK проверяет X-Forwarded-For
+OK_SENDER_IP = '217.20.145.193'
+FIRST_MESSAGE = 'Привет'
+MAX_STEPS = 10
+
+# кнопка: текст и команда (у Jivo команда не передаётся, кнопка нажимается текстом)
+Button = Tuple[str, Optional[str]]
+# маршрут заглушки: (путь, тело запроса) -> (код ответа, тело ответа)
+Route = Callable[[str, Dict[str, Any]], Tuple[int, Dict[str, Any]]]
+
+
+def percentile(values: List[float], share: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * share))] if ordered else 0.0
+
+
+@dataclass
+class Reply:
+    """Сообщение бота, полученное заглушкой платформы."""
+
+    text: Optional[str]
+    buttons: List[Button]
+    received_at: float = field(default_factory=time.monotonic)
+
+
+class Inbox:
+    """Ответы бота по чатам: заглушки платформ кладут, виртуальные пользователи ждут."""
+
+    def __init__(self) -> None:
+        self._chats: Dict[str, 'queue.Queue[Reply]'] = {}
+        self._lock = threading.Lock()
+
+    def _queue(self, chat_id: str) -> 'queue.Queue[Reply]':
+        with self._lock:
+            return self._chats.setdefault(chat_id, queue.Queue())
+
+    def put(self, chat_id: str, reply: Reply) -> None:
+        self._queue(chat_id).put(reply)
+
+    def get(self, chat_id: str, timeout: float) -> Optional[Reply]:
+        try:
+            return self._queue(chat_id).get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class StubServer:
+    """Локальная замена внешнего API: HTTP-сервер в фоновом потоке, отвечающий на POST по префиксам путей."""
+
+    def __init__(self, name: str, routes: Dict[str, Route], latency: float = 0.0) -> None:
+        self.name = name
+        self.routes = routes
+        self.latency = latency
+        self.requests: List[float] = []
+        self.errors = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), self._handler())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, name=f'stub-{name}', daemon=True)
+
+    @property
+    def url(self) -> str:
+        return f'http://127.0.0.1:{self._server.server_port}'
+
+    def start(self) -> 'StubServer':
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def handle(self, path: str, body: Dict[str, Any]) -> Tuple[int, Dict[str, Any]]:
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            self.requests.append(time.monotonic())
+        for prefix, route in self.routes.items():
+            if path.startswith(prefix):
+                return route(path, body)
+        with self._lock:
+            self.errors += 1
+        return 404, {'error': {'code': '404 Not Found', 'message': path}}
+
+    def _handler(self) -> type:
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_POST(self) -> None:
+                raw = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+                try:
+                    body = json.loads(raw) if raw[:1] in (b'{', b'[') else {}
+                except ValueError:
+                    body = {}
+                status, answer = stub.handle(urlsplit(self.path).path, body)
+                data = json.dumps(answer).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args: Any) -> None:
+                pass
+
+        return Handler
+
+    def stats(self, duration: float) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'requests': len(self.requests),
+                'per_sec': round(len(self.requests) / duration, 2) if duration else 0.0,
+                'errors': self.errors,
+            }
+
+
+def make_stubs(inbox: Inbox, latency: float) -> Dict[str, StubServer]:
+    """Заглушки API отправки сообщений OK и Jivo, создания заказов PayPal и сессий оплаты Stripe."""
+
+    def ok_message(path: str, body: Dict[str, Any]) -> Tuple[int, Dict[str, Any]]:
+        message = body.get('message') or {}
+        keyboard = ((message.get('attachment') or {}).get('payload') or {}).get('keyboard') or {}
+        buttons = [(button['text'], button.get('payload')) for row in keyboard.get('buttons', []) for button in row]
+        inbox.put(path.rsplit('/', 1)[-1], Reply(message.get('text'), buttons))
+        return 200, {'success': True}
+
+    def jivo_message(path: str, body: Dict[str, Any]) -> Tuple[int, Dict[str, Any]]:
+        from common.strings import JivoStrings
+        message = body.get('message')
+        if body.get('event') == 'BOT_MESSAGE' and message:
+            buttons: List[Button] = [
+                (button['text'], None) for button in message.get('buttons') or []
+                if button['text'] != JivoStrings.INVITE_OPERATOR.value
+            ]
+            inbox.put(body['client_id'], Reply(message.get('text'), buttons))
+        return 200, {}
+
+    def paypal_token(path: str, body: Dict[str, Any]) -> Tuple[int, Dict[str, Any]]:
+        return 200, {'access_token': 'loadtest', 'token_type': 'Bearer', 'expires_in': 32400}
+
+    def paypal_order(path: str, body: Dict[str, Any]) -> Tuple[int, Dict[str, Any]]:
+        return 201, {'id': f'LT{uuid.uuid4().hex[:15].upper()}', 'status': 'CREATED', 'links': []}
+
+    def stripe_session(path: str, body: Dict[str, Any]) -> Tuple[int, Dict[str, Any]]:
+        return 200, {'id': f'cs_test_{uuid.uuid4().hex}', 'object': 'checkout.session'}
+
+    return {
+        'ok': StubServer('ok', {'/graph/me/messages/': ok_message}, latency).start(),
+        'jivo': StubServer('jivo', {'/webhooks/': jivo_message}, latency).start(),
+        'paypal': StubServer('paypal', {'/v1/oauth2/token': paypal_token, '/v2/checkout/orders': paypal_order},
+                             latency).start(),
+        'stripe': StubServer('stripe', {'/v1/checkout/sessions': stripe_session}, latency).start(),
+    }
+
+
+class Conversation:
+    """Виртуальный пользователь платформы: формирует вебхуки и выбирает кнопки ответов."""
+
+    platform = ''
+    path = ''
+
+    def __init__(self, number: int) -> None:
+        self.chat_id = f'chat:LT{number:08d}'
+        self.user_id = f'user:LT{number:08d}'
+
+    def first_message(self) -> Dict[str, Any]:
+        raise NotImplementedError
+
+    def press(self, button: Button) -> Dict[str, Any]:
+        raise NotImplementedError
+
+
+class OkConversation(Conversation):
+    platform = 'ok'
+    path = '/ok_webhook/'
+
+    def _webhook(self, webhook_type: str, **fields: Any) -> Dict[str, Any]:
+        mid = f'mid:{uuid.uuid4().hex}'
+        webhook = {
+            'webhookType': webhook_type,
+            'sender': {'user_id': self.user_id, 'name': 'Load Test'},
+            'recipient': {'chat_id': self.chat_id},
+            'timestamp': int(time.time() * 1000),
+            'mid': mid,
+            'callbackId': None,
+            'message': {'text': None, 'mid': mid},
+        }
+        webhook.update(fields)
+        return webhook
+
+    def first_message(self) -> Dict[str, Any]:
+        webhook = self._webhook('MESSAGE_CREATED')
+        webhook['message']['text'] = FIRST_MESSAGE
+        return webhook
+
+    def press(self, button: Button) -> Dict[str, Any]:
+        return self._webhook('MESSAGE_CALLBACK', callbackId=uuid.uuid4().hex, payload=button[1])
+
+
+class JivoConversation(Conversation):
+    platform = 'jivo'
+    path = '/jivo_webhook/test'
+
+    def _webhook(self, text: str) -> Dict[str, Any]:
+        return {
+            'id': uuid.uuid4().hex,
+            'client_id': self.chat_id,
+            'chat_id': self.user_id,
+            'site_id': None,
+            'sender': None,
+            'message': {'type': 'TEXT', 'text': text, 'timestamp': int(time.time())},
+            'event': 'CLIENT_MESSAGE',
+        }
+
+    def first_message(self) -> Dict[str, Any]:
+        return self._webhook(FIRST_MESSAGE)
+
+    def press(self, button: Button) -> Dict[str, Any]:
+        return self._webhook(button[0])
+
+
+CONVERSATIONS = {'ok': OkConversation, 'jivo': JivoConversation}
+
+
+class LoadTest:
+    """Прогон виртуальных пользователей и сбор измерений."""
+
+    def __init__(self, application: Callable[..., Iterable[bytes]], inbox: Inbox, reply_timeout: float,
+                 seed: int) -> None:
+        self.application = application
+        self.inbox = inbox
+        self.reply_timeout = reply_timeout
+        self.seed = seed
+        self._lock = threading.Lock()
+        self.webhook_latencies: List[float] = []
+        self.reply_latencies: List[float] = []
+        self.http_errors = 0
+        self.outcomes: Dict[str, int] = {'completed': 0, 'timeout': 0, 'too_long': 0}
+
+    def post(self, path: str, webhook: Dict[str, Any]) -> None:
+        """Передаёт вебхук WSGI-приложению так же, как это сделал бы веб-сервер."""
+
+        data = json.dumps(webhook).encode()
+        environ = {
+            'REQUEST_METHOD': 'POST',
+            'PATH_INFO': path,
+            'QUERY_STRING': '',
+            'CONTENT_TYPE': 'application/json',
+            'CONTENT_LENGTH': str(len(data)),
+            'SERVER_NAME': 'localhost',
+            'SERVER_PORT': '80',
+            'SERVER_PROTOCOL': 'HTTP/1.1',
+            'HTTP_HOST': 'localhost',
+            'HTTP_X_FORWARDED_FOR': OK_SENDER_IP,
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': 'http',
+            'wsgi.input': BytesIO(data),
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': False,
+            'wsgi.run_once': False,
+        }
+        statuses: List[str] = []
+        started = time.monotonic()
+        result = self.application(environ, lambda status, headers, exc_info=None: statuses.append(status))
+        try:
+            for _ in result:
+                pass
+        finally:
+            close = getattr(result, 'close', None)
+            if close is not None:
+                close()
+        with self._lock:
+            self.webhook_latencies.append(time.monotonic() - started)
+            if not statuses or not statuses[0].startswith('200'):
+                self.http_errors += 1
+
+    def converse(self, conversation: Conversation) -> str:
+        """Проходит диалог до ответа без кнопок (ссылка на оплату). Возвращает исход диалога."""
+
+        rng = random.Random(f'{self.seed}:{conversation.chat_id}')
+        webhook = conversation.first_message()
+        for _ in range(MAX_STEPS):
+            sent_at = time.monotonic()
+            self.post(conversation.path, webhook)
+            reply = self.inbox.get(conversation.chat_id, self.reply_timeout)
+            if reply is None:
+                return 'timeout'
+            with self._lock:
+                self.reply_latencies.append(reply.received_at - sent_at)
+            if not reply.buttons:
+                return 'completed'
+            webhook = conversation.press(rng.choice(reply.buttons))
+        return 'too_long'
+
+    def run(self, conversations: List[Conversation], concurrency: int) -> float:
+        """Прогоняет диалоги в concurrency потоков. Возвращает длительность прогона в секундах."""
+
+        def job(conversation: Conversation) -> None:
+            outcome = self.converse(conversation)
+            with self._lock:
+                self.outcomes[outcome] += 1
+
+        started = time.monotonic()
+        with ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix='loadtest') as executor:
+            list(executor.map(job, conversations))
+        return time.monotonic() - started
+
+
+def configure(stubs: Dict[str, StubServer]) -> None:
+    """Направляет внешние запросы приложения на заглушки. Вызывается до загрузки настроек Django."""
+
+    os.environ['OK_API_URL'] = stubs['ok'].url
+    os.environ['JIVO_API_URL'] = stubs['jivo'].url
+    os.environ['PAYPAL_API_URL'] = stubs['paypal'].url
+    os.environ['STRIPE_API_URL'] = stubs['stripe'].url
+    for name, value in (('PAYPAL_CLIENT_ID', 'loadtest'), ('PAYPAL_CLIENT_SECRET', 'loadtest'),
+                        ('STRIPE_SECRET_KEY', 'sk_test_loadtest'), ('SITE_HTTPS_URL', 'https://loadtest.invalid'),
+                        ('RATE_LIMIT_ENABLED', '0'),
+                        ('QUERY_PROFILE', '1'), ('QUERY_LOG_SIZE', '1000000')):
+        os.environ.setdefault(name, value)
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ecom_chatbot.settings')
+
+
+def query_report(webhooks: int) -> Dict[str, Any]:
+    from bot.querylog import QueryLog
+
+    profiles = QueryLog().recent()
+    stages: Dict[str, int] = {}
+    for profile in profiles:
+        for name, stats in profile.stages.items():
+            stages[name] = stages.get(name, 0) + stats.queries
+    total = sum(profile.queries for profile in profiles)
+    return {
+        'profiles': len(profiles),
+        'total': total,
+        'per_webhook': round(total / webhooks, 2) if webhooks else 0.0,
+        'per_webhook_by_stage': {name: round(count / webhooks, 2) for name, count in sorted(stages.items())}
+        if webhooks else {},
+        'sql_ms_per_webhook': round(sum(profile.sql_time for profile in profiles) * 1000 / webhooks, 3)
+        if webhooks else 0.0,
+    }
+
+
+def main(args: argparse.Namespace) -> Dict[str, Any]:
+    inbox = Inbox()
+    stubs = make_stubs(inbox, args.stub_latency / 1000)
+    configure(stubs)
+    database = os.path.join(tempfile.mkdtemp(prefix='loadtest-'), 'loadtest.sqlite3')
+
+    from django.conf import settings
+    from ecom_chatbot.wsgi import application
+    from django.core.management import call_command
+    from django.test.utils import setup_databases, teardown_databases
+    from bot.outbox import SingletonOutbox
+    from bot.persistence import SingletonWriteBuffer
+    from bot.pipeline import SingletonPipeline
+    from bot.querylog import QueryLog
+    from clients.delivery import SingletonDelivery
+
+    # в боевом режиме: без журнала запросов DEBUG и отладочного лога
+    settings.DEBUG = False
+    settings.DATABASES['default']['TEST']['NAME'] = database
+    old_config = setup_databases(verbosity=0, interactive=False)
+    try:
+        call_command('loaddata', args.fixture, verbosity=0)
+        QueryLog().clear()
+        platforms = [CONVERSATIONS[name] for name in args.platforms.split(',')]
+        conversations = [platforms[i % len(platforms)](i) for i in range(args.conversations)]
+        test = LoadTest(application, inbox, args.reply_timeout, args.seed)
+        duration = test.run(conversations, args.concurrency)
+
+        webhooks = len(test.webhook_latencies)
+        sends = sum(len(stubs[name].requests) for name in ('ok', 'jivo'))
+        report = {
+            'conversations': len(conversations),
+            'concurrency': args.concurrency,
+            'duration_sec': round(duration, 3),
+            'outcomes': test.outcomes,
+            'webhooks': webhooks,
+            'webhooks_per_sec': round(webhooks / duration, 2) if duration else 0.0,
+            'http_errors': test.http_errors,
+            'webhook_latency_ms': {
+                name: round(percentile(test.webhook_latencies, share) * 1000, 2)
+                for name, share in (('p50', 0.5), ('p95', 0.95), ('p99', 0.99))
+            },
+            'reply_latency_ms': {
+                name: round(percentile(test.reply_latencies, share) * 1000, 2)
+                for name, share in (('p50', 0.5), ('p95', 0.95), ('p99', 0.99))
+            },
+            'db_queries': query_report(webhooks),
+            'sends_per_sec': round(sends / duration, 2) if duration else 0.0,
+            'stubs': {name: stub.stats(duration) for name, stub in stubs.items()},
+        }
+    finally:
+        # фоновые потоки приложения не должны пережить временную базу
+        for worker in (SingletonPipeline()._pipeline, SingletonOutbox()._relay, SingletonDelivery()._engine):
+            if worker is not None:
+                worker.stop(timeout=args.reply_timeout)
+        buffer = SingletonWriteBuffer()._buffer
+        if buffer is not None:
+            buffer.flush()
+        teardown_databases(old_config, verbosity=0)
+        for stub in stubs.values():
+            stub.stop()
+    return report
+
+
+def print_report(report: Dict[str, Any]) -> None:
+    print(f'{report["conversations"]} conversations, concurrency {report["concurrency"]}, '
+          f'{report["duration_sec"]} s: {report["outcomes"]}')
+    print(f'webhooks: {report["webhooks"]} ({report["webhooks_per_sec"]}/s), HTTP errors: {report["http_errors"]}')
+    print(f'webhook latency ms: {report["webhook_latency_ms"]}')
+    print(f'reply latency ms:   {report["reply_latency_ms"]}')
+    queries = report['db_queries']
+    print(f'DB queries per webhook: {queries["per_webhook"]} ({queries["sql_ms_per_webhook"]} ms SQL), '
+          f'by stage: {queries["per_webhook_by_stage"]}')
+    print(f'platform sends: {report["sends_per_sec"]}/s')
+    for name, stats in report['stubs'].items():
+        print(f'  {name:>6}: {stats}')
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Webhook load test with local platform stand-ins.')
+    parser.add_argument('--conversations', type=int, default=100, help='number of virtual users')
+    parser.add_argument('--concurrency', type=int, default=8, help='users talking at the same time')
+    parser.add_argument('--platforms', default='ok,jivo', help='comma separated: ok, jivo')
+    parser.add_argument('--stub-latency', type=float, default=0.0, help='stub response delay, ms')
+    parser.add_argument('--reply-timeout', type=float, default=10.0, help='seconds to wait for a bot reply')
+    parser.add_argument('--fixture', default='tests/test_data.json', help='catalog and bots to load')
+    parser.add_argument('--seed', type=int, default=0, help='seed for button choices')
+    parser.add_argument('--json', action='store_true', help='print the report as JSON')
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    arguments = parse_args()
+    result = main(arguments)
+    if arguments.json:
+        print(json.dumps(result, indent=2))
+    else:
+        print_report(result)